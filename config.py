@@ -2,7 +2,6 @@
 Configuration settings for the price tracking newsletter application.
 """
 import os
-import logging
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -19,19 +18,99 @@ SENDER_PASSWORD = os.getenv("SENDER_PASSWORD")
 RECIPIENT_EMAIL = os.getenv("RECIPIENT_EMAIL")
 SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com") # Default to Gmail
 SMTP_PORT = int(os.getenv("SMTP_PORT", 587)) # Default to Gmail TLS port
+SMTP_MESSAGES_PER_MINUTE = float(os.getenv("SMTP_MESSAGES_PER_MINUTE", 30)) # Pace of digests sent over one connection
+RECIPIENTS_FILE = os.getenv("RECIPIENTS_FILE") # JSON list of recipients with their own Notion database/filter; overrides RECIPIENT_EMAIL
+
+# Product images: checked over plain HTTP and embedded in the email as small inline thumbnails
+EMAIL_INLINE_THUMBNAILS = os.getenv("EMAIL_INLINE_THUMBNAILS", "true").lower() == "true"
+THUMBNAIL_SIZE_PX = int(os.getenv("THUMBNAIL_SIZE_PX", 200)) # Twice the 100px the template shows, for high-DPI screens
+THUMBNAIL_RECHECK_HOURS = float(os.getenv("THUMBNAIL_RECHECK_HOURS", 24))
+IMAGE_FETCH_CONCURRENCY = int(os.getenv("IMAGE_FETCH_CONCURRENCY", 8))
 
 # Application settings
-MAX_CONCURRENT_REQUESTS =1
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache") # Local state kept between runs (recipes, snapshots, ...)
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", 3))
+PER_DOMAIN_CONCURRENCY = int(os.getenv("PER_DOMAIN_CONCURRENCY", 1))
+PER_DOMAIN_REQUESTS_PER_MINUTE = float(os.getenv("PER_DOMAIN_REQUESTS_PER_MINUTE", 12))
+ITEM_TIMEOUT_SECONDS = float(os.getenv("ITEM_TIMEOUT_SECONDS", 300))
 NOTION_URL_PROPERTY_NAME = "Urls"
 NOTION_API_VERSION = "2022-06-28"
+NOTION_API_BASE_URL = os.getenv("NOTION_API_BASE_URL", "https://api.notion.com")
+NOTION_REQUESTS_PER_SECOND = float(os.getenv("NOTION_REQUESTS_PER_SECOND", 3))
+NOTION_MAX_RETRIES = 5
+NOTION_INCREMENTAL_SYNC = os.getenv("NOTION_INCREMENTAL_SYNC", "true").lower() == "true"
+NOTION_SNAPSHOT_PATH = os.path.join(CACHE_DIR, "notion_snapshot.sqlite3")
+NOTION_FULL_SYNC_INTERVAL_HOURS = float(os.getenv("NOTION_FULL_SYNC_INTERVAL_HOURS", 24 * 7))
 PREFERRED_SHOE_SIZE = "UK 9"
 PREFERRED_TOP_SIZE = "S"
 PREFERRED_BOTTOM_SIZE = "30"
 LOWEST_PRICE_PROPERTY_NAME = "Lowest Price"
 LOWEST_PRICE_DATE_PROPERTY_NAME = "Lowest Price Date"
+PRICE_HISTORY_PATH = os.path.join(CACHE_DIR, "price_history.sqlite3")
+PRICE_HISTORY_LOOKBACK_DAYS = 365 # Window for trend stats and "lowest in N days"
+RUN_JOURNAL_DIR = os.path.join(CACHE_DIR, "runs")
+RUN_JOURNAL_RETENTION_DAYS = 14
+THUMBNAIL_CACHE_DIR = os.path.join(CACHE_DIR, "thumbnails")
+SHARD_RESULTS_DIR = os.getenv("SHARD_RESULTS_DIR", os.path.join(CACHE_DIR, "shards")) # Where sharded workers leave results for the merge step
+
+# Structured data (JSON-LD / OpenGraph / microdata) fast path before launching the Agent
+STRUCTURED_DATA_FAST_PATH = os.getenv("STRUCTURED_DATA_FAST_PATH", "true").lower() == "true"
+HTTP_TIMEOUT_SECONDS = 15
+HTTP_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+# Skip pages unchanged since the last scrape (conditional GET + content fingerprint)
+PRECHECK_UNCHANGED_PAGES = os.getenv("PRECHECK_UNCHANGED_PAGES", "true").lower() == "true"
+PAGE_STATE_PATH = os.path.join(CACHE_DIR, "page_state.sqlite3")
+PRECHECK_MAX_AGE_HOURS = float(os.getenv("PRECHECK_MAX_AGE_HOURS", 24 * 7)) # Never reuse results older than this
+
+# Adaptive check frequency: only scrape items that are due, based on how often their price changes
+ADAPTIVE_CHECKS = os.getenv("ADAPTIVE_CHECKS", "true").lower() == "true"
+CHECK_SCHEDULE_PATH = os.path.join(CACHE_DIR, "check_schedule.sqlite3")
+CHECK_MIN_INTERVAL_HOURS = float(os.getenv("CHECK_MIN_INTERVAL_HOURS", 0)) # 0: volatile items are checked on every run
+CHECK_MAX_INTERVAL_HOURS = float(os.getenv("CHECK_MAX_INTERVAL_HOURS", 24 * 14))
+CHECK_NEAR_DEAL_RATIO = float(os.getenv("CHECK_NEAR_DEAL_RATIO", 0.05)) # Items within 5% of their lowest price get the minimum interval
+CHECK_BUDGET_ITEMS = int(os.getenv("CHECK_BUDGET_ITEMS", 0)) # Most items scraped per run, 0 for no limit
+CHECK_BUDGET_TOKENS = int(os.getenv("CHECK_BUDGET_TOKENS", 0)) # Most (estimated) LLM tokens spent per run, 0 for no limit
+
+# Group Notion rows that point at the same product (tracking parameters, mobile hosts, short links) and scrape it once
+CANONICALIZE_URLS = os.getenv("CANONICALIZE_URLS", "true").lower() == "true"
+
+# Failure handling: retries with bounded backoff, and per-domain circuit breakers for browser sessions
+HTTP_FETCH_ATTEMPTS = int(os.getenv("HTTP_FETCH_ATTEMPTS", 3)) # Plain HTTP fetches of a page, retried on timeouts, connection errors and 5xx
+BROWSER_SCRAPE_ATTEMPTS = int(os.getenv("BROWSER_SCRAPE_ATTEMPTS", 2)) # Browser scrapes of a page, retried only on LLM errors
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", 2))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", 30))
+CIRCUIT_BREAKER_ENABLED = os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+CIRCUIT_BREAKER_PATH = os.path.join(CACHE_DIR, "circuit_breakers.sqlite3")
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", 3)) # Failed browser scrapes in a row, across runs
+CIRCUIT_BREAKER_COOLDOWN_HOURS = float(os.getenv("CIRCUIT_BREAKER_COOLDOWN_HOURS", 12)) # Doubles every time the breaker opens again
+CIRCUIT_BREAKER_MAX_COOLDOWN_HOURS = float(os.getenv("CIRCUIT_BREAKER_MAX_COOLDOWN_HOURS", 24 * 7))
+
+# Content-addressed cache of browser/Agent extraction results
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_PATH = os.path.join(CACHE_DIR, "llm_cache.sqlite3")
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", 72))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 5000))
+
+# Learned per-domain extraction recipes, replayed with plain Playwright before falling back to the Agent
+USE_EXTRACTION_RECIPES = os.getenv("USE_EXTRACTION_RECIPES", "true").lower() == "true"
+RECIPE_STORE_PATH = os.path.join(CACHE_DIR, "recipes.json")
+BROWSER_NAVIGATION_TIMEOUT_MS = 30000
+
+# Agent prompt size: hide everything but the product region before the first LLM call, and skip
+# screenshots, the thinking/evaluation fields and the post-run judge call
+AGENT_DOM_PRUNING = os.getenv("AGENT_DOM_PRUNING", "true").lower() == "true"
+AGENT_USE_VISION = os.getenv("AGENT_USE_VISION", "false").lower() == "true"
+AGENT_FLASH_MODE = os.getenv("AGENT_FLASH_MODE", "true").lower() == "true"
+AGENT_MAX_ELEMENTS_LENGTH = int(os.getenv("AGENT_MAX_ELEMENTS_LENGTH", 12000)) # Characters of the DOM snapshot sent per step
+
+# Shared pool of warm browsers used by recipe replays and Agent runs
+BROWSER_POOL_SIZE = int(os.getenv("BROWSER_POOL_SIZE", 2))
+BROWSER_RECYCLE_AFTER = int(os.getenv("BROWSER_RECYCLE_AFTER", 25))
+BROWSER_POOL_MAX_RSS_MB = float(os.getenv("BROWSER_POOL_MAX_RSS_MB", 1500))
 
-# Configure logging
-logging.basicConfig(
-    level=logging.WARNING,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Run report: per-phase and per-item timings, Agent steps and LLM token usage
+RUN_REPORT_PATH = os.getenv("RUN_REPORT_PATH", os.path.join(CACHE_DIR, "run_report.json"))
+RUN_METRICS_PROM_PATH = os.getenv("RUN_METRICS_PROM_PATH", os.path.join(CACHE_DIR, "price_tracker.prom")) # For node_exporter's textfile collector
+LLM_INPUT_COST_PER_MILLION_TOKENS = float(os.getenv("LLM_INPUT_COST_PER_MILLION_TOKENS", 0.10))
+LLM_OUTPUT_COST_PER_MILLION_TOKENS = float(os.getenv("LLM_OUTPUT_COST_PER_MILLION_TOKENS", 0.40))
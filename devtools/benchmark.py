@@ -0,0 +1,285 @@
+"""
+Offline benchmark of the full workflow.
+
+Runs main.run_workflow against local fixtures only: product pages from
+devtools.fixture_retailer, the fake Notion API from devtools.fake_notion_server, a stub LLM
+(devtools.stub_llm) in place of Gemini and an in-memory SMTP server. Every combination of item
+count and concurrency runs in a fresh process with its own cache directory, optionally for
+several passes so warm-cache runs (unchanged pages, learned recipes, Notion snapshot) can be
+compared with cold ones.
+
+    python -m devtools.benchmark --items 20 100 --concurrency 1 3 6 --passes 2 --output bench.json
+
+Reports items/sec, p50/p95 per-item latency, peak RSS (this process plus its browsers),
+browser launches, LLM calls and how many items were scraped correctly.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date
+from typing import List, Dict, Any
+
+RESULT_PREFIX = "BENCHMARK_RESULT "
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class FakeSMTP:
+    """In-memory replacement for smtplib.SMTP that records every message instead of sending it."""
+
+    sent: List[Dict[str, Any]] = []
+
+    def __init__(self, host: str = "", port: int = 0, *args, **kwargs):
+        self.host = host
+        self.port = port
+
+    def __enter__(self) -> "FakeSMTP":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+    def starttls(self, *args, **kwargs):
+        pass
+
+    def login(self, user: str, password: str):
+        pass
+
+    def sendmail(self, from_addr: str, to_addrs, msg: str):
+        FakeSMTP.sent.append({'from': from_addr, 'to': to_addrs, 'bytes': len(msg)})
+        return {}
+
+    def send_message(self, msg, *args, **kwargs):
+        return self.sendmail(msg["From"], msg["To"], msg.as_string())
+
+    def quit(self):
+        pass
+
+
+class RssSampler:
+    """Samples the resident memory of this process plus all its descendants on a background thread."""
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self) -> float:
+        from services.browser_pool import descendant_rss_mb
+
+        try:
+            with open("/proc/self/statm") as f:
+                own_mb = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+        except OSError:
+            return 0.0
+        return own_mb + (descendant_rss_mb() or 0.0)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak_mb = max(self.peak_mb, self._sample())
+
+    def __enter__(self) -> "RssSampler":
+        self.peak_mb = self._sample()
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    import numpy as np
+
+    return round(float(np.percentile(values, percent)), 3)
+
+
+async def _run_pass(pass_number: int, retailer, products: List[Dict[str, Any]], notion_server) -> Dict[str, Any]:
+    import main
+    from config import RUN_JOURNAL_DIR
+    from services.run_journal import RunJournal
+    from services.run_metrics import run_metrics
+
+    # The journal would make later passes resume instead of scrape; every pass starts a new day's run
+    shutil.rmtree(RUN_JOURNAL_DIR, ignore_errors=True)
+    FakeSMTP.sent.clear()
+    notion_requests_before = len(notion_server.request_log)
+    run_metrics.reset()
+
+    with RssSampler() as sampler:
+        started = time.perf_counter()
+        await main.run_workflow()
+        wall_seconds = time.perf_counter() - started
+
+    report = run_metrics.report()
+    latencies = [item['seconds'] for item in report['items']]
+    scrape_seconds = report['phases'].get('scrape', 0.0)
+
+    journal = RunJournal(date.today())
+    expected_by_url = {retailer.url_for(product): retailer.expected(product) for product in products}
+    correct = sum(
+        1 for item in journal.items.values()
+        if item.url in expected_by_url and abs(item.price - expected_by_url[item.url]['price']) < 0.01
+    )
+    journal.close()
+
+    return {
+        'pass': pass_number,
+        'wall_seconds': round(wall_seconds, 3),
+        'scrape_seconds': scrape_seconds,
+        'items_per_second': round(len(latencies) / scrape_seconds, 3) if scrape_seconds else 0.0,
+        'p50_seconds': _percentile(latencies, 50),
+        'p95_seconds': _percentile(latencies, 95),
+        'max_seconds': round(max(latencies), 3) if latencies else 0.0,
+        'peak_rss_mb': round(sampler.peak_mb, 1),
+        'browser_launches': report['counters'].get('browser_launches', 0),
+        'llm_calls': report['totals']['llm_calls'],
+        'input_tokens': report['totals']['input_tokens'],
+        'output_tokens': report['totals']['output_tokens'],
+        'resolutions': dict(Counter(item['resolution'] for item in report['items'])),
+        'correct': correct,
+        'notion_requests': len(notion_server.request_log) - notion_requests_before,
+        'emails_sent': len(FakeSMTP.sent),
+        'phases': report['phases'],
+    }
+
+
+def run_cell(args) -> Dict[str, Any]:
+    """Run all passes of one benchmark cell. Expects the environment prepared by _cell_env."""
+    from devtools.fake_notion_server import FakeNotionServer, make_page
+    from devtools.fixture_retailer import FixtureRetailer, make_catalog
+    from devtools.stub_llm import StubChatModel
+    from services import product_tracker, email_sender
+
+    products = make_catalog(args.items, args.domains, args.browser_ratio, seed=args.seed)
+    with FixtureRetailer(products, args.domains, latency=args.page_latency, pages_dir=args.pages_dir) as retailer:
+        expected = {retailer.url_for(product): retailer.expected(product) for product in products}
+        product_tracker.llm_factory = lambda: StubChatModel(expected, latency=args.llm_latency)
+        email_sender.smtplib.SMTP = FakeSMTP
+
+        pages = [make_page(retailer.url_for(product)) for product in products]
+        notion_port = int(os.environ["NOTION_API_BASE_URL"].rsplit(":", 1)[1])
+        with FakeNotionServer(pages, port=notion_port) as notion_server:
+            passes = [asyncio.run(_run_pass(number, retailer, products, notion_server)) for number in range(1, args.passes + 1)]
+
+    return {
+        'items': args.items,
+        'concurrency': args.concurrency[0],
+        'domains': args.domains,
+        'browser_ratio': args.browser_ratio,
+        'llm_latency': args.llm_latency,
+        'page_latency': args.page_latency,
+        'passes': passes,
+    }
+
+
+def _cell_env(args, concurrency: int, cache_dir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        'CACHE_DIR': cache_dir,
+        'MAX_CONCURRENT_REQUESTS': str(concurrency),
+        'PER_DOMAIN_REQUESTS_PER_MINUTE': str(args.per_domain_rpm),
+        'NOTION_API_BASE_URL': f"http://127.0.0.1:{_free_port()}",
+        'NOTION_API_KEY': "benchmark",
+        'NOTION_DATABASE_ID': "benchmark",
+        'NOTION_REQUESTS_PER_SECOND': str(args.notion_rps),
+        'SENDER_EMAIL': "benchmark@example.com",
+        'SENDER_PASSWORD': "benchmark",
+        'RECIPIENT_EMAIL': "benchmark@example.com",
+        'GEMINI_API_KEY': "benchmark",
+        'ANONYMIZED_TELEMETRY': "false",
+    })
+    return env
+
+
+def _cell_args(args, items: int, concurrency: int) -> List[str]:
+    cell_args = [
+        "--cell", "--items", str(items), "--concurrency", str(concurrency), "--domains", str(args.domains),
+        "--browser-ratio", str(args.browser_ratio), "--llm-latency", str(args.llm_latency),
+        "--page-latency", str(args.page_latency), "--passes", str(args.passes), "--seed", str(args.seed),
+    ]
+    if args.pages_dir:
+        cell_args += ["--pages-dir", args.pages_dir]
+    return cell_args
+
+
+def sweep(args) -> List[Dict[str, Any]]:
+    """Run every (items, concurrency) combination in its own process and collect the results."""
+    results = []
+    for items in args.items:
+        for concurrency in args.concurrency:
+            cache_dir = tempfile.mkdtemp(prefix="price-tracker-bench-")
+            try:
+                completed = subprocess.run(
+                    [sys.executable, "-m", "devtools.benchmark", *_cell_args(args, items, concurrency)],
+                    env=_cell_env(args, concurrency, cache_dir), capture_output=True, text=True,
+                )
+            finally:
+                shutil.rmtree(cache_dir, ignore_errors=True)
+            result_lines = [line for line in completed.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+            if completed.returncode != 0 or not result_lines:
+                print(f"items={items} concurrency={concurrency} failed:\n{completed.stderr[-2000:]}", file=sys.stderr)
+                continue
+            result = json.loads(result_lines[-1][len(RESULT_PREFIX):])
+            results.append(result)
+            _print_rows([result])
+    return results
+
+
+def _print_rows(results: List[Dict[str, Any]]):
+    for result in results:
+        for run in result['passes']:
+            print(
+                f"items={result['items']:<5} concurrency={result['concurrency']:<3} pass={run['pass']}  "
+                f"{run['items_per_second']:7.2f} items/s  p50 {run['p50_seconds']:6.2f}s  p95 {run['p95_seconds']:6.2f}s  "
+                f"peak RSS {run['peak_rss_mb']:7.1f} MB  browsers {run['browser_launches']:3d}  LLM calls {run['llm_calls']:4d}  "
+                f"correct {run['correct']}/{result['items']}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the price tracker offline against local fixtures.")
+    parser.add_argument("--items", type=int, nargs="+", default=[20], help="Item counts to sweep")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 3, 6], help="MAX_CONCURRENT_REQUESTS values to sweep")
+    parser.add_argument("--domains", type=int, default=5, help="Number of simulated retailers")
+    parser.add_argument("--browser-ratio", type=float, default=0.3, help="Share of pages without structured data")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Seconds per stub LLM call")
+    parser.add_argument("--page-latency", type=float, default=0.05, help="Seconds added to every fixture response")
+    parser.add_argument("--per-domain-rpm", type=float, default=600, help="PER_DOMAIN_REQUESTS_PER_MINUTE for the runs")
+    parser.add_argument("--notion-rps", type=float, default=100, help="NOTION_REQUESTS_PER_SECOND for the runs")
+    parser.add_argument("--passes", type=int, default=1, help="Runs per cell on the same cache (later passes are warm)")
+    parser.add_argument("--pages-dir", help="Directory of recorded *.html pages to serve instead of generated ones")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write all results as JSON to this file")
+    parser.add_argument("--cell", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cell:
+        args.items = args.items[0]
+        print(RESULT_PREFIX + json.dumps(run_cell(args)))
+        return
+
+    results = sweep(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
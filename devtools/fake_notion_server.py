@@ -0,0 +1,225 @@
+"""
+A local, in-memory stand-in for the parts of the Notion API this project uses.
+
+Serves `GET /v1/databases/<id>`, `POST /v1/databases/<id>/query` (cursor pagination,
+`last_edited_time` timestamp filters and `filter_properties`) and `PATCH /v1/pages/<id>`,
+and can inject 429 rate-limit responses to exercise the client's retry logic.
+
+Run it standalone and point the app at it:
+
+    python -m devtools.fake_notion_server --pages 500 --port 8765
+    NOTION_API_BASE_URL=http://127.0.0.1:8765 python main.py
+"""
+import argparse
+import json
+import logging
+import re
+import threading
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any, Optional
+from urllib.parse import urlparse, parse_qs, unquote
+
+from config import NOTION_URL_PROPERTY_NAME, LOWEST_PRICE_PROPERTY_NAME, LOWEST_PRICE_DATE_PROPERTY_NAME
+
+logger = logging.getLogger(__name__)
+
+DATABASE_PATH = re.compile(r"^/v1/databases/(?P<database_id>[^/]+)$")
+QUERY_PATH = re.compile(r"^/v1/databases/(?P<database_id>[^/]+)/query$")
+PROPERTY_IDS = {NOTION_URL_PROPERTY_NAME: "title", LOWEST_PRICE_PROPERTY_NAME: "lp%3Dn", LOWEST_PRICE_DATE_PROPERTY_NAME: "lp%3Dd"}
+PAGE_PATH = re.compile(r"^/v1/pages/(?P<page_id>[^/]+)$")
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:00.000Z")
+
+
+def make_page(url: str, lowest_price: Optional[float] = None, lowest_price_date: Optional[str] = None, page_id: Optional[str] = None) -> Dict[str, Any]:
+    """Build a Notion page object with the URL, lowest price and lowest price date properties."""
+    return {
+        "object": "page",
+        "id": page_id or str(uuid.uuid4()),
+        "archived": False,
+        "last_edited_time": "2024-01-01T00:00:00.000Z",
+        "properties": {
+            NOTION_URL_PROPERTY_NAME: {"id": PROPERTY_IDS[NOTION_URL_PROPERTY_NAME], "type": "title", "title": [{"type": "text", "text": {"content": url}}]},
+            LOWEST_PRICE_PROPERTY_NAME: {"id": PROPERTY_IDS[LOWEST_PRICE_PROPERTY_NAME], "type": "number", "number": lowest_price},
+            LOWEST_PRICE_DATE_PROPERTY_NAME: {"id": PROPERTY_IDS[LOWEST_PRICE_DATE_PROPERTY_NAME], "type": "date", "date": {"start": lowest_price_date} if lowest_price_date else None},
+            "Notes": {"id": "notes", "type": "rich_text", "rich_text": []},
+        },
+    }
+
+
+def _parse_time(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _matches_filter(page: Dict[str, Any], query_filter: Optional[Dict[str, Any]]) -> bool:
+    """Evaluate the timestamp filters the client sends; any other filter matches everything."""
+    if not query_filter or query_filter.get("timestamp") != "last_edited_time":
+        return True
+    condition = query_filter.get("last_edited_time", {})
+    edited = _parse_time(page["last_edited_time"])
+    if "on_or_after" in condition:
+        return edited >= _parse_time(condition["on_or_after"])
+    if "after" in condition:
+        return edited > _parse_time(condition["after"])
+    return True
+
+
+def _select_properties(page: Dict[str, Any], property_ids: List[str]) -> Dict[str, Any]:
+    if not property_ids:
+        return page
+    # Property IDs are URL-encoded in page objects but arrive decoded from the query string
+    properties = {name: prop for name, prop in page["properties"].items() if unquote(prop.get("id", "")) in property_ids}
+    return {**page, "properties": properties}
+
+
+class FakeNotionServer:
+    """
+    In-memory Notion database served over HTTP on a background thread.
+
+    Attributes:
+        pages: The page objects in database order.
+        request_log: (method, path) of every request received.
+    """
+
+    def __init__(self, pages: List[Dict[str, Any]], host: str = "127.0.0.1", port: int = 0, rate_limit_every: int = 0):
+        """
+        Initialize the fake server.
+
+        Args:
+            pages: Page objects to serve, e.g. built with make_page.
+            host: Interface to bind to.
+            port: Port to bind to; 0 picks a free port.
+            rate_limit_every: Answer every Nth request with a 429, or 0 to never rate limit.
+        """
+        self.pages = pages
+        self.rate_limit_every = rate_limit_every
+        self.request_log: List[tuple] = []
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeNotionServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "FakeNotionServer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _query(self, body: Dict[str, Any], property_ids: List[str]) -> Dict[str, Any]:
+        # Like Notion, archived pages are not returned by database queries
+        pages = [page for page in self.pages if not page.get("archived") and _matches_filter(page, body.get("filter"))]
+        page_size = min(int(body.get("page_size", 100)), 100)
+        start = int(body.get("start_cursor") or 0)
+        batch = [_select_properties(page, property_ids) for page in pages[start:start + page_size]]
+        has_more = start + page_size < len(pages)
+        return {
+            "object": "list",
+            "results": batch,
+            "has_more": has_more,
+            "next_cursor": str(start + page_size) if has_more else None,
+        }
+
+    def _update(self, page_id: str, body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        for page in self.pages:
+            if page["id"] == page_id:
+                for name, value in body.get("properties", {}).items():
+                    prop = page["properties"].setdefault(name, {})
+                    prop.update(value)
+                    prop.setdefault("type", next(iter(value)))
+                page["last_edited_time"] = _now()
+                return page
+        return None
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+            def _send(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _handle(self, method: str):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                parsed_url = urlparse(self.path)
+                path = parsed_url.path
+                property_ids = parse_qs(parsed_url.query).get("filter_properties", [])
+                with server._lock:
+                    server.request_log.append((method, self.path))
+                    count = len(server.request_log)
+                    if server.rate_limit_every and count % server.rate_limit_every == 0:
+                        return self._send(429, {"object": "error", "code": "rate_limited"}, {"Retry-After": "0"})
+
+                    if method == "GET" and DATABASE_PATH.match(path):
+                        properties = {name: {"id": property_id, "name": name} for name, property_id in PROPERTY_IDS.items()}
+                        return self._send(200, {"object": "database", "properties": properties})
+                    if method == "POST" and QUERY_PATH.match(path):
+                        return self._send(200, server._query(body, property_ids))
+                    page_match = PAGE_PATH.match(path)
+                    if method == "PATCH" and page_match:
+                        if any(page["id"] == page_match.group("page_id") and page.get("archived") for page in server.pages):
+                            return self._send(400, {"object": "error", "code": "validation_error",
+                                                    "message": "Can't edit block that is archived. You must unarchive the block before editing."})
+                        page = server._update(page_match.group("page_id"), body)
+                        if page is None:
+                            return self._send(404, {"object": "error", "code": "object_not_found"})
+                        return self._send(200, page)
+                return self._send(404, {"object": "error", "code": "invalid_request_url"})
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_PATCH(self):
+                self._handle("PATCH")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake Notion database for local runs.")
+    parser.add_argument("--pages", type=int, default=50, help="Number of generated wishlist pages")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--url-template", default="http://127.0.0.1:8000/product/{n}", help="Product URL pattern, {n} is the page number")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Answer every Nth request with a 429")
+    args = parser.parse_args()
+
+    pages = [make_page(args.url_template.format(n=n)) for n in range(args.pages)]
+    server = FakeNotionServer(pages, port=args.port, rate_limit_every=args.rate_limit_every)
+    print(f"Fake Notion API with {len(pages)} pages at {server.base_url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
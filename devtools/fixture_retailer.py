@@ -0,0 +1,267 @@
+"""
+Local stand-in for the retailer sites the tracker scrapes, for offline benchmarks.
+
+Serves generated product pages (or recorded ones from a directory) on one port per simulated
+retailer, so the scheduler's per-domain limits apply as they would against real sites. Pages
+honor `If-None-Match`, and requests can be given an artificial latency.
+
+Two kinds of generated pages exist: "structured" pages carry schema.org JSON-LD and OpenGraph
+tags and are resolved by the structured data fast path, "browser" pages only have visible
+markup and need a browser (recipe replay or the Agent).
+
+    python -m devtools.fixture_retailer --products 50 --domains 5
+"""
+import argparse
+import base64
+import hashlib
+import html
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_PATH = re.compile(r"^/products/(?P<product_id>\d+)$")
+IMAGE_PATH = re.compile(r"^/images/(?P<product_id>\d+)\.png$")
+# A 1x1 PNG, small but valid so the email's thumbnail step can decode it
+IMAGE_BYTES = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII=")
+IMAGE_HEADERS = {"Content-Type": "image/png", "Cache-Control": "max-age=86400", "ETag": '"fixture-image"'}
+
+STRUCTURED_TEMPLATE = """<!doctype html>
+<html><head>
+<title>{name}</title>
+<meta property="og:title" content="{name}">
+<meta property="og:image" content="{image_url}">
+<meta property="product:price:amount" content="{price}">
+<meta property="product:price:currency" content="INR">
+<script type="application/ld+json">{json_ld}</script>
+</head><body>
+<header><nav>Home / Clothing</nav></header>
+<main><h1>{name}</h1><img src="{image_url}" alt="{name}"><span class="price">&#8377;{price}</span></main>
+<footer>Fixture retailer {domain}</footer>
+</body></html>
+"""
+
+BROWSER_TEMPLATE = """<!doctype html>
+<html><head><title>{name}</title></head><body>
+<header><nav>Home / Clothing</nav></header>
+<main>
+<h1 class="pdp-title">{name}</h1>
+<img class="pdp-image" src="{image_url}" alt="{name}">
+<span class="pdp-mrp"><s>&#8377;{mrp}</s></span> <span class="pdp-price">&#8377;{price}</span> <span class="pdp-discount">({discount}% OFF)</span>
+<div class="size-buttons">{sizes}</div>
+<section class="product-reviews"><h2>Reviews</h2><p>Fits true to size. Great value for the price, would buy again.</p></section>
+<div class="you-may-also-like">{recommendations}</div>
+</main>
+<footer>Fixture retailer {domain}</footer>
+</body></html>
+"""
+
+
+def make_catalog(count: int, domains: int, browser_ratio: float = 0.3, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Generate deterministic fixture products.
+
+    Args:
+        count: Number of products.
+        domains: Number of simulated retailers the products are spread over.
+        browser_ratio: Share of products whose page has no structured data.
+        seed: Random seed, so the same arguments always give the same catalog.
+
+    Returns:
+        Product dicts with id, domain (index), kind, name, price, discount and sizes.
+    """
+    rng = random.Random(seed)
+    products = []
+    for product_id in range(count):
+        mrp = rng.randrange(999, 9999, 100)
+        discount = rng.choice([0, 10, 20, 30, 40, 50])
+        products.append({
+            'id': product_id,
+            'domain': product_id % max(1, domains),
+            'kind': "browser" if rng.random() < browser_ratio else "structured",
+            'name': f"Fixture {rng.choice(['Running Shoe', 'Oxford Shirt', 'Slim Jeans', 'Hoodie', 'Sneaker'])} #{product_id}",
+            'mrp': mrp,
+            'price': round(mrp * (100 - discount) / 100),
+            'discount': discount,
+            'sizes': ["UK 7", "UK 8", "UK 9", "UK 10", "S", "M", "L", "30", "32"],
+        })
+    return products
+
+
+class FixtureRetailer:
+    """
+    Serves fixture products over HTTP, one ThreadingHTTPServer per simulated retailer.
+
+    Attributes:
+        products: The catalog as generated by make_catalog.
+        request_count: Number of requests answered so far.
+    """
+
+    def __init__(self, products: List[Dict[str, Any]], domains: int, host: str = "127.0.0.1", latency: float = 0.0, pages_dir: Optional[str] = None):
+        """
+        Initialize the servers.
+
+        Args:
+            products: Catalog from make_catalog.
+            domains: Number of retailers (ports) to serve.
+            host: Interface to bind to.
+            latency: Seconds to wait before answering each request.
+            pages_dir: Optional directory of recorded *.html product pages, served round-robin
+                instead of the generated markup.
+        """
+        self.products = products
+        self.latency = latency
+        self.request_count = 0
+        self._lock = threading.Lock()
+        self._recorded_pages = []
+        if pages_dir:
+            self._recorded_pages = [
+                os.path.join(pages_dir, name) for name in sorted(os.listdir(pages_dir)) if name.endswith(".html")
+            ]
+        self._servers = [ThreadingHTTPServer((host, 0), self._make_handler(index)) for index in range(max(1, domains))]
+        self._threads: List[threading.Thread] = []
+
+    def base_url(self, domain: int) -> str:
+        host, port = self._servers[domain].server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url_for(self, product: Dict[str, Any]) -> str:
+        return f"{self.base_url(product['domain'])}/products/{product['id']}"
+
+    def expected(self, product: Dict[str, Any]) -> Dict[str, Any]:
+        """The ScrapedProductData fields a correct scrape of the product returns."""
+        return {
+            'name': product['name'],
+            'url': self.url_for(product),
+            'price': float(product['price']),
+            'discount': float(product['discount']),
+            'image_url': f"{self.base_url(product['domain'])}/images/{product['id']}.png",
+        }
+
+    def render(self, product: Dict[str, Any]) -> str:
+        """The HTML of a product page."""
+        if self._recorded_pages:
+            with open(self._recorded_pages[product['id'] % len(self._recorded_pages)], encoding="utf-8") as f:
+                return f.read()
+
+        expected = self.expected(product)
+        values = {
+            'name': html.escape(product['name']),
+            'image_url': html.escape(expected['image_url']),
+            'price': product['price'],
+            'mrp': product['mrp'],
+            'discount': product['discount'],
+            'domain': product['domain'],
+        }
+        if product['kind'] == "structured":
+            json_ld = {
+                "@context": "https://schema.org",
+                "@type": "Product",
+                "name": product['name'],
+                "image": expected['image_url'],
+                "offers": {"@type": "Offer", "price": str(product['price']), "priceCurrency": "INR", "availability": "https://schema.org/InStock"},
+            }
+            return STRUCTURED_TEMPLATE.format(json_ld=json.dumps(json_ld).replace("</", "<\\/"), **values)
+        sizes = "".join(f'<button class="size-button">{size}</button>' for size in product['sizes'])
+        # Other products' names, prices and images, which the Agent must not pick up
+        others = [self.products[(product['id'] + offset) % len(self.products)] for offset in range(1, 7)]
+        recommendations = "".join(
+            f'<a href="/products/{other["id"]}"><img src="/images/{other["id"]}.png"><span>{html.escape(other["name"])}</span><span>&#8377;{other["price"]}</span></a>'
+            for other in others
+        )
+        return BROWSER_TEMPLATE.format(sizes=sizes, recommendations=recommendations, **values)
+
+    def start(self) -> "FixtureRetailer":
+        for server in self._servers:
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        for server in self._servers:
+            # shutdown() waits for serve_forever, so only call it on started servers
+            if self._threads:
+                server.shutdown()
+            server.server_close()
+
+    def __enter__(self) -> "FixtureRetailer":
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _make_handler(self, domain: int):
+        retailer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+            def _send(self, status: int, body: bytes = b"", headers: Optional[Dict[str, str]] = None):
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body and self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def do_HEAD(self):
+                if IMAGE_PATH.match(self.path):
+                    return self._send(200, IMAGE_BYTES, IMAGE_HEADERS)
+                self._send(405, headers={"Allow": "GET"})
+
+            def do_GET(self):
+                with retailer._lock:
+                    retailer.request_count += 1
+                if retailer.latency:
+                    time.sleep(retailer.latency)
+
+                image_match = IMAGE_PATH.match(self.path)
+                if image_match:
+                    return self._send(200, IMAGE_BYTES, IMAGE_HEADERS)
+
+                product_match = PRODUCT_PATH.match(self.path)
+                product_id = int(product_match.group("product_id")) if product_match else -1
+                if not 0 <= product_id < len(retailer.products) or retailer.products[product_id]['domain'] != domain:
+                    return self._send(404, b"Not found", {"Content-Type": "text/plain"})
+
+                body = retailer.render(retailer.products[product_id]).encode("utf-8")
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304, headers={"ETag": etag})
+                self._send(200, body, {"Content-Type": "text/html; charset=utf-8", "ETag": etag})
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fixture product pages for offline runs.")
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--domains", type=int, default=5, help="Number of simulated retailers (one port each)")
+    parser.add_argument("--browser-ratio", type=float, default=0.3, help="Share of pages without structured data")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--pages-dir", help="Directory of recorded *.html pages to serve instead of generated ones")
+    args = parser.parse_args()
+
+    retailer = FixtureRetailer(make_catalog(args.products, args.domains, args.browser_ratio), args.domains, latency=args.latency, pages_dir=args.pages_dir)
+    retailer.start()
+    for domain in range(args.domains):
+        print(f"Retailer {domain}: {retailer.base_url(domain)}/products/<id>")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        retailer.stop()
+
+
+if __name__ == "__main__":
+    main()
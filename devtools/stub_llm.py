@@ -0,0 +1,102 @@
+"""
+A deterministic stand-in for the Agent's chat model, for offline benchmarks.
+
+It answers every Agent step with a `done` action carrying the expected product data of the
+page the messages mention, after a configurable latency, and reports token usage estimated
+from the message size. It never calls a network service.
+"""
+import asyncio
+import json
+import re
+from typing import List, Dict, Any, Optional
+
+from browser_use.llm.views import ChatInvokeCompletion, ChatInvokeUsage
+
+
+def _message_text(message) -> str:
+    content = getattr(message, "content", "")
+    if isinstance(content, str):
+        return content
+    return " ".join(getattr(part, "text", "") or "" for part in content or [])
+
+
+class StubChatModel:
+    """
+    Implements the browser_use BaseChatModel protocol.
+
+    Attributes:
+        calls: Number of ainvoke calls so far.
+    """
+
+    _verified_api_keys = True
+    model = "stub"
+
+    def __init__(self, products: Dict[str, Dict[str, Any]], latency: float = 0.5, tokens_per_char: float = 0.25):
+        """
+        Initialize the stub.
+
+        Args:
+            products: Expected ScrapedProductData fields keyed by product URL.
+            latency: Seconds each call takes.
+            tokens_per_char: Ratio used to turn message sizes into token counts.
+        """
+        self.products = products
+        self.latency = latency
+        self.tokens_per_char = tokens_per_char
+        self.calls = 0
+
+    @property
+    def provider(self) -> str:
+        return "stub"
+
+    @property
+    def name(self) -> str:
+        return "stub"
+
+    @property
+    def model_name(self) -> str:
+        return self.model
+
+    def _product_for(self, text: str) -> Optional[Dict[str, Any]]:
+        """The product whose URL appears last in the messages, i.e. the current page."""
+        found, position = None, -1
+        for url, product in self.products.items():
+            if url not in text:
+                continue
+            # The URL must not continue, so /products/1 doesn't match inside /products/11
+            for match in re.finditer(re.escape(url) + r"(?![\w/])", text):
+                if match.start() > position:
+                    found, position = product, match.start()
+        return found
+
+    def _completion_for(self, output_format, text: str):
+        if output_format is None:
+            return ""
+        fields = output_format.model_fields
+        if "action" in fields:
+            product = self._product_for(text)
+            if product is None:
+                product = {"name": "", "url": "", "price": -1.0, "discount": 0.0, "image_url": ""}
+            done = {"success": product['price'] >= 0, "data": product}
+            return output_format.model_validate({"evaluation_previous_goal": "", "memory": "", "next_goal": "", "action": [{"done": done}]})
+        if "verdict" in fields:
+            return output_format.model_validate({"verdict": True, "reasoning": "stub"})
+        return output_format.model_validate({})
+
+    async def ainvoke(self, messages: List[Any], output_format=None, **kwargs) -> ChatInvokeCompletion:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        text = "\n".join(_message_text(message) for message in messages)
+        completion = self._completion_for(output_format, text)
+        completion_text = completion if isinstance(completion, str) else completion.model_dump_json()
+        prompt_tokens = int(len(text) * self.tokens_per_char)
+        completion_tokens = int(len(completion_text) * self.tokens_per_char)
+        usage = ChatInvokeUsage(
+            prompt_tokens=prompt_tokens,
+            prompt_cached_tokens=None,
+            prompt_cache_creation_tokens=None,
+            prompt_image_tokens=None,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens,
+        )
+        return ChatInvokeCompletion(completion=completion, usage=usage)
@@ -1,70 +1,577 @@
+import argparse
 import asyncio
+import json
 import logging
+import os
+import sys
+import time
 from datetime import date
+from collections import defaultdict
+from typing import List, Dict, Optional, Tuple, AsyncIterator, AsyncIterable, TYPE_CHECKING
 
-from config import MAX_CONCURRENT_REQUESTS
-from services.notion_loader import NotionLoader
-from services.product_tracker import process_products
-from services.email_sender import EmailSender
+# Start of the startup time reported by every command. Heavy dependencies (browser_use,
+# Playwright and the Gemini client via services.product_tracker, httpx, NumPy, Pillow) are
+# imported by the functions that need them, so quick commands don't pay for them.
+STARTED_AT = time.perf_counter()
+
+from config import MAX_CONCURRENT_REQUESTS, CACHE_DIR, SHARD_RESULTS_DIR, ADAPTIVE_CHECKS, CHECK_BUDGET_ITEMS, CHECK_BUDGET_TOKENS, CANONICALIZE_URLS, EMAIL_INLINE_THUMBNAILS
+from models.WishListItem import WishlistItem
+from models.Recipient import Recipient
+from models.TrackedItem import TrackedItem
+from services.run_journal import RunJournal
+from services.run_metrics import run_metrics
+from services.sharding import parse_shard, parse_shard_count, claim_shard, write_shard_result, load_shard_results
+from services.check_schedule import CheckSchedule
+from services.recipients import load_recipients
+
+if TYPE_CHECKING:
+    from services.notion_loader import NotionLoader
+    from services.price_history import PriceHistory
 
 logger = logging.getLogger(__name__)
 
-async def main():
+check_schedule = CheckSchedule()
+
+def record_result(item: WishlistItem, notion_loader: "NotionLoader", price_history: "PriceHistory", today: date, pending_updates: List[asyncio.Task]):
+    """Store a processed item's price in the local history and compare it with its recorded low."""
+    price_history.record(item.page_id, item.price, today)
+    compare_with_lowest_price(item, notion_loader, today, pending_updates)
+
+def compare_with_lowest_price(item: WishlistItem, notion_loader: "NotionLoader", today: date, pending_updates: List[asyncio.Task]):
+    """
+    Compare an item's current price with its historical low and start a Notion update if it is a new low.
+
+    The update runs in the background; its task is appended to pending_updates so the caller can await it.
+    """
+    if item.price < 0:
+        logger.info(f"Skipping price comparison for unavailable/error item: {item.name} ({item.url})")
+        return
+
+    if item.lowest_price_so_far is None or item.price < item.lowest_price_so_far:
+        logger.info(f"New lowest price found for {item.name}: {item.price} (was {item.lowest_price_so_far})")
+        if item.lowest_price_so_far is not None:
+            item.lowest_price_so_far = item.price
+            item.lowest_price_date = today
+        pending_updates.append(asyncio.create_task(notion_loader.update_lowest_price(item.page_id, item.price, today)))
+    else:
+         logger.info(f"Current price {item.price} for {item.name} is not lower than recorded lowest {item.lowest_price_so_far} on {item.lowest_price_date}")
+
+async def stream_recipient_items(notion_loader: "NotionLoader", recipients: List[Recipient], recipients_by_page: Dict[str, List[str]]) -> AsyncIterator[List[TrackedItem]]:
+    """
+    Load the items of every recipient's Notion database and filter, each page once, a batch at a time.
+
+    Recipients with the same database and filter share one query. Batches are yielded as Notion
+    returns them, so scraping can start while the rest is loading.
+
+    Args:
+        notion_loader: Open Notion client.
+        recipients: The recipients whose items to load.
+        recipients_by_page: Filled in while loading with the email addresses of the recipients of
+            every page, by page ID. Complete once the batches are exhausted.
+    """
+    logger.info("Loading items from Notion database")
+    emails_by_query: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+    for recipient in recipients:
+        query_filter = json.dumps(recipient.notion_filter, sort_keys=True) if recipient.notion_filter else ""
+        emails_by_query[(recipient.notion_database_id or "", query_filter)].append(recipient.email)
+
+    for (database_id, query_filter), emails in emails_by_query.items():
+        async for batch in notion_loader.load_items(database_id or None, json.loads(query_filter) if query_filter else None):
+            new_items = [item_data for item_data in batch if item_data.page_id not in recipients_by_page]
+            for item_data in batch:
+                page_recipients = recipients_by_page.setdefault(item_data.page_id, [])
+                page_recipients.extend(email for email in emails if email not in page_recipients)
+            if new_items:
+                yield new_items
+
+async def load_recipient_items(notion_loader: "NotionLoader", recipients: List[Recipient]) -> Tuple[List[TrackedItem], Dict[str, List[str]]]:
+    """
+    Load the items of every recipient at once, see stream_recipient_items.
+
+    Returns:
+        The items, and the email addresses of the recipients of every page by page ID.
+    """
+    recipients_by_page: Dict[str, List[str]] = {}
+    items_data = [item_data async for batch in stream_recipient_items(notion_loader, recipients, recipients_by_page) for item_data in batch]
+    return items_data, recipients_by_page
+
+def attach_price_stats(items: List[WishlistItem], price_history: "PriceHistory", today: date):
+    """Attach 30/90-day trend stats from the local price history to the items, for the email."""
+    stats_by_page = price_history.stats([item.page_id for item in items], today)
+    for item in items:
+        item.price_stats = stats_by_page.get(item.page_id)
+
+async def track_prices(item_batches: AsyncIterable[List[TrackedItem]], notion_loader: "NotionLoader", price_history: "PriceHistory", journal: RunJournal, today: date) -> Tuple[List[WishlistItem], int]:
+    """
+    Scrape the items loaded from Notion and record the results.
+
+    Scraping starts on the first batch from Notion while the rest is still loading. Items stream
+    from the scraper straight into the price history and the Notion comparison, and are written to
+    the run journal as they finish. Items already in the journal (from a run that crashed or timed
+    out earlier today) are reused instead of scraped again, and items that aren't due yet (see
+    services/check_schedule.py) keep their last result. Pages that point at the same product (see
+    services/url_canonicalizer.py), in the same batch or not, are scraped once and share the result.
+    With a check budget (CHECK_BUDGET_ITEMS or CHECK_BUDGET_TOKENS), all items are loaded before
+    the first scrape, so the budget goes to the most important items of the whole wishlist.
+
+    Args:
+        item_batches: Batches of items as yielded by stream_recipient_items.
+        notion_loader: Open Notion client.
+        price_history: Open local price history.
+        journal: The run journal of today (or of this shard).
+        today: Date of the run.
+
+    Returns:
+        The processed items with their price stats attached, and how many of them were scraped in this run.
     """
-    Main function to control the price tracking workflow.
+    from services.product_tracker import stream_product_batches, ERROR_ITEM_NAME
+    from services.scheduler import single_batch
+    if CANONICALIZE_URLS:
+        from services.url_canonicalizer import product_keys
+
+    started = time.perf_counter()
+    pending_updates: List[asyncio.Task] = []
+    processed_items: List[WishlistItem] = []
+    counts = {'loaded': 0, 'resumed': 0, 'scraped': 0, 'unique': 0}
+    # Page scraped for every product (by product key or URL), the other pages waiting for its
+    # result, and the results of the scraped pages for pages of the same product in later batches
+    scraped_page_of_product: Dict[str, str] = {}
+    duplicates: Dict[str, List[TrackedItem]] = defaultdict(list)
+    scraped_results: Dict[str, WishlistItem] = {}
+
+    def finish(item: WishlistItem):
+        if item.name != ERROR_ITEM_NAME:
+            journal.record_item(item)
+        record_result(item, notion_loader, price_history, today, pending_updates)
+        if ADAPTIVE_CHECKS and item.name != ERROR_ITEM_NAME:
+            metrics = run_metrics.item_for(item.page_id)
+            check_schedule.record(item, metrics.input_tokens + metrics.output_tokens if metrics else 0)
+        processed_items.append(item)
+
+    def share_result(scraped_item: WishlistItem, item_data: TrackedItem):
+        finish(scraped_item.model_copy(update={
+            'page_id': item_data.page_id,
+            'lowest_price_so_far': item_data.lowest_price_so_far,
+            'lowest_price_date': item_data.lowest_price_date,
+        }))
+
+    async def batches_to_scrape() -> AsyncIterator[List[TrackedItem]]:
+        async for batch in item_batches:
+            counts['loaded'] += len(batch)
+            # Resume items already processed earlier today, with their current lows from Notion
+            # so a Notion update that didn't go through before the crash is retried
+            items_to_scrape = []
+            for item_data in batch:
+                item = journal.get(item_data.page_id)
+                if item is None:
+                    items_to_scrape.append(item_data)
+                    continue
+                item.lowest_price_so_far = item_data.lowest_price_so_far
+                item.lowest_price_date = item_data.lowest_price_date
+                record_result(item, notion_loader, price_history, today, pending_updates)
+                processed_items.append(item)
+                counts['resumed'] += 1
+
+            # Only scrape the items that are due, within this run's budget; the others keep their last result
+            if ADAPTIVE_CHECKS and items_to_scrape:
+                items_to_scrape, skipped_items = check_schedule.plan(items_to_scrape)
+                processed_items.extend(skipped_items)
+            counts['scraped'] += len(items_to_scrape)
+
+            # Scrape every product once; other pages of the same product get a copy of the result
+            keys = await product_keys(item_data.url for item_data in items_to_scrape) if CANONICALIZE_URLS else {}
+            unique_items = []
+            for item_data in items_to_scrape:
+                scraped_page = scraped_page_of_product.setdefault(keys.get(item_data.url, item_data.url), item_data.page_id)
+                if scraped_page == item_data.page_id:
+                    unique_items.append(item_data)
+                elif scraped_page in scraped_results:
+                    share_result(scraped_results[scraped_page], item_data)
+                else:
+                    duplicates[scraped_page].append(item_data)
+            if unique_items:
+                if not counts['unique']:
+                    run_metrics.record_phase("until_first_scrape", time.perf_counter() - started)
+                counts['unique'] += len(unique_items)
+                yield unique_items
+
+    if ADAPTIVE_CHECKS and (CHECK_BUDGET_ITEMS or CHECK_BUDGET_TOKENS):
+        item_batches = single_batch([item_data async for batch in item_batches for item_data in batch])
+
+    # Each result is journaled, added to the local price history and compared with its historical
+    # low as soon as it is ready; new lows are written to Notion concurrently.
+    with run_metrics.phase("scrape"):
+        async for scraped_item in stream_product_batches(batches_to_scrape(), max_concurrent=MAX_CONCURRENT_REQUESTS):
+            scraped_results[scraped_item.page_id] = scraped_item
+            finish(scraped_item)
+            for item_data in duplicates.pop(scraped_item.page_id, []):
+                share_result(scraped_item, item_data)
+
+    if not counts['loaded']:
+        logger.warning("No items loaded from Notion database.")
+        return [], 0
+    if counts['resumed']:
+        logger.info(f"Resumed {counts['resumed']} item(s) from today's run journal")
+    logger.info(f"Processed {counts['loaded']} items: scraped {counts['scraped']} ({counts['unique']} unique products)")
+
+    # Wait for the outstanding Notion updates
+    with run_metrics.phase("notion_update"):
+        if pending_updates:
+            logger.info(f"Waiting for {len(pending_updates)} Notion update(s) to finish")
+            await asyncio.gather(*pending_updates)
+
+    # Attach 30/90-day trend stats from the local price history for the email
+    with run_metrics.phase("price_stats"):
+        attach_price_stats(processed_items, price_history, today)
+
+    return processed_items, counts['scraped']
+
+async def send_digests(items: List[WishlistItem], recipients: List[Recipient], recipients_by_page: Dict[str, List[str]], today: date) -> List[str]:
     """
+    Email every recipient the processed items of their own wishlist, over one SMTP connection.
+
+    The product images are checked first and embedded as small inline thumbnails (see
+    services/image_cache.py), so broken images show a placeholder and opening the email doesn't
+    fetch full-size images from the retailers.
+
+    Returns:
+        The addresses whose email went out.
+    """
+    from services.email_sender import EmailSender
+
+    digests: Dict[str, List[WishlistItem]] = {recipient.email: [] for recipient in recipients}
+    for item in items:
+        for email in recipients_by_page.get(item.page_id, []):
+            if email in digests:
+                digests[email].append(item)
+
+    thumbnails: Dict[str, str] = {}
+    if EMAIL_INLINE_THUMBNAILS:
+        from services.image_cache import ThumbnailCache
+        with run_metrics.phase("images"):
+            thumbnail_cache = ThumbnailCache()
+            try:
+                thumbnails = await thumbnail_cache.prepare(item.image_url for item in items)
+            except Exception as e:
+                # Thumbnails are a nicety: the email goes out with the retailers' images linked
+                logger.error(f"Could not prepare image thumbnails, linking the images instead: {e}")
+            finally:
+                try:
+                    thumbnail_cache.close()
+                except Exception as e:
+                    logger.warning(f"Could not close the thumbnail cache: {e}")
+
+    def send() -> List[str]:
+        with EmailSender() as email_sender:
+            today_date_str = today.strftime("%Y-%m-%d")
+            subject = f"Price Tracking Update - {today_date_str}"
+            names = {recipient.email: recipient.name for recipient in recipients if recipient.name}
+            return email_sender.send_digests(subject, digests, names, thumbnails)
+
+    logger.info(f"Preparing to send email notification to {len(digests)} recipient(s)")
+    with run_metrics.phase("email"):
+        try:
+            # SMTP and its rate-limit pauses block, so they run in a thread rather than stalling the event loop
+            sent = await asyncio.to_thread(send)
+            logger.info(f"Sent {len(sent)} of {len(digests)} email(s).")
+            return sent
+        except ValueError as e:
+            logger.error(f"Email configuration error: {e}")
+        except Exception as e:
+            logger.error(f"Failed to send email: {e}")
+    return []
+
+async def run_workflow():
+    """Run the price tracking workflow in a single process: scrape every item, then email every recipient."""
+    from services.notion_loader import NotionLoader
+    from services.price_history import PriceHistory
+
     logger.info("Starting price tracking workflow")
     today = date.today()
-    
-    # Step 1: Load product items (including IDs and lowest price history) from Notion
-    logger.info("Loading items from Notion database")
-    notion_loader = NotionLoader()
-    items_to_track = notion_loader.load_items() 
-    
-    if not items_to_track:
-        logger.warning("No items loaded from Notion database. Exiting.")
-        return
-    
-    # Step 2: Process products to get current prices
-    logger.info(f"Processing {len(items_to_track)} items...")
-    processed_items = await process_products(items_to_track, max_concurrent=MAX_CONCURRENT_REQUESTS)
-    
-    if not processed_items:
+    recipients = load_recipients()
+
+    async with NotionLoader() as notion_loader, PriceHistory() as price_history, RunJournal(today) as journal:
+        journal.prune()
+        recipients_by_page: Dict[str, List[str]] = {}
+        # Waiting for Notion overlaps with scraping the batches that already arrived
+        item_batches = run_metrics.timed_iter("notion_load", stream_recipient_items(notion_loader, recipients, recipients_by_page))
+        processed_items, scraped_count = await track_prices(item_batches, notion_loader, price_history, journal, today)
+
+        if not processed_items:
+            logger.warning("No products were successfully processed")
+            return
+
+        # After a restart, only recipients who didn't get today's email yet, unless there is news
+        pending_recipients = [recipient for recipient in recipients if scraped_count or recipient.email not in journal.emails_sent]
+        if not pending_recipients:
+            logger.info("Today's email was already sent and nothing new was scraped. Exiting.")
+            return
+
+        for email in await send_digests(processed_items, pending_recipients, recipients_by_page, today):
+            journal.record_email_sent(email)
+
+async def run_shard(shard_index: int, shard_count: int):
+    """
+    Run one worker of a sharded run: scrape and update the items of one shard, without sending an email.
+
+    The processed items are written to SHARD_RESULTS_DIR for merge_shards. A worker restarted on
+    the same day resumes from its own run journal.
+    """
+    from services.notion_loader import NotionLoader
+    from services.price_history import PriceHistory
+
+    logger.info(f"Starting price tracking worker for shard {shard_index}/{shard_count}")
+    today = date.today()
+    journal_suffix = f".shard-{shard_index}-of-{shard_count}"
+
+    recipients = load_recipients()
+
+    async with NotionLoader() as notion_loader, PriceHistory() as price_history, RunJournal(today, name_suffix=journal_suffix) as journal:
+        journal.prune()
+        recipients_by_page: Dict[str, List[str]] = {}
+        claimed = 0
+
+        async def shard_batches() -> AsyncIterator[List[TrackedItem]]:
+            nonlocal claimed
+            async for batch in run_metrics.timed_iter("notion_load", stream_recipient_items(notion_loader, recipients, recipients_by_page)):
+                batch = claim_shard(batch, shard_index, shard_count)
+                claimed += len(batch)
+                if batch:
+                    yield batch
+
+        processed_items, _ = await track_prices(shard_batches(), notion_loader, price_history, journal, today)
+        logger.info(f"Shard {shard_index}/{shard_count} claimed {claimed} item(s)")
+        write_shard_result(today, shard_index, shard_count, processed_items, recipients_by_page)
+
+async def merge_shards(shard_count: int):
+    """
+    Combine the results of today's shard workers and send each recipient a single email.
+
+    Sent emails are recorded in the merge step's own run journal, so merging again the same day
+    (e.g. after the email step failed halfway) only emails the recipients who didn't get it yet.
+    """
+    today = date.today()
+    recipients = load_recipients()
+    items, recipients_by_page, missing = load_shard_results(today, shard_count)
+    if missing:
+        logger.warning(f"Sending the email without the results of shard(s) {missing} of {shard_count}")
+    if not items:
         logger.warning("No products were successfully processed")
         return
+    logger.info(f"Merged {len(items)} item(s) from {shard_count - len(missing)} shard(s)")
 
-    # Step 3: Compare prices, update Notion if new lowest found
-    logger.info("Comparing current prices with historical lows and updating Notion if necessary.")
-    items_for_email = []
-    for item in processed_items:
-        if item.price < 0:
-            logger.info(f"Skipping price comparison for unavailable/error item: {item.name} ({item.url})")
-            items_for_email.append(item)
-            continue
-
-        if item.lowest_price_so_far is None or item.price < item.lowest_price_so_far:
-            logger.info(f"New lowest price found for {item.name}: {item.price} (was {item.lowest_price_so_far})")
-            if item.lowest_price_so_far is not None:
-                item.lowest_price_so_far = item.price
-                item.lowest_price_date = today
-            notion_loader.update_lowest_price(item.page_id, item.price, today)
-        else:
-             logger.info(f"Current price {item.price} for {item.name} is not lower than recorded lowest {item.lowest_price_so_far} on {item.lowest_price_date}")
+    async with RunJournal(today, name_suffix=f".merge-of-{shard_count}") as journal:
+        pending_recipients = [recipient for recipient in recipients if recipient.email not in journal.emails_sent]
+        if not pending_recipients:
+            logger.info("Today's email was already sent after merging the shards. Exiting.")
+            return
+        for email in await send_digests(items, pending_recipients, recipients_by_page, today):
+            journal.record_email_sent(email)
+
+async def run_local_shards(shard_count: int):
+    """
+    Run a sharded run on this machine: one worker process per shard, then the merge step.
+
+    Each worker gets its own cache directory under CACHE_DIR, like a worker on a separate machine would.
+    """
+    results_dir = os.path.abspath(SHARD_RESULTS_DIR)
+    with run_metrics.phase("shard_workers"):
+        workers = []
+        for shard_index in range(shard_count):
+            env = dict(os.environ, CACHE_DIR=os.path.abspath(os.path.join(CACHE_DIR, f"shard-{shard_index}")), SHARD_RESULTS_DIR=results_dir)
+            workers.append(await asyncio.create_subprocess_exec(
+                sys.executable, os.path.abspath(__file__), "--shard", f"{shard_index}/{shard_count}", env=env,
+            ))
+        for shard_index, return_code in enumerate(await asyncio.gather(*(worker.wait() for worker in workers))):
+            if return_code != 0:
+                logger.error(f"Worker for shard {shard_index}/{shard_count} exited with code {return_code}")
+    await merge_shards(shard_count)
+
+
+async def sync_notion():
+    """Refresh the local snapshot of every recipient's Notion database and list the tracked items, without scraping."""
+    from services.notion_loader import NotionLoader
+
+    record_startup("sync-notion")
+    recipients = load_recipients()
+    async with NotionLoader() as notion_loader:
+        items_data, recipients_by_page = await load_recipient_items(notion_loader, recipients)
+    for item_data in items_data:
+        lowest = item_data.lowest_price_so_far
+        print(f"{item_data.page_id}  {lowest if lowest is not None else '-':>10}  {item_data.url}  ({', '.join(recipients_by_page.get(item_data.page_id, []))})")
+    print(f"{len(items_data)} item(s) for {len(recipients)} recipient(s)")
+
+async def scrape_urls(urls: List[str]):
+    """Scrape product URLs and print the results as JSON lines, without touching Notion, the run journal or the price history."""
+    from services.product_tracker import stream_products
 
-        items_for_email.append(item)
+    record_startup("scrape")
+    items_data = [TrackedItem(f"cli-{index}", url) for index, url in enumerate(urls)]
+    async for item in stream_products(items_data, max_concurrent=MAX_CONCURRENT_REQUESTS):
+        print(item.model_dump_json(exclude={'page_id', 'lowest_price_so_far', 'lowest_price_date', 'price_stats'}))
 
-    # Step 4: Send email notification
-    logger.info("Preparing to send email notification")
+def render_email_preview(run_date: Optional[date], shard_count: Optional[int], output: str):
+    """
+    Render the email from a run's stored results into an HTML file, without Notion, scraping or SMTP.
+
+    Meant for previewing template changes: all items go into one email and images are linked
+    instead of inlined.
+
+    Args:
+        run_date: Day of the run, default today.
+        shard_count: Read the results of this many shard workers instead of the run journal.
+        output: Path of the HTML file to write.
+    """
+    from services.email_sender import render_email
+    from services.price_history import PriceHistory
+
+    record_startup("render-email")
+    run_date = run_date or date.today()
+    if shard_count is not None:
+        items, _, missing = load_shard_results(run_date, shard_count)
+        if missing:
+            logger.warning(f"Rendering without the results of shard(s) {missing} of {shard_count}")
+    else:
+        journal = RunJournal(run_date)
+        items = list(journal.items.values())
+        journal.close()
+        # The journal doesn't keep price stats; compute them as the run did
+        price_history = PriceHistory()
+        try:
+            attach_price_stats(items, price_history, run_date)
+        finally:
+            price_history.close()
+    if not items:
+        logger.warning(f"No results stored for {run_date.isoformat()}, rendering an empty email")
+
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        f.write(render_email(items))
+    print(f"Rendered {len(items)} item(s) to {output}")
+
+async def send_from_journal(force: bool = False):
+    """
+    Email today's results without scraping, e.g. after the email step of the run failed.
+
+    Items come from today's run journal, or, for items that weren't due today (see
+    services/check_schedule.py), from their last check.
+
+    Args:
+        force: Also send to recipients who already got today's email.
+    """
+    from services.notion_loader import NotionLoader
+    from services.price_history import PriceHistory
+
+    record_startup("send")
+    today = date.today()
+    recipients = load_recipients()
+    async with NotionLoader() as notion_loader, PriceHistory() as price_history, RunJournal(today) as journal:
+        with run_metrics.phase("notion_load"):
+            items_data, recipients_by_page = await load_recipient_items(notion_loader, recipients)
+        items: List[WishlistItem] = []
+        not_journaled = []
+        for item_data in items_data:
+            item = journal.get(item_data.page_id)
+            if item is None:
+                not_journaled.append(item_data)
+                continue
+            item.lowest_price_so_far = item_data.lowest_price_so_far
+            item.lowest_price_date = item_data.lowest_price_date
+            items.append(item)
+        items.extend(check_schedule.last_results(not_journaled))
+        if not items:
+            logger.warning("No results stored for today's items; run the workflow first")
+            return
+        attach_price_stats(items, price_history, today)
+
+        pending_recipients = [recipient for recipient in recipients if force or recipient.email not in journal.emails_sent]
+        if not pending_recipients:
+            logger.warning("Every recipient already got today's email; use --force to send it again")
+            return
+        for email in await send_digests(items, pending_recipients, recipients_by_page, today):
+            journal.record_email_sent(email)
+
+def record_startup(command: str):
+    """Record how long a command took to start, from loading main.py until its first real work."""
+    seconds = time.perf_counter() - STARTED_AT
+    run_metrics.record_phase("startup", seconds)
+    logger.info(f"{command}: started in {seconds:.3f}s")
+
+async def run(args: argparse.Namespace):
+    """
+    Run the price tracking workflow (or one of its sharded modes).
+
+    Writes a run report (JSON and Prometheus textfile) with per-phase and per-item timings and LLM
+    usage, also when the workflow fails, and prints a summary of where the time and tokens went.
+    """
+    run_metrics.reset()
+    if args.merge is None and args.local_shards is None:
+        # Count the scraper's imports as startup rather than as part of the scrape phase
+        import services.product_tracker  # noqa: F401
+    record_startup("run")
     try:
-        email_sender = EmailSender()
-        today_date_str = today.strftime("%Y-%m-%d")
-        subject = f"Price Tracking Update - {today_date_str}"
-        email_sender.send_email(subject, items_for_email) 
-        logger.info("Email sending process initiated.")
-    except ValueError as e:
-        logger.error(f"Email configuration error: {e}")
-    except Exception as e:
-        logger.error(f"Failed to send email: {e}")
+        if args.shard is not None:
+            await run_shard(*args.shard)
+        elif args.merge is not None:
+            await merge_shards(args.merge)
+        elif args.local_shards is not None:
+            await run_local_shards(args.local_shards)
+        else:
+            await run_workflow()
+    finally:
+        report = run_metrics.write_report()
+        print(run_metrics.summary(report))
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Track the prices of the products in the Notion wishlist and email a digest.",
+        epilog="Without a command, runs the whole workflow: scrape every item, update Notion and email the digests.",
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="Log progress, including how long the command took to start")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--shard", type=parse_shard, metavar="I/N", help="Run as worker I (zero-based) of N: scrape only that shard and write its results, no email")
+    mode.add_argument("--merge", type=parse_shard_count, metavar="N", help="Merge today's results of N shard workers and send the email")
+    mode.add_argument("--local-shards", type=parse_shard_count, metavar="N", help="Run N shard workers as local processes, then merge")
+
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    commands.add_parser("sync-notion", help="Refresh the local copy of the Notion database(s) and list the tracked items")
+    scrape = commands.add_parser("scrape", help="Scrape product URLs and print the results, without touching Notion or the run journal")
+    scrape.add_argument("urls", nargs="+", metavar="URL")
+    render = commands.add_parser("render-email", help="Render the email from stored results into an HTML file, to preview template changes")
+    source = render.add_mutually_exclusive_group(required=True)
+    source.add_argument("--from-journal", action="store_true", help="Use the items in the run journal")
+    source.add_argument("--from-shards", type=parse_shard_count, metavar="N", help="Use the results of N shard workers")
+    render.add_argument("--date", type=date.fromisoformat, help="Day of the run (YYYY-MM-DD), default today")
+    render.add_argument("--output", default=os.path.join(CACHE_DIR, "email_preview.html"), help="HTML file to write (default: %(default)s)")
+    send = commands.add_parser("send", help="Email today's results without scraping, e.g. after the email step failed")
+    send.add_argument("--force", action="store_true", help="Also send to recipients who already got today's email")
+
+    args = parser.parse_args(argv)
+    if args.command and any(mode is not None for mode in (args.shard, args.merge, args.local_shards)):
+        parser.error("--shard, --merge and --local-shards only apply to the workflow, not to a command")
+    return args
+
+def configure_logging(verbose: bool = False):
+    logging.basicConfig(
+        level=logging.INFO if verbose else logging.WARNING,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+
+async def main(args: Optional[argparse.Namespace] = None):
+    """Run the command given on the command line; without one, the price tracking workflow."""
+    args = args or parse_args([])
+    if args.command == "sync-notion":
+        await sync_notion()
+    elif args.command == "scrape":
+        await scrape_urls(args.urls)
+    elif args.command == "render-email":
+        render_email_preview(args.date, args.from_shards, args.output)
+    elif args.command == "send":
+        await send_from_journal(args.force)
+    else:
+        await run(args)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    configure_logging(args.verbose)
+    asyncio.run(main(args))
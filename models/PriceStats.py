@@ -0,0 +1,15 @@
+from pydantic import BaseModel, Field
+from typing import Optional
+from datetime import date
+
+class PriceStats(BaseModel):
+    min_30d: Optional[float] = Field(default=None)
+    min_90d: Optional[float] = Field(default=None)
+    median_30d: Optional[float] = Field(default=None)
+    median_90d: Optional[float] = Field(default=None)
+    moving_avg_7d: Optional[float] = Field(default=None)
+    all_time_low: Optional[float] = Field(default=None)
+    all_time_low_date: Optional[date] = Field(default=None)
+    # Days since a price at or below the latest one was last seen; None if it was never this low
+    lowest_in_days: Optional[int] = Field(default=None)
+    observations: int = 0
@@ -0,0 +1,10 @@
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, Any
+
+class Recipient(BaseModel):
+    email: str
+    name: Optional[str] = Field(default=None)
+    # Database to load this recipient's wishlist from; None for NOTION_DATABASE_ID
+    notion_database_id: Optional[str] = Field(default=None)
+    # Notion filter object applied to the database query, e.g. on an "Owner" property
+    notion_filter: Optional[Dict[str, Any]] = Field(default=None)
@@ -0,0 +1,28 @@
+from datetime import date
+from typing import Optional
+
+class TrackedItem:
+    """
+    A Notion page to track, as loaded from Notion: the product URL and the recorded lowest price.
+
+    A plain slotted class rather than a dict or Pydantic model, since a run holds one of these per
+    database row while it is loading and scraping. Fields come from Notion or the local snapshot,
+    so there is nothing to validate; the scraped result is validated as a WishlistItem.
+    """
+
+    __slots__ = ("page_id", "url", "lowest_price_so_far", "lowest_price_date", "last_edited_time", "priority")
+
+    def __init__(self, page_id: str, url: str, lowest_price_so_far: Optional[float] = None, lowest_price_date: Optional[date] = None,
+                 last_edited_time: Optional[str] = None):
+        self.page_id = page_id
+        self.url = url
+        self.lowest_price_so_far = lowest_price_so_far
+        self.lowest_price_date = lowest_price_date
+        # Only set for pages fetched from Notion, for the snapshot
+        self.last_edited_time = last_edited_time
+        # Order in which the scraper starts items, lowest first (see services/scheduler.py); set
+        # from the item's rank in the check schedule
+        self.priority = 0
+
+    def __repr__(self) -> str:
+        return f"TrackedItem(page_id={self.page_id!r}, url={self.url!r}, lowest_price_so_far={self.lowest_price_so_far!r})"
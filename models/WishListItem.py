@@ -3,8 +3,10 @@ from typing import Optional
 from datetime import date
 
 from .ScrapedProductData import ScrapedProductData
+from .PriceStats import PriceStats
 
 class WishlistItem(ScrapedProductData):
     page_id: str
     lowest_price_so_far: Optional[float] = Field(default=None)
-    lowest_price_date: Optional[date] = Field(default=None)
\ No newline at end of file
+    lowest_price_date: Optional[date] = Field(default=None)
+    price_stats: Optional[PriceStats] = Field(default=None)
\ No newline at end of file
@@ -0,0 +1,77 @@
+import logging
+from functools import lru_cache
+from typing import List, Dict, Any
+
+from config import PREFERRED_BOTTOM_SIZE, PREFERRED_SHOE_SIZE, PREFERRED_TOP_SIZE, AGENT_DOM_PRUNING
+
+logger = logging.getLogger(__name__)
+
+# Bump when TASK_TEMPLATE changes meaning, so results and token counts can be compared per version
+PROMPT_VERSION = 2
+
+TASK_TEMPLATE = """[product-extract v{version}]
+Extract the product on the current page and call done right away.
+- name: product title as displayed.
+- image_url: absolute http(s) URL of the main product image (first/largest gallery image), not a thumbnail, placeholder or data: URL; "" if none.
+- If the product has sizes, select shoe {shoe_size} / top {top_size} / bottom {bottom_size} (or the closest equivalent).
+- price: current price as a number; -1.0 if that size is unavailable, disabled or missing, or the product is out of stock ("Out of Stock", "Notify Me").
+- discount: the "% off" shown, else ((original - sale) / original) * 100, else 0.0.
+- url: current page URL."""
+
+# Hides everything outside the product region (the closest ancestor of the title that also holds
+# a price and an image), plus navigation, footers and recommendation carousels, so the Agent's DOM
+# snapshot only contains the price block, size picker and gallery. Elements are hidden rather than
+# removed so the page's own scripts keep working. Nothing holding the title or a price outside the
+# noise blocks (text with a currency, or an itemprop price/offers) is hidden, so a price block with
+# an unlucky class name or inside an <aside> buy box stays visible.
+PRUNE_PAGE_JS = r"""(function(){try{
+var body=document.body;if(!body){return 'no body'}
+var before=body.innerText.length;
+var priceRe=/(₹|Rs\.?|\$|€|£|INR|USD|EUR|GBP)\s?\d/;
+var noiseRe=/recommend|similar|related|reviews?\b|ratings?[-_ ]?list|also[-_ ]?(viewed|bought|like)|you[-_ ]?may|recently[-_ ]?viewed|cross[-_ ]?sell|upsell|newsletter|breadcrumb|trending/i;
+var hidden=0;
+function hide(el){if(el.getAttribute('data-pruned')||holdsKey(el)){return}el.setAttribute('data-pruned','1');el.style.setProperty('display','none','important');hidden++}
+function label(el){return (el.id||'')+' '+(el.getAttribute('class')||'')+' '+(el.getAttribute('aria-label')||'')}
+function noisy(el){for(;el&&el!==body;el=el.parentElement){if(noiseRe.test(label(el))){return true}}return false}
+function ownText(el){var text='';for(var k=0;k<el.childNodes.length;k++){if(el.childNodes[k].nodeType===3){text+=el.childNodes[k].nodeValue}}return text}
+function holdsKey(el){if(title&&el.contains(title)){return true}for(var k=0;k<keep.length;k++){if(el.contains(keep[k])){return true}}return false}
+var title=document.querySelector('h1, [itemprop=name]');
+var keep=[];
+var region=null;
+for(var el=title?title.parentElement:null;el&&el!==body;el=el.parentElement){if(priceRe.test(el.innerText||'')&&el.querySelector('img')){region=el;break}}
+var priced=(region||body).querySelectorAll('*');
+for(var p=0;p<priced.length;p++){if(priceRe.test(ownText(priced[p]))&&!noisy(priced[p])){keep.push(priced[p])}}
+var marked=document.querySelectorAll('[itemprop=price], [itemprop=offers]');
+for(var q=0;q<marked.length;q++){keep.push(marked[q])}
+if(region){for(var node=region;node&&node!==body;node=node.parentElement){var parent=node.parentElement;if(!parent){break}
+for(var i=0;i<parent.children.length;i++){var sibling=parent.children[i];if(sibling!==node&&!/^(SCRIPT|STYLE|LINK|META|TEMPLATE)$/.test(sibling.tagName)){hide(sibling)}}}}
+var candidates=document.querySelectorAll('header, footer, nav, aside, iframe, [role=navigation], [role=banner], [role=contentinfo], [role=complementary], section, div, ul');
+for(var j=0;j<candidates.length;j++){var candidate=candidates[j];
+var landmark=!/^(SECTION|DIV|UL)$/.test(candidate.tagName);
+if(landmark||noiseRe.test(label(candidate))){hide(candidate)}}
+return JSON.stringify({pruned_to_region:!!region,kept_prices:keep.length,hidden:hidden,chars_before:before,chars_after:body.innerText.length});
+}catch(e){return 'prune failed: '+e.message}})()"""
+
+
+@lru_cache(maxsize=1)
+def task_prompt() -> str:
+    """
+    The Agent's task, rendered once per process.
+
+    It contains no per-item values (the Agent is pointed at the URL by its initial actions), so
+    every item sends the same prefix, which providers with implicit prompt caching can reuse.
+    """
+    return TASK_TEMPLATE.format(
+        version=PROMPT_VERSION,
+        shoe_size=PREFERRED_SHOE_SIZE,
+        top_size=PREFERRED_TOP_SIZE,
+        bottom_size=PREFERRED_BOTTOM_SIZE,
+    )
+
+
+def initial_actions(url: str) -> List[Dict[str, Any]]:
+    """Actions the Agent runs before its first LLM call: open the URL and prune the page."""
+    actions = [{'navigate': {'url': url}}]
+    if AGENT_DOM_PRUNING:
+        actions.append({'evaluate': {'code': PRUNE_PAGE_JS}})
+    return actions
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import os
+import socket
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from playwright.async_api import async_playwright, Browser, BrowserContext, Playwright
+
+from config import BROWSER_POOL_SIZE, BROWSER_RECYCLE_AFTER, BROWSER_POOL_MAX_RSS_MB, HTTP_USER_AGENT
+
+logger = logging.getLogger(__name__)
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def descendant_rss_mb() -> Optional[float]:
+    """
+    Total resident memory of all child processes of this process (i.e. the browsers), in MB.
+
+    Reads /proc, so it returns None on platforms without it.
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    children = {}
+    rss_pages = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                # The process name may contain spaces, so split after its closing parenthesis
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        pid = int(entry)
+        children.setdefault(int(fields[1]), []).append(pid)
+        rss_pages[pid] = int(fields[21])
+
+    total_pages = 0
+    stack = list(children.get(os.getpid(), []))
+    while stack:
+        pid = stack.pop()
+        total_pages += rss_pages.get(pid, 0)
+        stack.extend(children.get(pid, []))
+    return total_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class _PooledBrowser:
+    """One Chromium process in the pool, reachable both through Playwright and over CDP."""
+
+    def __init__(self):
+        self.browser: Optional[Browser] = None
+        self.cdp_url: Optional[str] = None
+        self.uses = 0
+
+    async def ensure_started(self, playwright: Playwright):
+        if self.browser is not None and self.browser.is_connected():
+            return
+        port = _free_port()
+        self.browser = await playwright.chromium.launch(headless=True, args=[f"--remote-debugging-port={port}"])
+        self.cdp_url = f"http://127.0.0.1:{port}"
+        self.uses = 0
+        logger.info(f"Launched pooled browser on {self.cdp_url}")
+
+    async def close(self):
+        if self.browser is not None:
+            try:
+                await self.browser.close()
+            except Exception as e:
+                logger.debug(f"Error closing pooled browser: {e}")
+        self.browser = None
+        self.cdp_url = None
+
+
+class BrowserLease:
+    """
+    An isolated browser context on a pooled browser, handed out for one item.
+
+    The browser serves no other lease meanwhile, so a CDP client such as the Agent's BrowserSession
+    can attach to the whole browser at cdp_url; see open_agent_tab.
+    """
+
+    def __init__(self, context: BrowserContext, cdp_url: str):
+        self.context = context
+        self.cdp_url = cdp_url
+        self.crashed = False
+
+    async def open_agent_tab(self):
+        """
+        Open the blank tab an Agent attaching over CDP takes over.
+
+        browser_use drives the first open tab it finds, and this is the only one, so the Agent
+        browses in this lease's context (its own cookies and storage) instead of the browser's
+        default context. Tabs it opens from there stay in the context too.
+        """
+        await self.context.new_page()
+
+    def mark_crashed(self):
+        """Flag the underlying browser as broken so it is relaunched instead of reused."""
+        self.crashed = True
+
+
+class BrowserPool:
+    """
+    A small pool of warm Chromium processes shared by all items of a run.
+
+    Browsers are launched lazily on first use and kept running between items. Each lease gets a
+    fresh, isolated browser context. A browser is relaunched after `recycle_after` leases, when
+    it crashes, or when the browsers together exceed `max_rss_mb` of memory.
+    """
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE, recycle_after: int = BROWSER_RECYCLE_AFTER, max_rss_mb: float = BROWSER_POOL_MAX_RSS_MB):
+        """
+        Initialize the browser pool.
+
+        Args:
+            size: Number of browser processes to run at most.
+            recycle_after: Number of leases after which a browser is relaunched.
+            max_rss_mb: Memory budget of all browsers together; 0 disables the check.
+        """
+        self.size = max(1, size)
+        self.recycle_after = recycle_after
+        self.max_rss_mb = max_rss_mb
+        self.launches = 0
+        self._playwright: Optional[Playwright] = None
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._browsers: List[_PooledBrowser] = []
+
+    async def __aenter__(self) -> "BrowserPool":
+        self._playwright = await async_playwright().start()
+        for _ in range(self.size):
+            pooled = _PooledBrowser()
+            self._browsers.append(pooled)
+            self._idle.put_nowait(pooled)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        for pooled in self._browsers:
+            await pooled.close()
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    @asynccontextmanager
+    async def lease(self):
+        """Borrow an isolated context on one of the pooled browsers."""
+        pooled: _PooledBrowser = await self._idle.get()
+        context = None
+        lease = None
+        try:
+            was_running = pooled.browser is not None and pooled.browser.is_connected()
+            await pooled.ensure_started(self._playwright)
+            if not was_running:
+                self.launches += 1
+            pooled.uses += 1
+            context = await pooled.browser.new_context(user_agent=HTTP_USER_AGENT)
+            lease = BrowserLease(context, pooled.cdp_url)
+            yield lease
+        finally:
+            if context is not None:
+                try:
+                    await context.close()
+                    await self._close_default_context_tabs(pooled)
+                except Exception:
+                    if lease is not None:
+                        lease.mark_crashed()
+            await self._release(pooled, lease)
+
+    async def _close_default_context_tabs(self, pooled: _PooledBrowser):
+        """
+        Close the tabs left in the browser's default context, e.g. ones the Agent opened with its
+        new-tab action, and clear that context's cookies, so nothing carries over to the next lease.
+        """
+        cdp = await pooled.browser.new_browser_cdp_session()
+        try:
+            targets = (await cdp.send("Target.getTargets"))["targetInfos"]
+            for target in targets:
+                if target.get("type") == "page":
+                    await cdp.send("Target.closeTarget", {"targetId": target["targetId"]})
+            await cdp.send("Storage.clearCookies")
+        finally:
+            await cdp.detach()
+
+    async def _release(self, pooled: _PooledBrowser, lease: Optional[BrowserLease]):
+        reason = None
+        if lease is None or lease.crashed or pooled.browser is None or not pooled.browser.is_connected():
+            reason = "crashed"
+        elif self.recycle_after and pooled.uses >= self.recycle_after:
+            reason = f"reached {pooled.uses} uses"
+        elif self.max_rss_mb:
+            rss = descendant_rss_mb()
+            if rss is not None and rss > self.max_rss_mb:
+                reason = f"browsers use {rss:.0f} MB (limit {self.max_rss_mb:.0f} MB)"
+
+        if reason:
+            logger.info(f"Recycling pooled browser: {reason}")
+            await pooled.close()
+        self._idle.put_nowait(pooled)
@@ -0,0 +1,293 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from html.parser import HTMLParser
+from typing import Optional, Tuple
+
+import requests
+
+from models.ScrapedProductData import ScrapedProductData
+from services.run_metrics import span
+from services.circuit_breaker import retry_async, TIMEOUT, NETWORK
+from config import HTTP_FETCH_ATTEMPTS, PAGE_STATE_PATH, PRECHECK_MAX_AGE_HOURS, HTTP_TIMEOUT_SECONDS, HTTP_USER_AGENT
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS page_state (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    fingerprint TEXT,
+    scraped_json TEXT NOT NULL,
+    scraped_at TEXT NOT NULL
+);
+"""
+
+# Elements that never hold the product's price/availability but change between requests
+SKIPPED_TAGS = {"script", "style", "noscript", "svg", "template", "iframe", "header", "footer", "nav", "aside"}
+# Of those, the ones whose content is never visible text, so nothing inside them is kept
+RAW_TAGS = {"script", "style", "noscript", "svg", "template", "iframe"}
+# Blocks identified by class/id/aria-label that list other products or user content (same as the Agent's page pruning)
+NOISE_PATTERN = re.compile(
+    r"recommend|similar|related|reviews?\b|ratings?[-_ ]?list|also[-_ ]?(viewed|bought|like)|you[-_ ]?may|"
+    r"recently[-_ ]?viewed|cross[-_ ]?sell|upsell|newsletter|breadcrumb|trending",
+    re.IGNORECASE
+)
+# Noise blocks listing other products; prices in them belong to those products
+LISTING_PATTERN = re.compile(
+    r"recommend|similar|related|also[-_ ]?(viewed|bought|like)|you[-_ ]?may|recently[-_ ]?viewed|cross[-_ ]?sell|upsell|trending",
+    re.IGNORECASE
+)
+# Elements holding the product's price or buy box, kept even inside a skipped or noise block
+# (e.g. a buy box in an <aside>, or a "price-and-reviews-summary" wrapper)
+PRICE_PATTERN = re.compile(r"price|buy[-_ ]?box|add[-_ ]?to[-_ ]?(cart|bag)", re.IGNORECASE)
+PRICE_ITEMPROPS = {"price", "offers", "lowprice", "highprice"}
+# Text that looks like an amount of money (same as the Agent's page pruning)
+PRICE_TEXT_PATTERN = re.compile(r"(₹|Rs\.?|\$|€|£|INR|USD|EUR|GBP)\s?\d")
+
+
+# Elements without content or end tag; they can't start a skipped block
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+# Elements whose end tag may be left out: each is closed by the start of a sibling of these kinds
+IMPLIED_END_TAGS = {
+    "li": {"li"}, "p": {"p"}, "dt": {"dt", "dd"}, "dd": {"dt", "dd"}, "option": {"option"},
+    "tr": {"tr"}, "td": {"td", "th"}, "th": {"td", "th"},
+}
+
+# What happens to the text inside an element
+_KEEP = "keep"  # Part of the fingerprint
+_JSON_LD = "json_ld"  # A JSON-LD block, part of the fingerprint
+_PRICE = "price"  # A price-bearing element, part of the fingerprint, and says the page has a price
+_SKIP = "skip"  # Boilerplate or noise; price-bearing elements inside are still kept
+_LISTING = "listing"  # Other products; nothing inside is kept
+_RAW = "raw"  # Not visible text; nothing inside is kept
+
+
+def _is_price_element(attributes) -> bool:
+    if (attributes.get("itemprop") or "").lower() in PRICE_ITEMPROPS:
+        return True
+    return bool(PRICE_PATTERN.search(" ".join(attributes.get(name) or "" for name in ("id", "class"))))
+
+
+class _FingerprintParser(HTMLParser):
+    """
+    Collects the visible text of a page outside navigation/boilerplate, plus JSON-LD blocks and
+    price-bearing elements, and notes whether any of it looks like a price.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.has_price = False
+        # Tags of the open elements, outermost first, and what happens to the text inside each
+        self._open = []
+        self._modes = []
+
+    @property
+    def _mode(self):
+        return self._modes[-1] if self._modes else _KEEP
+
+    def _close(self, tag):
+        """Close the innermost open element with this tag, and any left unclosed inside it."""
+        while self._open:
+            self._modes.pop()
+            if self._open.pop() == tag:
+                break
+
+    def _child_mode(self, tag, attributes):
+        parent = self._mode
+        if parent in (_LISTING, _RAW):
+            return parent
+        if tag == "script" and (attributes.get("type") or "").lower() == "application/ld+json":
+            return _JSON_LD
+        if tag in RAW_TAGS:
+            return _RAW
+        if _is_price_element(attributes):
+            return _PRICE
+        label = " ".join(attributes.get(name) or "" for name in ("id", "class", "aria-label"))
+        if LISTING_PATTERN.search(label):
+            return _LISTING
+        if tag in SKIPPED_TAGS or NOISE_PATTERN.search(label):
+            return _SKIP
+        return parent
+
+    def handle_starttag(self, tag, attrs):
+        attributes = dict(attrs)
+        if tag in VOID_TAGS:
+            # <meta itemprop="price" content="59.00">
+            if self._mode not in (_LISTING, _RAW) and (attributes.get("itemprop") or "").lower() in PRICE_ITEMPROPS and attributes.get("content"):
+                self.parts.append(attributes["content"].strip())
+                self.has_price = True
+            return
+        if self._open and self._open[-1] in IMPLIED_END_TAGS.get(tag, ()):
+            self._close(self._open[-1])
+        mode = self._child_mode(tag, attributes)
+        self._open.append(tag)
+        self._modes.append(mode)
+
+    def handle_startendtag(self, tag, attrs):
+        # Self-closing syntax (<div class="related"/>): the element is empty, so nothing is opened
+        if tag in VOID_TAGS:
+            self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag in self._open:
+            self._close(tag)
+
+    def handle_data(self, data):
+        mode = self._mode
+        if mode not in (_KEEP, _JSON_LD, _PRICE):
+            return
+        text = data.strip()
+        if not text:
+            return
+        self.parts.append(text)
+        if (mode == _PRICE and any(char.isdigit() for char in text)) or (mode == _JSON_LD and '"price"' in text) or PRICE_TEXT_PATTERN.search(text):
+            self.has_price = True
+
+
+def _fingerprint(html: str) -> Tuple[str, bool]:
+    """The page fingerprint (see page_fingerprint), and whether the fingerprinted content shows a price."""
+    parser = _FingerprintParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception as e:
+        logger.debug(f"Fingerprint parsing failed, hashing raw HTML: {e}")
+        return hashlib.sha256(html.encode("utf-8", "replace")).hexdigest(), False
+    normalized = re.sub(r"\s+", " ", " ".join(parser.parts))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest(), parser.has_price
+
+
+def page_fingerprint(html: str) -> str:
+    """
+    Hash the price-relevant content of a page.
+
+    Keeps JSON-LD and the visible text outside header/footer/nav/aside, scripts and
+    recommendation/review blocks, with whitespace collapsed, so markup churn (nonces, class
+    names, tracking attributes) and rotating carousels don't register as a change. Price-bearing
+    elements (itemprop price/offers, price or buy-box classes) are kept wherever they are, except
+    in blocks listing other products.
+    """
+    return _fingerprint(html)[0]
+
+
+class PageCheck:
+    """Outcome of a pre-check: whether the page is unchanged, and what to store after scraping."""
+
+    def __init__(self, url: str, unchanged: bool = False, html: Optional[str] = None, previous: Optional[ScrapedProductData] = None,
+                 etag: Optional[str] = None, last_modified: Optional[str] = None, fingerprint: Optional[str] = None):
+        self.url = url
+        self.unchanged = unchanged
+        self.html = html
+        self.previous = previous
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fingerprint = fingerprint
+
+
+class PageStateStore:
+    """
+    Remembers per URL the HTTP validators (ETag/Last-Modified), the content fingerprint and the
+    last successfully scraped ScrapedProductData, in SQLite.
+    """
+
+    def __init__(self, path: str = PAGE_STATE_PATH, max_age_hours: float = PRECHECK_MAX_AGE_HOURS):
+        """
+        Initialize the store, creating the SQLite file and table if needed.
+
+        Args:
+            path: Location of the SQLite database file.
+            max_age_hours: Stored results older than this are never reused, even if the page is
+                unchanged, since availability may be rendered client-side.
+        """
+        self.path = path
+        self.max_age = timedelta(hours=max_age_hours)
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The SQLite connection, opened on first use."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _load(self, url: str):
+        row = self.conn.execute(
+            "SELECT etag, last_modified, fingerprint, scraped_json, scraped_at FROM page_state WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, fingerprint, scraped_json, scraped_at = row
+        if datetime.now(timezone.utc) - datetime.fromisoformat(scraped_at) > self.max_age:
+            return None
+        return etag, last_modified, fingerprint, ScrapedProductData.model_validate_json(scraped_json)
+
+    def save(self, check: PageCheck, scraped_data: ScrapedProductData):
+        """Store the validators of a pre-check together with the freshly scraped result."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO page_state (url, etag, last_modified, fingerprint, scraped_json, scraped_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (check.url, check.etag, check.last_modified, check.fingerprint, scraped_data.model_dump_json(), datetime.now(timezone.utc).isoformat())
+            )
+
+    async def check(self, url: str) -> PageCheck:
+        """
+        Fetch the page with conditional headers and decide whether it changed since the last scrape.
+
+        A 304 response, or an identical fingerprint of HTML that shows a price, means unchanged,
+        and the previous result is returned in `previous`. HTML without a price (e.g. the shell of
+        a page rendered client-side) is never taken as unchanged. Otherwise the fetched HTML is
+        returned in `html` (if any) so it can be reused by the structured data extractor. Network
+        errors are treated as "changed", after retrying timeouts, connection errors and server
+        errors (HTTP_FETCH_ATTEMPTS).
+        """
+        stored = self._load(url)
+        headers = {"User-Agent": HTTP_USER_AGENT, "Accept": "text/html"}
+        if stored:
+            etag, last_modified, _, _ = stored
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        async def fetch() -> requests.Response:
+            with span("http_fetch"):
+                response = await asyncio.to_thread(requests.get, url, headers=headers, timeout=HTTP_TIMEOUT_SECONDS)
+            if response.status_code >= 500:
+                response.raise_for_status()
+            return response
+
+        try:
+            response = await retry_async(fetch, HTTP_FETCH_ATTEMPTS, {TIMEOUT, NETWORK}, f"Pre-check fetch of {url}")
+        except requests.exceptions.RequestException as e:
+            logger.info(f"Pre-check fetch failed for {url}: {e}")
+            return PageCheck(url)
+
+        if response.status_code == 304 and stored:
+            etag, last_modified, fingerprint, previous = stored
+            return PageCheck(url, unchanged=True, previous=previous, etag=etag, last_modified=last_modified, fingerprint=fingerprint)
+        if response.status_code != 200 or "html" not in response.headers.get("Content-Type", "text/html"):
+            return PageCheck(url)
+
+        html = response.text
+        fingerprint, has_price = _fingerprint(html)
+        check = PageCheck(url, html=html, etag=response.headers.get("ETag"), last_modified=response.headers.get("Last-Modified"), fingerprint=fingerprint)
+        # A shell without a price is the same on every fetch of a client-side rendered page, so
+        # it says nothing about the price
+        if stored and stored[2] == fingerprint and has_price:
+            check.unchanged = True
+            check.previous = stored[3]
+        return check
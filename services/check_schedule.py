@@ -0,0 +1,225 @@
+import logging
+import os
+import sqlite3
+import time
+from typing import List, Dict, Optional, Tuple
+
+from models.ScrapedProductData import ScrapedProductData
+from models.WishListItem import WishlistItem
+from models.TrackedItem import TrackedItem
+from config import (
+    CHECK_SCHEDULE_PATH, CHECK_MIN_INTERVAL_HOURS, CHECK_MAX_INTERVAL_HOURS, CHECK_NEAR_DEAL_RATIO,
+    CHECK_BUDGET_ITEMS, CHECK_BUDGET_TOKENS,
+)
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS check_schedule (
+    page_id TEXT PRIMARY KEY,
+    last_checked_at REAL NOT NULL,
+    last_changed_at REAL NOT NULL,
+    checks INTEGER NOT NULL,
+    changes INTEGER NOT NULL,
+    change_rate REAL NOT NULL,
+    avg_tokens REAL NOT NULL,
+    next_due_at REAL NOT NULL,
+    scraped_json TEXT NOT NULL
+);
+"""
+
+# Weight of the latest check in the exponentially weighted change rate
+CHANGE_RATE_WEIGHT = 0.3
+# Change rate assumed for an item after its first check, before anything is known about it
+INITIAL_CHANGE_RATE = 0.5
+# Runs started by cron drift by a few minutes; an item due within this window counts as due
+DUE_TOLERANCE_SECONDS = 3600
+
+
+class CheckSchedule:
+    """
+    Decides per item when it is worth checking again, stored in SQLite.
+
+    Every check updates the item's change rate (an exponentially weighted share of checks that saw
+    a different price or availability), the time of its last change and the tokens it cost. The
+    next check is due after an interval between CHECK_MIN_INTERVAL_HOURS (items that change on
+    every check) and CHECK_MAX_INTERVAL_HOURS (items that never change), but never later than half
+    the time since the price last changed, and right away for items within CHECK_NEAR_DEAL_RATIO
+    of their lowest price. The last result of every item is kept so items that aren't due can
+    still be shown in the email.
+    """
+
+    def __init__(self, path: str = CHECK_SCHEDULE_PATH, min_interval_hours: float = CHECK_MIN_INTERVAL_HOURS,
+                 max_interval_hours: float = CHECK_MAX_INTERVAL_HOURS, near_deal_ratio: float = CHECK_NEAR_DEAL_RATIO):
+        """
+        Initialize the schedule; the SQLite file is opened on first use.
+
+        Args:
+            path: Location of the SQLite database file.
+            min_interval_hours: Interval of the most volatile items.
+            max_interval_hours: Interval of items that never change.
+            near_deal_ratio: Items whose price is at most this fraction above their lowest price
+                get the minimum interval.
+        """
+        self.path = path
+        self.min_interval = min_interval_hours * 3600
+        self.max_interval = max(max_interval_hours, min_interval_hours) * 3600
+        self.near_deal_ratio = near_deal_ratio
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The SQLite connection, opened on first use."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _rows(self, page_ids: List[str]) -> Dict[str, Tuple]:
+        rows = {}
+        # Stay below SQLite's bound parameter limit
+        for start in range(0, len(page_ids), 500):
+            chunk = page_ids[start:start + 500]
+            rows.update((row[0], row) for row in self.conn.execute(
+                "SELECT page_id, next_due_at, avg_tokens, scraped_json FROM check_schedule "
+                f"WHERE page_id IN ({','.join('?' * len(chunk))})", chunk
+            ))
+        return rows
+
+    def _distance_from_low(self, item_data: TrackedItem, scraped_json: str) -> float:
+        lowest = item_data.lowest_price_so_far
+        price = ScrapedProductData.model_validate_json(scraped_json).price
+        if not lowest or price <= 0:
+            return float("inf")
+        return (price - lowest) / lowest
+
+    def plan(self, items_data: List[TrackedItem], budget_items: int = CHECK_BUDGET_ITEMS, budget_tokens: int = CHECK_BUDGET_TOKENS,
+             now: Optional[float] = None) -> Tuple[List[TrackedItem], List[WishlistItem]]:
+        """
+        Split the items into the ones to scrape in this run and the ones to skip.
+
+        Due items are taken in order of priority, until the item or token budget (0 for no limit)
+        is used up: items never checked before first, then those closest to their lowest price,
+        then the most overdue. Tokens are estimated from the item's earlier checks. Each item to
+        scrape gets its rank as its `priority`, so the scraper starts them in the same order.
+
+        Args:
+            items_data: Items as yielded by NotionLoader.load_items.
+            budget_items: Most items to scrape in this run.
+            budget_tokens: Most LLM tokens (estimated) to spend in this run.
+            now: Current time as a Unix timestamp, for testing.
+
+        Returns:
+            The items to scrape, and the last result of the skipped items that have one, with
+            their lowest price from Notion.
+        """
+        now = time.time() if now is None else now
+        rows = self._rows([item_data.page_id for item_data in items_data])
+        known_tokens = [row[2] for row in rows.values()]
+        default_tokens = sum(known_tokens) / len(known_tokens) if known_tokens else 0.0
+
+        due, skipped = [], []
+        for item_data in items_data:
+            row = rows.get(item_data.page_id)
+            if row is None:
+                due.append(((0, 0.0, 0.0), item_data, default_tokens))
+            elif row[1] <= now + DUE_TOLERANCE_SECONDS:
+                due.append(((1, self._distance_from_low(item_data, row[3]), row[1] - now), item_data, row[2]))
+            else:
+                skipped.append(item_data)
+        due.sort(key=lambda entry: entry[0])
+
+        to_scrape, spent_tokens = [], 0.0
+        for _, item_data, tokens in due:
+            over_items = budget_items and len(to_scrape) >= budget_items
+            over_tokens = budget_tokens and to_scrape and spent_tokens + tokens > budget_tokens
+            if over_items or over_tokens:
+                skipped.append(item_data)
+                continue
+            item_data.priority = len(to_scrape)
+            to_scrape.append(item_data)
+            spent_tokens += tokens
+
+        previous_items = self._previous_items(skipped, rows)
+        logger.info(
+            f"Check schedule: {len(to_scrape)} of {len(items_data)} item(s) due within budget "
+            f"(~{spent_tokens:.0f} tokens), {len(skipped)} skipped"
+        )
+        return to_scrape, previous_items
+
+    def _previous_items(self, items_data: List[TrackedItem], rows: Dict[str, Tuple]) -> List[WishlistItem]:
+        previous_items = []
+        for item_data in items_data:
+            row = rows.get(item_data.page_id)
+            if row is None:
+                continue
+            previous = ScrapedProductData.model_validate_json(row[3])
+            previous_items.append(WishlistItem(
+                **previous.model_dump(),
+                page_id=item_data.page_id,
+                lowest_price_so_far=item_data.lowest_price_so_far,
+                lowest_price_date=item_data.lowest_price_date,
+            ))
+        return previous_items
+
+    def last_results(self, items_data: List[TrackedItem]) -> List[WishlistItem]:
+        """
+        The last result of every item that was checked before, whether or not it is due.
+
+        Args:
+            items_data: Items as yielded by NotionLoader.load_items.
+
+        Returns:
+            The items' last results, with their lowest price from Notion.
+        """
+        return self._previous_items(items_data, self._rows([item_data.page_id for item_data in items_data]))
+
+    def _interval(self, change_rate: float, last_changed_at: float, item: WishlistItem, now: float) -> float:
+        interval = self.max_interval - (self.max_interval - self.min_interval) * change_rate
+        interval = min(interval, max(self.min_interval, (now - last_changed_at) / 2))
+        if item.lowest_price_so_far and 0 < item.price <= item.lowest_price_so_far * (1 + self.near_deal_ratio):
+            interval = self.min_interval
+        return interval
+
+    def record(self, item: WishlistItem, tokens: int = 0, now: Optional[float] = None):
+        """
+        Update an item's statistics after it was checked and schedule its next check.
+
+        Args:
+            item: The processed item, with its lowest price as known after this check.
+            tokens: LLM tokens this check used.
+            now: Current time as a Unix timestamp, for testing.
+        """
+        now = time.time() if now is None else now
+        row = self.conn.execute(
+            "SELECT last_changed_at, checks, changes, change_rate, avg_tokens, scraped_json FROM check_schedule WHERE page_id = ?",
+            (item.page_id,)
+        ).fetchone()
+        scraped = ScrapedProductData(**item.model_dump(include=set(ScrapedProductData.model_fields)))
+
+        if row is None:
+            last_changed_at, checks, changes, change_rate, avg_tokens = now, 1, 0, INITIAL_CHANGE_RATE, float(tokens)
+        else:
+            last_changed_at, checks, changes, change_rate, avg_tokens, scraped_json = row
+            previous_price = ScrapedProductData.model_validate_json(scraped_json).price
+            changed = abs(item.price - previous_price) >= 0.01
+            if changed:
+                last_changed_at = now
+                changes += 1
+            checks += 1
+            change_rate = (1 - CHANGE_RATE_WEIGHT) * change_rate + CHANGE_RATE_WEIGHT * (1.0 if changed else 0.0)
+            avg_tokens = (1 - CHANGE_RATE_WEIGHT) * avg_tokens + CHANGE_RATE_WEIGHT * tokens
+
+        next_due_at = now + self._interval(change_rate, last_changed_at, item, now)
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO check_schedule (page_id, last_checked_at, last_changed_at, checks, changes, change_rate, "
+                "avg_tokens, next_due_at, scraped_json) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (item.page_id, now, last_changed_at, checks, changes, change_rate, avg_tokens, next_due_at, scraped.model_dump_json())
+            )
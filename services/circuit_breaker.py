@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import os
+import random
+import re
+import sqlite3
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar
+
+from services.run_metrics import record_retry
+from config import (
+    CIRCUIT_BREAKER_PATH, CIRCUIT_BREAKER_FAILURE_THRESHOLD, CIRCUIT_BREAKER_COOLDOWN_HOURS, CIRCUIT_BREAKER_MAX_COOLDOWN_HOURS,
+    RETRY_BASE_DELAY_SECONDS, RETRY_MAX_DELAY_SECONDS,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Kinds of scrape failures
+TIMEOUT = "timeout"
+BOT_WALL = "bot_wall"  # Captcha, "access denied" or rate-limit page instead of the product
+PARSE = "parse"  # The page loaded, but no valid product could be extracted from it
+LLM = "llm"  # The LLM provider failed (rate limit, quota, server error)
+NETWORK = "network"  # Connection errors and 5xx responses
+CIRCUIT_OPEN = "circuit_open"  # Not attempted, the domain's circuit breaker is open
+OTHER = "other"
+
+# Failures that say the site is down or blocking us, rather than something about the LLM or our code.
+# PARSE is left out: it is about one product page (or the extraction), and is reported per item.
+SITE_FAILURES = {TIMEOUT, BOT_WALL, NETWORK}
+
+BOT_WALL_PATTERN = re.compile(
+    r"captcha|are you a robot|not a robot|access denied|unusual traffic|pardon our interruption|"
+    r"request blocked|just a moment\.\.\.|cf-chl|px-captcha|bot detection",
+    re.IGNORECASE,
+)
+LLM_ERROR_PATTERN = re.compile(r"rate.?limit|resource.?exhausted|quota|model ?provider|api key|model.{0,20}(overloaded|unavailable)", re.IGNORECASE)
+TIMEOUT_PATTERN = re.compile(r"timed? ?out|timeout", re.IGNORECASE)
+
+
+class ScrapeFailure(Exception):
+    """A scrape that failed in a known way; kind is one of the failure kinds above."""
+
+    def __init__(self, kind: str, message: str):
+        super().__init__(message)
+        self.kind = kind
+
+
+def classify_failure(error: BaseException) -> str:
+    """Sort an exception raised while scraping into a failure kind."""
+    if isinstance(error, ScrapeFailure):
+        return error.kind
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)) or "Timeout" in type(error).__name__:
+        return TIMEOUT
+    if type(error).__module__.startswith(("browser_use.llm", "google.genai", "google.api_core")):
+        return LLM
+    status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status_code, int):
+        if status_code in (401, 403, 429):
+            return BOT_WALL
+        if status_code >= 500:
+            return NETWORK
+        return OTHER
+    if isinstance(error, ConnectionError) or "net::ERR_" in str(error) or type(error).__name__ == "ConnectionError":
+        return NETWORK
+    # Includes pydantic's ValidationError and json.JSONDecodeError
+    if isinstance(error, ValueError):
+        return PARSE
+    return OTHER
+
+
+def classify_agent_history(history) -> str:
+    """Sort an Agent run that ended without a result into a failure kind, from its errors and extracted content."""
+    text = " ".join(str(part) for part in history.errors() + history.extracted_content() if part)
+    if BOT_WALL_PATTERN.search(text):
+        return BOT_WALL
+    if LLM_ERROR_PATTERN.search(text):
+        return LLM
+    if TIMEOUT_PATTERN.search(text):
+        return TIMEOUT
+    return PARSE
+
+
+def backoff_delay(attempt: int, base_delay: float = RETRY_BASE_DELAY_SECONDS, max_delay: float = RETRY_MAX_DELAY_SECONDS) -> float:
+    """Exponential backoff with jitter for the given (1-based) failed attempt, capped at max_delay."""
+    return min(max_delay, base_delay * 2 ** (attempt - 1)) + random.uniform(0, 0.5)
+
+
+async def retry_async(operation: Callable[[], Awaitable[T]], attempts: int, retry_on: Iterable[str], description: str) -> T:
+    """
+    Run an operation, retrying it with bounded backoff while it fails with one of the given kinds.
+
+    Args:
+        operation: Coroutine function to run; called again for every attempt.
+        attempts: Most attempts, including the first.
+        retry_on: Failure kinds (see classify_failure) worth another attempt.
+        description: What the operation does, for the log.
+
+    Raises:
+        The last exception, once attempts are used up or the failure isn't worth retrying.
+    """
+    retry_on = set(retry_on)
+    for attempt in range(1, max(1, attempts) + 1):
+        try:
+            return await operation()
+        except Exception as e:
+            kind = classify_failure(e)
+            if attempt >= attempts or kind not in retry_on:
+                raise
+            delay = backoff_delay(attempt)
+            logger.info(f"{description} failed ({kind}: {e}), retrying in {delay:.1f}s")
+            record_retry()
+            await asyncio.sleep(delay)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS circuit_breakers (
+    domain TEXT PRIMARY KEY,
+    consecutive_failures INTEGER NOT NULL,
+    trips INTEGER NOT NULL,
+    open_until REAL NOT NULL,
+    last_failure_kind TEXT,
+    last_failure_at REAL,
+    last_success_at REAL
+);
+"""
+
+
+class CircuitBreakers:
+    """
+    Per-domain circuit breakers for browser sessions (recipe replays and Agent runs), stored in SQLite.
+
+    A domain's breaker opens after CIRCUIT_BREAKER_FAILURE_THRESHOLD browser scrapes in a row
+    failed for site reasons (SITE_FAILURES), counted within and across runs. While it is open,
+    no browser session is started for the domain. After CIRCUIT_BREAKER_COOLDOWN_HOURS it lets a
+    single scrape through: a success closes it, a failure opens it again for twice as long, up to
+    CIRCUIT_BREAKER_MAX_COOLDOWN_HOURS. LLM errors don't count, since they aren't the site's fault,
+    and neither do parse failures, which are about a single page.
+    """
+
+    def __init__(self, path: str = CIRCUIT_BREAKER_PATH, failure_threshold: int = CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                 cooldown_hours: float = CIRCUIT_BREAKER_COOLDOWN_HOURS, max_cooldown_hours: float = CIRCUIT_BREAKER_MAX_COOLDOWN_HOURS):
+        """
+        Initialize the breakers; the SQLite file is opened on first use.
+
+        Args:
+            path: Location of the SQLite database file.
+            failure_threshold: Failures in a row that open a domain's breaker.
+            cooldown_hours: How long a breaker stays open after it first opened.
+            max_cooldown_hours: Longest a breaker stays open, however often it opened in a row.
+        """
+        self.path = path
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_seconds = cooldown_hours * 3600
+        self.max_cooldown_seconds = max(max_cooldown_hours, cooldown_hours) * 3600
+        self._conn: Optional[sqlite3.Connection] = None
+        # domain -> (consecutive_failures, trips, open_until), loaded on first use
+        self._states: Optional[Dict[str, Tuple[int, int, float]]] = None
+        # Domains whose breaker let a single trial scrape through that hasn't finished yet
+        self._probing: Set[str] = set()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The SQLite connection, opened on first use."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self._states = None
+
+    @property
+    def states(self) -> Dict[str, Tuple[int, int, float]]:
+        if self._states is None:
+            self._states = {
+                row[0]: (row[1], row[2], row[3])
+                for row in self.conn.execute("SELECT domain, consecutive_failures, trips, open_until FROM circuit_breakers")
+            }
+        return self._states
+
+    def allow(self, domain: str, now: Optional[float] = None) -> bool:
+        """
+        Whether a browser session may be started for the domain now.
+
+        Call record_success, record_failure or abandon after every allowed session, so a trial
+        scrape of a half-open breaker is finished.
+        """
+        now = time.time() if now is None else now
+        _, _, open_until = self.states.get(domain, (0, 0, 0.0))
+        if not open_until:
+            return True
+        if now < open_until or domain in self._probing:
+            return False
+        # Cooldown over: let one trial scrape through
+        self._probing.add(domain)
+        logger.info(f"Circuit breaker for {domain} is half-open, trying one scrape")
+        return True
+
+    def record_success(self, domain: str, now: Optional[float] = None):
+        """Close the domain's breaker after a successful browser scrape."""
+        self._probing.discard(domain)
+        if self.states.get(domain, (0, 0, 0.0)) == (0, 0, 0.0):
+            return
+        if self.states[domain][2]:
+            logger.info(f"Circuit breaker for {domain} closed after a successful scrape")
+        self.states[domain] = (0, 0, 0.0)
+        with self.conn:
+            self.conn.execute(
+                "UPDATE circuit_breakers SET consecutive_failures = 0, trips = 0, open_until = 0, last_success_at = ? WHERE domain = ?",
+                (time.time() if now is None else now, domain)
+            )
+
+    def abandon(self, domain: str):
+        """Note that an allowed browser scrape of the domain ended without an outcome, e.g. cancelled at shutdown."""
+        # A half-open breaker lets the next scrape try instead
+        self._probing.discard(domain)
+
+    def record_failure(self, domain: str, kind: str, now: Optional[float] = None):
+        """Count a failed browser scrape of the domain, opening its breaker if it keeps failing."""
+        was_probing = domain in self._probing
+        self._probing.discard(domain)
+        if kind not in SITE_FAILURES:
+            return
+        now = time.time() if now is None else now
+        failures, trips, open_until = self.states.get(domain, (0, 0, 0.0))
+        failures += 1
+        if was_probing or failures >= self.failure_threshold:
+            trips += 1
+            cooldown = min(self.max_cooldown_seconds, self.cooldown_seconds * 2 ** (trips - 1))
+            open_until = now + cooldown
+            logger.warning(
+                f"Circuit breaker for {domain} opened after {failures} failed scrape(s) in a row (last: {kind}); "
+                f"no browser sessions for {cooldown / 3600:.1f}h"
+            )
+        self.states[domain] = (failures, trips, open_until)
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO circuit_breakers (domain, consecutive_failures, trips, open_until, last_failure_kind, last_failure_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(domain) DO UPDATE SET consecutive_failures = excluded.consecutive_failures, "
+                "trips = excluded.trips, open_until = excluded.open_until, last_failure_kind = excluded.last_failure_kind, "
+                "last_failure_at = excluded.last_failure_at",
+                (domain, failures, trips, open_until, kind, now)
+            )
+
+    def open_domains(self) -> List[str]:
+        """The domains whose breaker is open (or half-open), for the run report."""
+        return sorted(domain for domain, (_, _, open_until) in self.states.items() if open_until)
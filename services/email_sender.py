@@ -1,100 +1,258 @@
 import smtplib
 import logging
+import time
+from email.mime.image import MIMEImage
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import List
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+from functools import lru_cache
+from typing import List, Dict, Optional
+from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
 import os
 
 from models.WishListItem import WishlistItem
-from config import SENDER_EMAIL, SENDER_PASSWORD, RECIPIENT_EMAIL, SMTP_SERVER, SMTP_PORT
+from config import SENDER_EMAIL, SENDER_PASSWORD, RECIPIENT_EMAIL, SMTP_SERVER, SMTP_PORT, SMTP_MESSAGES_PER_MINUTE
 
 logger = logging.getLogger(__name__)
 
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), '../templates')
+
+
+@lru_cache(maxsize=1)
+def email_template() -> Template:
+    """The compiled email template, loaded once per process and reused for every recipient."""
+    env = Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        autoescape=select_autoescape(['html', 'xml'])
+    )
+    return env.get_template('email_template.html')
+
+def render_email(items: List[WishlistItem], recipient_name: Optional[str] = None, image_srcs: Optional[Dict[str, str]] = None) -> str:
+    """
+    Formats the list of WishlistItems into an HTML email body.
+
+    Needs no SMTP configuration, so the email can be previewed (see `main.py render-email`).
+
+    Args:
+        items: The items to show.
+        recipient_name: Name to greet the recipient with, if known.
+        image_srcs: Image URLs mapped to the src to use instead ("cid:..." for inline thumbnails,
+            "" for broken images, which get a placeholder).
+    """
+    # Split off items with price -1.0 (unavailable) before rendering, in one pass over the items
+    available_items, unavailable_items = [], []
+    for item in items:
+        if item.price > 0.0:
+            available_items.append(item)
+        elif item.price == -1.0:
+            unavailable_items.append(item)
+    try:
+        return email_template().render(
+            available_items=available_items,
+            unavailable_items=unavailable_items,
+            recipient_name=recipient_name,
+            image_srcs=image_srcs or {}
+        )
+    except Exception as e:
+        logger.error(f"Error loading or rendering email template: {e}")
+        # Fallback to a simple text representation if template fails
+        fallback_content = "<h1>Price Tracking Update</h1>"
+        fallback_content += "<h2>Available Items:</h2><ul>"
+        for item in available_items:
+            fallback_content += f"<li>{item.name} - Price: {item.price}, Discount: {item.discount}% <a href='{item.url}'>Link</a></li>"
+        fallback_content += "</ul>"
+        fallback_content += "<h2>Unavailable Items:</h2><ul>"
+        for item in unavailable_items:
+             fallback_content += f"<li>{item.name} - <a href='{item.url}'>Link</a></li>"
+        fallback_content += "</ul>"
+        return fallback_content
+
+
 class EmailSender:
-    """Handles sending emails using SMTP."""
+    """
+    Handles sending emails using SMTP.
+
+    All messages of a run go out over one authenticated connection, opened on the first message
+    and reopened if the server drops it, at most SMTP_MESSAGES_PER_MINUTE per minute. Use it as a
+    context manager (or call close()) to log out. Sending blocks, including the pauses between
+    messages, so async code should run it in a thread (see main.send_digests).
+    """
 
-    def __init__(self):
-        """Initialize the EmailSender."""
+    def __init__(self, messages_per_minute: float = SMTP_MESSAGES_PER_MINUTE):
+        """
+        Initialize the EmailSender.
+
+        Args:
+            messages_per_minute: Most messages sent per minute, to stay under the provider's limits.
+        """
         self.sender_email = SENDER_EMAIL
         self.sender_password = SENDER_PASSWORD
         self.recipient_email = RECIPIENT_EMAIL
         self.smtp_server = SMTP_SERVER
         self.smtp_port = SMTP_PORT
+        self.min_interval = 60.0 / messages_per_minute if messages_per_minute > 0 else 0.0
+        self._server: Optional[smtplib.SMTP] = None
+        self._last_sent_at: Optional[float] = None
+        # Thumbnail bytes by path, read once and attached to every message that shows them
+        self._thumbnail_bytes: Dict[str, bytes] = {}
 
-        if not all([self.sender_email, self.sender_password, self.recipient_email, self.smtp_server, self.smtp_port]):
-            raise ValueError("Email configuration (sender, password, recipient, server, port) is not fully set in environment variables.")
+        if not all([self.sender_email, self.sender_password, self.smtp_server, self.smtp_port]):
+            raise ValueError("Email configuration (sender, password, server, port) is not fully set in environment variables.")
 
-        # Set up Jinja2 environment
-        template_dir = os.path.join(os.path.dirname(__file__), '../templates')
-        self.env = Environment(
-            loader=FileSystemLoader(template_dir),
-            autoescape=select_autoescape(['html', 'xml'])
-        )
+    def __enter__(self) -> "EmailSender":
+        return self
 
-    def _format_html_content(self, items: List[WishlistItem]) -> str:
-        """Formats the list of WishlistItems into an HTML email body."""
-        try:
-            template = self.env.get_template('email_template.html')
-            # Filter out items with price -1.0 (unavailable) before rendering
-            available_items = [item for item in items if item.price > 0.0]
-            unavailable_items = [item for item in items if item.price == -1.0]
-            html_content = template.render(
-                available_items=available_items,
-                unavailable_items=unavailable_items,
-                recipient_email=self.recipient_email # Optional: Personalize if needed
-            )
-            return html_content
-        except Exception as e:
-            logger.error(f"Error loading or rendering email template: {e}")
-            # Fallback to a simple text representation if template fails
-            fallback_content = "<h1>Price Tracking Update</h1>"
-            fallback_content += "<h2>Available Items:</h2><ul>"
-            for item in available_items:
-                fallback_content += f"<li>{item.name} - Price: {item.price}, Discount: {item.discount}% <a href='{item.url}'>Link</a></li>"
-            fallback_content += "</ul>"
-            fallback_content += "<h2>Unavailable Items:</h2><ul>"
-            for item in unavailable_items:
-                 fallback_content += f"<li>{item.name} - <a href='{item.url}'>Link</a></li>"
-            fallback_content += "</ul>"
-            return fallback_content
-
-
-    def send_email(self, subject: str, items: List[WishlistItem]):
-        """
-        Sends an email with the provided subject and list of items.
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
-        Args:
-            subject: The subject line of the email.
-            items: A list of WishlistItem objects to include in the email body.
-        """
-        if not items:
-            logger.info("No items to send in the email.")
+    def _format_html_content(self, items: List[WishlistItem], recipient_name: Optional[str] = None, image_srcs: Optional[Dict[str, str]] = None) -> str:
+        """Formats the list of WishlistItems into an HTML email body (see render_email)."""
+        return render_email(items, recipient_name, image_srcs)
+
+    def _connect(self) -> smtplib.SMTP:
+        """Return the open SMTP connection, connecting and logging in first if needed."""
+        if self._server is None:
+            logger.info(f"Connecting to SMTP server {self.smtp_server}:{self.smtp_port}")
+            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+            try:
+                server.starttls()  # Secure the connection
+                logger.info("Logging into SMTP server")
+                server.login(self.sender_email, self.sender_password)
+            except Exception:
+                server.close()
+                raise
+            self._server = server
+        return self._server
+
+    def close(self):
+        """Log out and close the SMTP connection, if one is open."""
+        if self._server is None:
             return
+        try:
+            self._server.quit()
+        except (smtplib.SMTPException, OSError):
+            self._server.close()
+        self._server = None
+
+    def _wait_for_rate_limit(self):
+        if self._last_sent_at is not None:
+            delay = self._last_sent_at + self.min_interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        self._last_sent_at = time.monotonic()
+
+    def _deliver(self, recipient_email: str, message: str):
+        """Send one message over the shared connection, reconnecting once if the server dropped it."""
+        self._wait_for_rate_limit()
+        try:
+            self._connect().sendmail(self.sender_email, recipient_email, message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError) as e:
+            logger.warning(f"SMTP connection lost ({e}), reconnecting")
+            self.close()
+            self._connect().sendmail(self.sender_email, recipient_email, message)
 
-        html_body = self._format_html_content(items)
+    def _build_message(self, subject: str, recipient_email: str, items: List[WishlistItem], recipient_name: Optional[str], thumbnails: Dict[str, str]) -> str:
+        """Render a recipient's email, with the thumbnails of their items attached as inline (CID) parts."""
+        image_srcs: Dict[str, str] = {}
+        inline_images: Dict[str, str] = {}
+        for item in items:
+            path = thumbnails.get(item.image_url)
+            if path is None:
+                continue
+            if path:
+                content_id = os.path.splitext(os.path.basename(path))[0][:32] + "@price-tracker"
+                inline_images[content_id] = path
+                image_srcs[item.image_url] = f"cid:{content_id}"
+            else:
+                image_srcs[item.image_url] = ""
 
-        message = MIMEMultipart("alternative")
+        html_part = MIMEText(self._format_html_content(items, recipient_name, image_srcs), "html")
+        if inline_images:
+            message = MIMEMultipart("related")
+            body = MIMEMultipart("alternative")
+            body.attach(html_part)
+            message.attach(body)
+            for content_id, path in inline_images.items():
+                if path not in self._thumbnail_bytes:
+                    with open(path, "rb") as f:
+                        self._thumbnail_bytes[path] = f.read()
+                image_part = MIMEImage(self._thumbnail_bytes[path], "jpeg")
+                image_part.add_header("Content-ID", f"<{content_id}>")
+                image_part.add_header("Content-Disposition", "inline", filename=os.path.basename(path))
+                message.attach(image_part)
+        else:
+            message = MIMEMultipart("alternative")
+            # Attach the HTML part
+            message.attach(html_part)
         message["Subject"] = subject
         message["From"] = self.sender_email
-        message["To"] = self.recipient_email
+        message["To"] = recipient_email
+        return message.as_string()
 
-        # Attach the HTML part
-        message.attach(MIMEText(html_body, "html"))
+    def send_digests(self, subject: str, digests: Dict[str, List[WishlistItem]], names: Optional[Dict[str, str]] = None,
+                     thumbnails: Optional[Dict[str, str]] = None) -> List[str]:
+        """
+        Send each recipient an email with their own items, over one connection.
 
-        try:
-            logger.info(f"Connecting to SMTP server {self.smtp_server}:{self.smtp_port}")
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()  # Secure the connection
-                logger.info("Logging into SMTP server")
-                server.login(self.sender_email, self.sender_password)
-                logger.info(f"Sending email to {self.recipient_email}")
-                server.sendmail(self.sender_email, self.recipient_email, message.as_string())
+        Args:
+            subject: The subject line of the emails.
+            digests: Items to include, by recipient email address. Recipients without items are skipped.
+            names: Optional display names by email address, used to greet the recipient.
+            thumbnails: Thumbnail paths by image URL ("" for broken images), as returned by
+                ThumbnailCache.prepare. Other images are linked from the retailer.
+
+        Returns:
+            The addresses whose email was handed to the SMTP server.
+        """
+        if not all(digests):
+            raise ValueError("A recipient email address (RECIPIENT_EMAIL or RECIPIENTS_FILE) is not set.")
+        names = names or {}
+        thumbnails = thumbnails or {}
+        sent = []
+        for recipient_email, items in digests.items():
+            if not items:
+                logger.info(f"No items to send in the email to {recipient_email}.")
+                continue
+
+            try:
+                message = self._build_message(subject, recipient_email, items, names.get(recipient_email), thumbnails)
+                logger.info(f"Sending email to {recipient_email}")
+                self._deliver(recipient_email, message)
                 logger.info("Email sent successfully")
-        except smtplib.SMTPAuthenticationError:
-            logger.error("SMTP Authentication Error: Check sender email and password.")
-        except smtplib.SMTPConnectError:
-             logger.error(f"SMTP Connection Error: Could not connect to {self.smtp_server}:{self.smtp_port}.")
-        except Exception as e:
-            logger.error(f"Failed to send email: {e}")
+                sent.append(recipient_email)
+            except smtplib.SMTPAuthenticationError:
+                logger.error("SMTP Authentication Error: Check sender email and password.")
+                break
+            except smtplib.SMTPConnectError as e:
+                logger.error(f"SMTP Connection Error: Could not connect to {self.smtp_server}:{self.smtp_port}: {e}")
+                break
+            # SMTPException subclasses OSError, so the server's answers about this one message are
+            # handled before connection errors: they don't stop the other recipients' digests
+            except smtplib.SMTPRecipientsRefused:
+                logger.error(f"SMTP server refused recipient {recipient_email}.")
+            except smtplib.SMTPResponseException as e:
+                logger.error(f"SMTP server rejected the email to {recipient_email}: {e.smtp_code} {e.smtp_error!r}")
+            except OSError as e:
+                logger.error(f"SMTP Connection Error: Lost the connection to {self.smtp_server}:{self.smtp_port}: {e}")
+                break
+            except Exception as e:
+                logger.error(f"Failed to send email to {recipient_email}: {e}")
+                self.close()
+        return sent
+
+    def send_email(self, subject: str, items: List[WishlistItem]) -> bool:
+        """
+        Sends an email with the provided subject and list of items to RECIPIENT_EMAIL.
 
+        Args:
+            subject: The subject line of the email.
+            items: A list of WishlistItem objects to include in the email body.
+
+        Returns:
+            True if the email was handed to the SMTP server, False otherwise.
+        """
+        if not self.recipient_email:
+            raise ValueError("RECIPIENT_EMAIL is not set in environment variables.")
+        try:
+            return bool(self.send_digests(subject, {self.recipient_email: items}))
+        finally:
+            self.close()
@@ -0,0 +1,441 @@
+import json
+import logging
+import os
+import re
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+from urllib.parse import urlparse
+
+from playwright.async_api import async_playwright, BrowserContext
+
+from models.ScrapedProductData import ScrapedProductData
+from services.structured_data_extractor import parse_price, matches_preferred_size
+from services.run_metrics import span
+from config import RECIPE_STORE_PATH, BROWSER_NAVIGATION_TIMEOUT_MS, HTTP_USER_AGENT, PREFERRED_BOTTOM_SIZE, PREFERRED_SHOE_SIZE, PREFERRED_TOP_SIZE
+
+logger = logging.getLogger(__name__)
+
+MAX_RECIPE_STEPS = 10
+STEP_TIMEOUT_MS = 3000
+
+# Builds a CSS selector for an element, preferring stable attributes over dynamic ids/classes
+SELECTOR_FOR_JS = """
+(el) => {
+    const unique = (sel) => { try { return document.querySelectorAll(sel).length === 1; } catch (e) { return false; } };
+    for (const attr of ['itemprop', 'data-testid', 'data-test', 'data-qa']) {
+        const value = el.getAttribute(attr);
+        if (value) {
+            const sel = `${el.tagName.toLowerCase()}[${attr}="${value.replace(/"/g, '\\\\"')}"]`;
+            if (unique(sel)) return sel;
+        }
+    }
+    const parts = [];
+    let node = el;
+    while (node && node.nodeType === 1 && node !== document.body) {
+        if (node.id && !/\\d/.test(node.id)) {
+            parts.unshift(`#${CSS.escape(node.id)}`);
+            if (unique(parts.join(' > '))) return parts.join(' > ');
+        } else {
+            const classes = [...node.classList].filter(c => !/\\d/.test(c)).slice(0, 2);
+            parts.unshift(node.tagName.toLowerCase() + classes.map(c => '.' + CSS.escape(c)).join(''));
+            if (unique(parts.join(' > '))) return parts.join(' > ');
+        }
+        node = node.parentElement;
+    }
+    return parts.length ? parts.join(' > ') : null;
+}
+"""
+
+# Locates the elements holding the Agent's extracted values and returns selectors for them
+LEARN_SELECTORS_JS = """
+([price, originalPrice, name, imageUrl]) => {
+    const selectorFor = %s;
+    const isVisible = (el) => { const r = el.getBoundingClientRect(); return r.width > 0 && r.height > 0; };
+    const numbersIn = (text) => {
+        const cleaned = text.replace(/[^\\d.,]/g, '');
+        if (!/\\d/.test(cleaned)) return [];
+        return [parseFloat(cleaned.replace(/,/g, '')), parseFloat(cleaned.replace(/\\./g, '').replace(',', '.'))];
+    };
+    const findPrice = (target) => {
+        if (!target || target <= 0) return null;
+        let best = null, bestSize = 0;
+        for (const el of document.body.querySelectorAll('*')) {
+            if (['SCRIPT', 'STYLE', 'NOSCRIPT'].includes(el.tagName) || !isVisible(el)) continue;
+            const text = (el.innerText || '').trim();
+            if (!text || text.length > 30) continue;
+            if (!numbersIn(text).some(v => Math.abs(v - target) < 0.01)) continue;
+            const size = parseFloat(getComputedStyle(el).fontSize) || 0;
+            if (size >= bestSize) { best = el; bestSize = size; }
+        }
+        return best ? selectorFor(best) : null;
+    };
+    const findName = () => {
+        const wanted = (name || '').trim().toLowerCase();
+        if (!wanted) return null;
+        const candidates = [...document.querySelectorAll('h1'), ...document.body.querySelectorAll('*')];
+        const match = candidates.find(el => isVisible(el) && (el.innerText || '').trim().toLowerCase() === wanted)
+            || [...document.querySelectorAll('h1')].find(el => (el.innerText || '').toLowerCase().includes(wanted));
+        return match ? selectorFor(match) : null;
+    };
+    const findImage = () => {
+        if (!imageUrl) return null;
+        let path = imageUrl;
+        try { path = new URL(imageUrl).pathname; } catch (e) {}
+        const match = [...document.images].find(img => img.currentSrc === imageUrl || img.src === imageUrl || (path.length > 1 && (img.currentSrc || img.src).includes(path)));
+        return match ? selectorFor(match) : null;
+    };
+    return {
+        name_selector: findName(),
+        price_selector: findPrice(price),
+        original_price_selector: findPrice(originalPrice),
+        image_selector: findImage(),
+    };
+}
+""" % SELECTOR_FOR_JS.strip()
+
+READ_VALUES_JS = """
+(recipe) => {
+    const text = (sel) => { const el = sel && document.querySelector(sel); return el ? (el.innerText || el.textContent || '').trim() : null; };
+    const image = () => {
+        const el = recipe.image_selector && document.querySelector(recipe.image_selector);
+        if (el) return el.currentSrc || el.src || el.getAttribute('content') || '';
+        const og = document.querySelector('meta[property="og:image"]');
+        return og ? og.content : '';
+    };
+    return {
+        name: text(recipe.name_selector),
+        price: text(recipe.price_selector),
+        original_price: text(recipe.original_price_selector),
+        image_url: image(),
+    };
+}
+"""
+
+SIZE_AVAILABLE_JS = """
+(el) => {
+    const target = el.closest('button, label, li, a, option, [role]') || el;
+    const marker = `${el.getAttribute('class') || ''} ${target.getAttribute('class') || ''}`.toLowerCase();
+    return !(el.disabled || target.disabled || target.getAttribute('aria-disabled') === 'true'
+        || /disabled|unavailable|sold-?out|out-?of-?stock/.test(marker));
+}
+"""
+
+# Whether the page shows a size picker: a visible select, radio group or list labelled as sizes
+# with at least two choices
+SIZE_PICKER_JS = """
+() => {
+    const label = (el) => `${el.id || ''} ${el.getAttribute('class') || ''} ${el.getAttribute('name') || ''} ${el.getAttribute('aria-label') || ''} ${el.getAttribute('data-testid') || ''}`;
+    for (const el of document.querySelectorAll('select, fieldset, [role=radiogroup], [role=listbox], ul, div')) {
+        if (!/size/i.test(label(el))) continue;
+        const r = el.getBoundingClientRect();
+        if (!r.width || !r.height) continue;
+        if (el.querySelectorAll('option, button, label, li, [role=radio], [role=option]').length >= 2) return true;
+    }
+    return false;
+}
+"""
+
+
+def _recipe_key(url: str) -> str:
+    """Recipes are stored per domain, ignoring a leading 'www.'."""
+    host = urlparse(url).netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def _url_pattern(url: str) -> str:
+    """Derive a path pattern from the first path segment, e.g. '^/products/' for '/products/abc'."""
+    segments = [segment for segment in urlparse(url).path.split("/") if segment]
+    if len(segments) > 1:
+        return f"^/{re.escape(segments[0])}/"
+    return "^/"
+
+
+class RecipeStore:
+    """
+    Persists learned per-domain extraction recipes as a JSON file.
+
+    A recipe holds the steps the Agent took (cookie banners, size selection), the CSS selectors
+    of the name, price and hero image, and whether the page had a size picker, so later runs can
+    replay them without the LLM.
+    """
+
+    def __init__(self, path: str = RECIPE_STORE_PATH):
+        """
+        Initialize the recipe store.
+
+        Args:
+            path: Location of the JSON file recipes are read from and written to.
+        """
+        self.path = path
+        self._recipes: Optional[Dict[str, List[Dict[str, Any]]]] = None
+        self._lock = asyncio.Lock()
+
+    def _load(self) -> Dict[str, List[Dict[str, Any]]]:
+        if self._recipes is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._recipes = json.load(f)
+            except FileNotFoundError:
+                self._recipes = {}
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not read recipe store {self.path}: {e}. Starting empty.")
+                self._recipes = {}
+        return self._recipes
+
+    def _write(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._recipes, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        """Return the recipe whose domain and path pattern match the URL, if any."""
+        path = urlparse(url).path or "/"
+        for recipe in self._load().get(_recipe_key(url), []):
+            if re.match(recipe.get("url_pattern", "^/"), path):
+                return recipe
+        return None
+
+    async def save(self, url: str, recipe: Dict[str, Any]):
+        """Store a recipe for the URL's domain, replacing one with the same path pattern."""
+        async with self._lock:
+            recipes = self._load().setdefault(_recipe_key(url), [])
+            recipes[:] = [r for r in recipes if r.get("url_pattern") != recipe["url_pattern"]]
+            recipes.append(recipe)
+            # Most specific patterns first so get() prefers them over the '^/' catch-all
+            recipes.sort(key=lambda r: len(r.get("url_pattern", "")), reverse=True)
+            self._write()
+
+    async def discard(self, url: str):
+        """Drop the recipe matching the URL, so the next Agent run re-learns it."""
+        recipe = self.get(url)
+        if recipe is None:
+            return
+        async with self._lock:
+            recipes = self._load().get(_recipe_key(url), [])
+            recipes[:] = [r for r in recipes if r is not recipe]
+            self._write()
+
+
+@asynccontextmanager
+async def _open_page(url: str, browser_context: Optional[BrowserContext] = None):
+    """Open the URL in a new page of the given context, or in a freshly launched headless Chromium."""
+    if browser_context is not None:
+        page = await browser_context.new_page()
+        try:
+            with span("browser_navigation"):
+                await page.goto(url, wait_until="domcontentloaded", timeout=BROWSER_NAVIGATION_TIMEOUT_MS)
+            yield page
+        finally:
+            await page.close()
+        return
+
+    async with async_playwright() as playwright:
+        with span("browser_launch"):
+            browser = await playwright.chromium.launch(headless=True)
+        try:
+            context = await browser.new_context(user_agent=HTTP_USER_AGENT)
+            page = await context.new_page()
+            with span("browser_navigation"):
+                await page.goto(url, wait_until="domcontentloaded", timeout=BROWSER_NAVIGATION_TIMEOUT_MS)
+            yield page
+        finally:
+            await browser.close()
+
+
+def _steps_from_history(history) -> List[Dict[str, Any]]:
+    """Turn the clicks and dropdown selections of an AgentHistoryList into replayable steps."""
+    steps = []
+    size_step = None
+    for action in history.model_actions():
+        element = action.get("interacted_element")
+        action_name = next((key for key in action if key != "interacted_element"), None)
+        if element is None or action_name is None:
+            continue
+
+        params = action.get(action_name) or {}
+        xpath = getattr(element, "x_path", None) or getattr(element, "xpath", None)
+        attributes = getattr(element, "attributes", None) or {}
+        text = (params.get("text") or getattr(element, "ax_name", None) or attributes.get("aria-label")
+                or attributes.get("value") or attributes.get("data-size") or "").strip()
+        if not xpath:
+            continue
+
+        if "select_dropdown" in action_name:
+            size_step = {'action': 'select_size', 'kind': 'dropdown', 'xpath': xpath, 'text': text}
+        elif "click" in action_name:
+            if text and matches_preferred_size(text):
+                size_step = {'action': 'select_size', 'kind': 'click', 'xpath': xpath, 'text': text}
+            else:
+                steps.append({'action': 'click', 'xpath': xpath, 'text': text})
+
+    steps = steps[:MAX_RECIPE_STEPS]
+    if size_step:
+        steps.append(size_step)
+    return steps
+
+
+def _xpath_locator(page, xpath: str):
+    return page.locator(f"xpath={xpath if xpath.startswith('/') else '/' + xpath}")
+
+
+async def _select_size(page, step: Dict[str, Any]) -> Optional[bool]:
+    """
+    Select the preferred size on the page.
+
+    Returns:
+        True if the size is available, False if it is disabled/sold out, None if it could not be found.
+    """
+    texts = [step['text']] + [size for size in (PREFERRED_SHOE_SIZE, PREFERRED_TOP_SIZE, PREFERRED_BOTTOM_SIZE) if size and size != step['text']]
+
+    if step['kind'] == 'dropdown':
+        select = _xpath_locator(page, step['xpath'])
+        if await select.count() == 0:
+            return None
+        for text in texts:
+            option = select.locator("option").filter(has_text=re.compile(rf"^\s*{re.escape(text)}\s*$", re.IGNORECASE))
+            if await option.count():
+                if not await option.first.evaluate(SIZE_AVAILABLE_JS):
+                    return False
+                await select.select_option(label=(await option.first.inner_text()).strip(), timeout=STEP_TIMEOUT_MS)
+                return True
+        return None
+
+    for text in texts:
+        for candidate in await page.get_by_text(text, exact=True).all():
+            if await candidate.is_visible():
+                if not await candidate.evaluate(SIZE_AVAILABLE_JS):
+                    return False
+                await candidate.click(timeout=STEP_TIMEOUT_MS)
+                return True
+
+    recorded = _xpath_locator(page, step['xpath'])
+    if await recorded.count() and await recorded.first.is_visible():
+        if not await recorded.first.evaluate(SIZE_AVAILABLE_JS):
+            return False
+        await recorded.first.click(timeout=STEP_TIMEOUT_MS)
+        return True
+    return None
+
+
+async def _run_steps(page, steps: List[Dict[str, Any]]) -> Optional[bool]:
+    """Replay recipe steps. Returns the size availability (True when no size step), or None on failure."""
+    size_available = True
+    for step in steps:
+        if step['action'] == 'select_size':
+            size_available = await _select_size(page, step)
+            if size_available is None:
+                return None
+        else:
+            # Banner/tab clicks are best effort; the page may simply not show them this time
+            try:
+                await _xpath_locator(page, step['xpath']).first.click(timeout=STEP_TIMEOUT_MS)
+            except Exception:
+                logger.debug(f"Optional recipe step skipped: {step}")
+    await page.wait_for_timeout(500)
+    return size_available
+
+
+def _has_size_step(steps: List[Dict[str, Any]]) -> bool:
+    return any(step.get('action') == 'select_size' for step in steps)
+
+
+async def replay_recipe(url: str, recipe: Dict[str, Any], browser_context: Optional[BrowserContext] = None) -> Optional[ScrapedProductData]:
+    """
+    Replay a learned recipe with plain Playwright and validate the extracted values.
+
+    Args:
+        url: The product page URL.
+        recipe: A recipe previously returned by learn_recipe.
+        browser_context: Pooled browser context to use; a browser is launched if omitted.
+
+    Recipes are shared by the products of a domain and path, so a recipe learned on a product
+    without sizes may be replayed on one with sizes. It then can't tell whether the preferred size
+    is available, and the replay fails so the Agent handles the page.
+
+    Returns:
+        The extracted product, or None if the replay failed validation.
+    """
+    steps = recipe.get("steps", [])
+    try:
+        async with _open_page(url, browser_context) as page:
+            size_available = await _run_steps(page, steps)
+            if size_available is None:
+                logger.info(f"Recipe replay for {url} could not find the size selector")
+                return None
+            if not _has_size_step(steps) and await page.evaluate(SIZE_PICKER_JS):
+                logger.info(f"Recipe for {url} has no size step, but the page shows a size picker")
+                return None
+            values = await page.evaluate(READ_VALUES_JS, recipe)
+    except Exception as e:
+        logger.info(f"Recipe replay failed for {url}: {e}")
+        return None
+
+    name = (values.get("name") or "").strip()
+    price = parse_price(values.get("price"))
+    if not name or (size_available and (price is None or price <= 0)):
+        logger.info(f"Recipe replay for {url} failed validation: {values}")
+        return None
+
+    if not size_available:
+        return ScrapedProductData(name=name, url=url, price=-1.0, discount=0.0, image_url=values.get("image_url") or "")
+
+    original_price = parse_price(values.get("original_price"))
+    discount = 0.0
+    if original_price and original_price > price:
+        discount = round((original_price - price) / original_price * 100, 1)
+    return ScrapedProductData(name=name, url=url, price=price, discount=discount, image_url=values.get("image_url") or "")
+
+
+async def learn_recipe(url: str, history, scraped_data: ScrapedProductData, browser_context: Optional[BrowserContext] = None) -> Optional[Dict[str, Any]]:
+    """
+    Derive a recipe from a successful Agent run and verify it by replaying it once.
+
+    Args:
+        url: The product page URL the Agent processed.
+        history: The AgentHistoryList returned by Agent.run().
+        scraped_data: The product data the Agent extracted.
+        browser_context: Pooled browser context to use; a browser is launched if omitted.
+
+    Returns:
+        The recipe if the replay reproduces the Agent's price, otherwise None.
+    """
+    if scraped_data.price <= 0:
+        # Nothing on the page to anchor a price selector to
+        return None
+
+    original_price = None
+    if scraped_data.discount > 0:
+        original_price = round(scraped_data.price / (1 - scraped_data.discount / 100), 2)
+
+    try:
+        steps = _steps_from_history(history)
+        async with _open_page(url, browser_context) as page:
+            if await _run_steps(page, steps) is None:
+                return None
+            has_size_selector = await page.evaluate(SIZE_PICKER_JS)
+            selectors = await page.evaluate(LEARN_SELECTORS_JS, [scraped_data.price, original_price, scraped_data.name, scraped_data.image_url])
+    except Exception as e:
+        logger.info(f"Could not learn recipe for {url}: {e}")
+        return None
+
+    if not selectors.get("price_selector") or not selectors.get("name_selector"):
+        logger.info(f"Could not locate price/name elements for recipe on {url}")
+        return None
+
+    recipe = {
+        'url_pattern': _url_pattern(url),
+        'steps': steps,
+        'has_size_selector': has_size_selector,
+        **selectors,
+        'learned_at': datetime.now().isoformat(timespec="seconds"),
+    }
+
+    replayed = await replay_recipe(url, recipe, browser_context)
+    if replayed is None or abs(replayed.price - scraped_data.price) > 0.01:
+        logger.info(f"Learned recipe for {url} did not reproduce the Agent's price, discarding")
+        return None
+    return recipe
@@ -0,0 +1,213 @@
+import asyncio
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import time
+from typing import List, Dict, Optional, Iterable
+
+import httpx
+from PIL import Image
+
+from config import THUMBNAIL_CACHE_DIR, THUMBNAIL_SIZE_PX, THUMBNAIL_RECHECK_HOURS, IMAGE_FETCH_CONCURRENCY, HTTP_TIMEOUT_SECONDS, HTTP_USER_AGENT
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS thumbnails (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    digest TEXT,
+    checked_at REAL NOT NULL
+);
+"""
+
+# Images larger than this are not downloaded; the email links them instead
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+JPEG_QUALITY = 80
+# Statuses that say the image is gone; other errors (timeouts, 401/403, 5xx) may be passing or
+# specific to us, so those images are still linked
+MISSING_STATUSES = {404, 410}
+
+
+def is_missing(response: httpx.Response) -> bool:
+    """Whether a response clearly says there is no image at the URL: a 404/410, or a page that isn't an image."""
+    if response.status_code in MISSING_STATUSES:
+        return True
+    return response.status_code == 200 and not response.headers.get("Content-Type", "image/").startswith("image/")
+
+
+def make_thumbnail(data: bytes, size_px: int) -> bytes:
+    """Downsize an image to fit in size_px x size_px and encode it as JPEG, on a white background if it has transparency."""
+    with Image.open(io.BytesIO(data)) as image:
+        image.thumbnail((size_px, size_px))
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, "JPEG", quality=JPEG_QUALITY, optimize=True)
+        return output.getvalue()
+
+
+class ThumbnailCache:
+    """
+    Checks product images over plain HTTP and keeps small JPEG thumbnails of them for the email.
+
+    Thumbnails are stored content-addressed (named by the SHA-256 of the thumbnail), so the same
+    image behind several URLs is stored once. An index in SQLite remembers per image URL the HTTP
+    validators and the thumbnail, so an image is only downloaded again when a HEAD request shows
+    it changed, and not requested at all within THUMBNAIL_RECHECK_HOURS of the last check.
+    """
+
+    def __init__(self, directory: str = THUMBNAIL_CACHE_DIR, size_px: int = THUMBNAIL_SIZE_PX, recheck_hours: float = THUMBNAIL_RECHECK_HOURS,
+                 concurrency: int = IMAGE_FETCH_CONCURRENCY):
+        """
+        Initialize the cache; the directory and index are created on first use.
+
+        Args:
+            directory: Directory holding the thumbnails and the index.
+            size_px: Longest side of a thumbnail, in pixels.
+            recheck_hours: How long a checked image is trusted without asking the server again.
+            concurrency: Image requests in flight at the same time.
+        """
+        self.directory = directory
+        self.size_px = size_px
+        self.recheck_seconds = recheck_hours * 3600
+        self.concurrency = concurrency
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The SQLite connection, opened on first use."""
+        if self._conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._conn = sqlite3.connect(os.path.join(self.directory, "index.sqlite3"))
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.directory, f"{digest}.jpg")
+
+    def _store(self, url: str, etag: Optional[str], last_modified: Optional[str], digest: Optional[str]):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO thumbnails (url, etag, last_modified, digest, checked_at) VALUES (?, ?, ?, ?, ?)",
+                (url, etag, last_modified, digest, time.time())
+            )
+
+    async def _download(self, client: httpx.AsyncClient, url: str) -> Optional[bytes]:
+        """The image's bytes, b"" if it is missing, or None if it couldn't be downloaded or is too large."""
+        async with client.stream("GET", url) as response:
+            if is_missing(response):
+                logger.info(f"Image {url} is not available ({response.status_code} {response.headers.get('Content-Type')})")
+                return b""
+            if response.status_code != 200:
+                logger.info(f"Image {url} could not be downloaded ({response.status_code}), linking it")
+                return None
+            data = bytearray()
+            async for chunk in response.aiter_bytes():
+                data.extend(chunk)
+                if len(data) > MAX_IMAGE_BYTES:
+                    logger.info(f"Image {url} is larger than {MAX_IMAGE_BYTES} bytes, not making a thumbnail")
+                    return None
+            return bytes(data)
+
+    async def _check(self, client: httpx.AsyncClient, url: str) -> Optional[str]:
+        """
+        Return the thumbnail path of an image, "" if the image is clearly missing (see is_missing),
+        or None to link it as is, e.g. after a timeout or an error status.
+        """
+        row = self.conn.execute("SELECT etag, last_modified, digest, checked_at FROM thumbnails WHERE url = ?", (url,)).fetchone()
+        if row and row[2] and os.path.exists(self.path_for(row[2])) and time.time() - row[3] < self.recheck_seconds:
+            return self.path_for(row[2])
+
+        try:
+            response = await client.head(url)
+            if response.status_code == 405:
+                # Some image servers only answer GET; the download below is the check then
+                response = None
+            elif is_missing(response):
+                logger.info(f"Image {url} is not available ({response.status_code} {response.headers.get('Content-Type')})")
+                return ""
+            elif response.status_code != 200:
+                logger.info(f"Image check for {url} returned {response.status_code}, linking it")
+                return None
+
+            etag = response.headers.get("ETag") if response is not None else None
+            last_modified = response.headers.get("Last-Modified") if response is not None else None
+            if row and row[2] and os.path.exists(self.path_for(row[2])) and (etag or last_modified) and (etag, last_modified) == (row[0], row[1]):
+                self._store(url, etag, last_modified, row[2])
+                return self.path_for(row[2])
+
+            data = await self._download(client, url)
+        except httpx.HTTPError as e:
+            logger.info(f"Image check failed for {url}, linking it: {e}")
+            return None
+        if data is None:
+            return None
+        if not data:
+            return ""
+
+        try:
+            thumbnail = await asyncio.to_thread(make_thumbnail, data, self.size_px)
+        except Exception as e:
+            logger.info(f"Could not make a thumbnail of {url}: {e}")
+            return None
+        digest = hashlib.sha256(thumbnail).hexdigest()
+        path = self.path_for(digest)
+        if not os.path.exists(path):
+            with open(path + ".tmp", "wb") as f:
+                f.write(thumbnail)
+            os.replace(path + ".tmp", path)
+        self._store(url, etag, last_modified, digest)
+        return path
+
+    async def prepare(self, urls: Iterable[str]) -> Dict[str, str]:
+        """
+        Check the given image URLs concurrently (following redirects) and make thumbnails of them.
+
+        Args:
+            urls: Image URLs; empty and non-HTTP(S) ones are ignored.
+
+        Returns:
+            For every URL that was checked, the path of its thumbnail, or "" if the image is
+            missing (404/410, or not an image). URLs that couldn't be checked, downloaded or
+            downsized are left out and should be linked.
+        """
+        unique_urls: List[str] = sorted({url for url in urls if url and url.startswith(("http://", "https://"))})
+        if not unique_urls:
+            return {}
+        semaphore = asyncio.Semaphore(self.concurrency)
+        async with httpx.AsyncClient(
+            follow_redirects=True,
+            headers={"User-Agent": HTTP_USER_AGENT, "Accept": "image/*"},
+            timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS),
+            limits=httpx.Limits(max_connections=self.concurrency),
+        ) as client:
+            async def check(url: str) -> Optional[str]:
+                async with semaphore:
+                    try:
+                        return await self._check(client, url)
+                    except Exception as e:
+                        # E.g. httpx.InvalidURL or a SQLite error: link this image, check the others
+                        logger.warning(f"Image check failed for {url}, linking it: {e!r}")
+                        return None
+
+            results = await asyncio.gather(*(check(url) for url in unique_urls))
+        thumbnails = {url: result for url, result in zip(unique_urls, results) if result is not None}
+        logger.info(
+            f"Checked {len(unique_urls)} image(s): {sum(1 for path in thumbnails.values() if path)} thumbnail(s), "
+            f"{sum(1 for path in thumbnails.values() if not path)} broken"
+        )
+        return thumbnails
@@ -0,0 +1,118 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from models.ScrapedProductData import ScrapedProductData
+from services.agent_prompt import PROMPT_VERSION
+from services.url_canonicalizer import product_key
+from config import LLM_CACHE_PATH, LLM_CACHE_TTL_HOURS, LLM_CACHE_MAX_ENTRIES, PREFERRED_BOTTOM_SIZE, PREFERRED_SHOE_SIZE, PREFERRED_TOP_SIZE
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS extractions (
+    cache_key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    scraped_json TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS extractions_last_used_at ON extractions (last_used_at);
+"""
+
+class ExtractionCache:
+    """
+    Content-addressed cache of browser/LLM extraction results, stored in SQLite.
+
+    Entries are keyed by the product the URL points at (see product_key), the fingerprint of the page's product content, the
+    Agent prompt version and the preferred sizes, so any change to the page, the prompt or the
+    sizes is a miss. Entries expire after ttl_hours and the least recently used ones are evicted
+    beyond max_entries. The database runs in WAL mode so several processes can share it.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_hours: float = LLM_CACHE_TTL_HOURS, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        """
+        Initialize the cache; the SQLite file is opened on first use.
+
+        Args:
+            path: Location of the SQLite database file.
+            ttl_hours: Age after which an entry is no longer returned.
+            max_entries: Number of entries kept; the least recently used are evicted first.
+        """
+        self.path = path
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        # Only the workers holding or waiting for a lock keep it alive, so finished keys don't pile up
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """The SQLite connection, opened on first use."""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    @staticmethod
+    def key(url: str, content_fingerprint: str) -> str:
+        """The cache key of a page's extraction result."""
+        parts = [product_key(url), content_fingerprint, PROMPT_VERSION, PREFERRED_SHOE_SIZE, PREFERRED_TOP_SIZE, PREFERRED_BOTTOM_SIZE]
+        return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+    @asynccontextmanager
+    async def locked(self, key: str):
+        """
+        Serialize work on one key within this process, so concurrent workers that hit the same
+        uncached content wait for the first extraction instead of repeating it.
+        """
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        async with lock:
+            yield
+
+    def get(self, key: str) -> Optional[ScrapedProductData]:
+        """Return the cached result for a key, or None if there is none or it expired."""
+        now = time.time()
+        row = self.conn.execute(
+            "SELECT scraped_json FROM extractions WHERE cache_key = ? AND created_at >= ?", (key, now - self.ttl_seconds)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        with self.conn:
+            self.conn.execute("UPDATE extractions SET last_used_at = ? WHERE cache_key = ?", (now, key))
+        self.hits += 1
+        return ScrapedProductData.model_validate_json(row[0])
+
+    def put(self, key: str, url: str, scraped_data: ScrapedProductData):
+        """Store a result, then drop expired entries and evict the least recently used beyond max_entries."""
+        now = time.time()
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO extractions (cache_key, url, scraped_json, created_at, last_used_at) VALUES (?, ?, ?, ?, ?)",
+                (key, url, scraped_data.model_dump_json(), now, now)
+            )
+            self.conn.execute("DELETE FROM extractions WHERE created_at < ?", (now - self.ttl_seconds,))
+            self.conn.execute(
+                "DELETE FROM extractions WHERE cache_key IN "
+                "(SELECT cache_key FROM extractions ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
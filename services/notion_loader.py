@@ -1,26 +1,48 @@
+import asyncio
+import json
 import logging
-from typing import List, Dict, Any
-import requests
-from datetime import date, datetime
+import random
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
+import httpx
+from datetime import date, datetime, timedelta, timezone
 
-from config import NOTION_API_KEY, NOTION_DATABASE_ID, NOTION_URL_PROPERTY_NAME, NOTION_API_VERSION, LOWEST_PRICE_PROPERTY_NAME, LOWEST_PRICE_DATE_PROPERTY_NAME
-from models.WishListItem import WishlistItem # Import the model
+from config import NOTION_API_KEY, NOTION_DATABASE_ID, NOTION_URL_PROPERTY_NAME, NOTION_API_VERSION, LOWEST_PRICE_PROPERTY_NAME, LOWEST_PRICE_DATE_PROPERTY_NAME, NOTION_API_BASE_URL, NOTION_REQUESTS_PER_SECOND, NOTION_MAX_RETRIES, NOTION_INCREMENTAL_SYNC, NOTION_FULL_SYNC_INTERVAL_HOURS
+from models.TrackedItem import TrackedItem
+from services.scheduler import TokenBucket
+from services.notion_snapshot import NotionSnapshot
 
 logger = logging.getLogger(__name__)
 
+def _page_gone(response: httpx.Response) -> bool:
+    """Whether a page update failed because the page was deleted (404) or archived (400 validation error)."""
+    if response.status_code == 404:
+        return True
+    if response.status_code != 400:
+        return False
+    try:
+        error = response.json()
+    except ValueError:
+        return False
+    return error.get("code") == "validation_error" and "archived" in str(error.get("message", ""))
+
+
 class NotionLoader:
     """
     A class to load product data from a Notion database and update properties.
     
     The Notion database should have columns for product URLs, lowest price, and lowest price date.
+    Requests share one pooled HTTP connection, are throttled to Notion's request-rate budget and
+    retried with backoff on 429/5xx responses. Use it as an async context manager to close the pool.
     """
     
-    def __init__(self, url_property_name: str = NOTION_URL_PROPERTY_NAME):
+    def __init__(self, url_property_name: str = NOTION_URL_PROPERTY_NAME, base_url: str = NOTION_API_BASE_URL, use_snapshot: bool = NOTION_INCREMENTAL_SYNC):
         """
         Initialize the Notion loader.
         
         Args:
             url_property_name: The name of the property in Notion that contains the product URLs.
+            base_url: Root of the Notion API, overridable to point at a local fake server.
+            use_snapshot: Keep a local snapshot of the database and only fetch changed pages.
         """
         self.notion_api_key = NOTION_API_KEY
         self.notion_database_id = NOTION_DATABASE_ID
@@ -38,6 +60,65 @@ class NotionLoader:
         if not self.notion_database_id:
             raise ValueError("NOTION_DATABASE_ID environment variable is not set")
 
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=self.headers,
+            timeout=httpx.Timeout(30.0),
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10)
+        )
+        self.limiter = TokenBucket(NOTION_REQUESTS_PER_SECOND, NOTION_REQUESTS_PER_SECOND)
+        self.snapshot = NotionSnapshot() if use_snapshot else None
+        # Property IDs by database ID
+        self._property_ids: Dict[str, List[str]] = {}
+        # Database of each loaded page that isn't in NOTION_DATABASE_ID, to keep the right snapshot current on updates
+        self._database_of_page: Dict[str, str] = {}
+
+    async def __aenter__(self) -> "NotionLoader":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+
+    async def aclose(self):
+        """Close the pooled HTTP connections and the snapshot."""
+        await self.client.aclose()
+        if self.snapshot is not None:
+            self.snapshot.close()
+
+    async def _request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None) -> httpx.Response:
+        """
+        Send a rate-limited request to the Notion API, retrying rate limits and server errors.
+
+        Honors the Retry-After header on 429 responses, otherwise backs off exponentially with jitter.
+        Raises httpx.HTTPStatusError if the final response is still an error.
+        """
+        for attempt in range(NOTION_MAX_RETRIES + 1):
+            await self.limiter.acquire()
+            try:
+                response = await self.client.request(method, path, json=payload)
+            except httpx.TransportError as e:
+                if attempt == NOTION_MAX_RETRIES:
+                    raise
+                delay = min(30.0, 2 ** attempt) + random.uniform(0, 0.5)
+                logger.warning(f"Notion {method} {path} failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            if response.status_code != 429 and response.status_code < 500:
+                break
+            if attempt == NOTION_MAX_RETRIES:
+                break
+            retry_after = response.headers.get("Retry-After")
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = min(30.0, 2 ** attempt) + random.uniform(0, 0.5)
+            logger.warning(f"Notion {method} {path} returned {response.status_code}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+        response.raise_for_status()
+        return response
+
     def _parse_properties(self, properties: Dict[str, Any]) -> Dict[str, Any]:
         """Helper to parse different property types from Notion API response."""
         parsed = {}
@@ -67,77 +148,210 @@ class NotionLoader:
 
         return parsed
 
-    def load_items(self) -> List[Dict[str, Any]]:
+    def _item_from_page(self, result: Dict[str, Any]) -> Optional[TrackedItem]:
+        """Turn a Notion page object into an item, or None if it has no page ID or URL."""
+        page_id = result.get("id")
+        parsed_props = self._parse_properties(result.get("properties", {}))
+        if not page_id or not parsed_props.get('url'):
+            return None
+        return TrackedItem(
+            page_id,
+            parsed_props['url'],
+            parsed_props.get('lowest_price_so_far'),
+            parsed_props.get('lowest_price_date'),
+            result.get("last_edited_time")
+        )
+
+    async def _filter_property_ids(self, database_id: str) -> List[str]:
         """
-        Load product data (URL, page ID, lowest price info) from the Notion database.
-        
-        Returns:
-            A list of dictionaries, each containing 'page_id', 'url',
-            'lowest_price_so_far', and 'lowest_price_date'.
+        Look up the IDs of the URL and lowest price properties for use with `filter_properties`.
+
+        The IDs are cached in the snapshot (if any). Returns an empty list, meaning all properties
+        are fetched, if the database schema cannot be retrieved.
         """
-        
-        query_url = f"https://api.notion.com/v1/databases/{self.notion_database_id}/query"
-        items_data = []
+        if database_id in self._property_ids:
+            return self._property_ids[database_id]
+
+        cached = self.snapshot.get_state(database_id, "property_ids") if self.snapshot else None
+        if cached:
+            self._property_ids[database_id] = json.loads(cached)
+            return self._property_ids[database_id]
+
+        try:
+            response = await self._request("GET", f"/v1/databases/{database_id}")
+            schema = response.json().get("properties", {})
+        except httpx.HTTPError as e:
+            logger.warning(f"Could not retrieve Notion database schema, fetching all properties: {e}")
+            return []
+
+        wanted = [self.url_property_name, self.lowest_price_prop, self.lowest_price_date_prop]
+        self._property_ids[database_id] = [schema[name]["id"] for name in wanted if name in schema and "id" in schema[name]]
+        if self.snapshot:
+            self.snapshot.set_state(database_id, "property_ids", json.dumps(self._property_ids[database_id]))
+        return self._property_ids[database_id]
+
+    async def _query_database(self, database_id: str, query_filter: Optional[Dict[str, Any]] = None) -> AsyncIterator[Tuple[List[TrackedItem], List[str], bool]]:
+        """
+        Page through the database query endpoint, requesting only the properties we use.
+
+        Args:
+            database_id: The database to query.
+            query_filter: Optional Notion filter object.
+
+        Yields:
+            A tuple of (items, removed page IDs, ok) per response, as soon as it arrives. Removed
+            page IDs are archived/trashed pages or pages whose URL was cleared. If a request fails
+            midway, a last ([], [], False) is yielded.
+        """
+        query_path = f"/v1/databases/{database_id}/query"
+        # Property IDs come back already URL-encoded from Notion, so they go into the query string as-is
+        property_ids = await self._filter_property_ids(database_id)
+        if property_ids:
+            query_path += "?" + "&".join(f"filter_properties={property_id}" for property_id in property_ids)
         has_more = True
         next_cursor = None
 
         while has_more:
-            payload = {}
+            payload = {'page_size': 100}
+            if query_filter:
+                payload['filter'] = query_filter
             if next_cursor:
                 payload['start_cursor'] = next_cursor
 
             try:
-                logger.info(f"Querying Notion database: {self.notion_database_id} (Cursor: {next_cursor})")
-                response = requests.post(query_url, headers=self.headers, json=payload)
-                response.raise_for_status()
+                logger.info(f"Querying Notion database: {database_id} (Cursor: {next_cursor})")
+                response = await self._request("POST", query_path, payload)
                 data = response.json()
-                
-                results = data.get("results", [])
-                if not results:
-                    logger.info("No results found in this Notion page batch.")
-                    break # Exit if no results
-
-                for result in results:
-                    page_id = result.get("id")
-                    properties = result.get("properties", {})
-                    parsed_props = self._parse_properties(properties)
-                    
-                    if page_id and parsed_props.get('url'):
-                        item_info = {
-                            'page_id': page_id,
-                            'url': parsed_props['url'],
-                            'lowest_price_so_far': parsed_props.get('lowest_price_so_far'),
-                            'lowest_price_date': parsed_props.get('lowest_price_date')
-                        }
-                        items_data.append(item_info)
-                    else:
-                        logger.warning(f"Skipping entry: Missing page_id or URL. Data: {result}")
-                
-                has_more = data.get("has_more", False)
-                next_cursor = data.get("next_cursor")
-                if not has_more:
-                    logger.info("No more pages to fetch from Notion.")
-
-            except requests.exceptions.RequestException as e:
+            except httpx.HTTPError as e:
                 logger.error(f"Error fetching data from Notion: {e}")
-                has_more = False
+                yield [], [], False
+                return
             except Exception as e:
-                 logger.error(f"An unexpected error occurred during Notion fetch: {e}")
-                 has_more = False
+                logger.error(f"An unexpected error occurred during Notion fetch: {e}")
+                yield [], [], False
+                return
+
+            results = data.get("results", [])
+            if not results:
+                logger.info("No results found in this Notion page batch.")
+                break # Exit if no results
 
-        logger.info(f"Loaded data for {len(items_data)} items from Notion")
-        return items_data
+            items_data = []
+            removed_page_ids = []
+            for result in results:
+                if result.get("archived") or result.get("in_trash"):
+                    removed_page_ids.append(result.get("id"))
+                    continue
 
-    def update_lowest_price(self, page_id: str, lowest_price: float, price_date: date):
+                item_info = self._item_from_page(result)
+                if item_info:
+                    items_data.append(item_info)
+                else:
+                    logger.warning(f"Skipping entry: Missing page_id or URL. Data: {result}")
+                    if result.get("id"):
+                        removed_page_ids.append(result["id"])
+
+            has_more = data.get("has_more", False)
+            next_cursor = data.get("next_cursor")
+            if not has_more:
+                logger.info("No more pages to fetch from Notion.")
+            yield items_data, removed_page_ids, True
+
+    async def _sync_snapshot(self, database_id: str) -> AsyncIterator[List[TrackedItem]]:
+        """
+        Bring the local snapshot up to date and yield its items in batches.
+
+        Runs a full sync on first use and every NOTION_FULL_SYNC_INTERVAL_HOURS (this also catches
+        pages that were deleted outright). A full sync yields every batch as soon as Notion returns
+        it. Otherwise only asks Notion for pages edited since the last sync and merges them, then
+        yields the snapshot. Database queries don't return archived pages, so an incremental sync
+        can't see a page being archived: it stays in the snapshot until update_lowest_price finds
+        it gone or the next full sync drops it.
+        """
+        sync_started = datetime.now(timezone.utc)
+        last_sync = self.snapshot.get_time(database_id, "last_sync")
+        last_full_sync = self.snapshot.get_time(database_id, "last_full_sync")
+        full_sync = last_sync is None or last_full_sync is None or sync_started - last_full_sync > timedelta(hours=NOTION_FULL_SYNC_INTERVAL_HOURS)
+
+        if full_sync:
+            logger.info("Running full Notion sync")
+            self.snapshot.start_full_sync()
+            async for items_data, _, ok in self._query_database(database_id):
+                if not ok:
+                    # Keep the pages the partial sync didn't get to rather than dropping them
+                    for batch in self.snapshot.iter_items(database_id, unsynced_only=True):
+                        yield batch
+                    return
+                self.snapshot.upsert(database_id, items_data, mark_synced=True)
+                yield items_data
+            self.snapshot.finish_full_sync(database_id)
+            self.snapshot.set_state(database_id, "last_full_sync", sync_started.isoformat())
+            self.snapshot.set_state(database_id, "last_sync", sync_started.isoformat())
+            return
+
+        # last_edited_time is rounded to the minute, so overlap a little with the previous sync
+        since = last_sync - timedelta(minutes=2)
+        logger.info(f"Running incremental Notion sync for pages edited since {since.isoformat()}")
+        query_filter = {"timestamp": "last_edited_time", "last_edited_time": {"on_or_after": since.isoformat()}}
+        changed, removed, complete = 0, 0, True
+        async for items_data, removed_page_ids, ok in self._query_database(database_id, query_filter):
+            complete = complete and ok
+            self.snapshot.upsert(database_id, items_data)
+            self.snapshot.delete(database_id, removed_page_ids)
+            changed += len(items_data)
+            removed += len(removed_page_ids)
+        logger.info(f"Merged {changed} changed and {removed} removed pages into the snapshot")
+        if complete:
+            self.snapshot.set_state(database_id, "last_sync", sync_started.isoformat())
+        for batch in self.snapshot.iter_items(database_id):
+            yield batch
+
+    async def load_items(self, database_id: Optional[str] = None, query_filter: Optional[Dict[str, Any]] = None) -> AsyncIterator[List[TrackedItem]]:
+        """
+        Load product data (URL, page ID, lowest price info) from a Notion database, a batch at a time.
+
+        Batches are yielded as they arrive (up to 100 items, one Notion response each), so callers
+        can start on the first batch while the rest is loading. With a snapshot, only pages edited
+        since the last run are fetched and merged locally. Filtered loads always query Notion: an
+        incremental sync can't tell which edited pages stopped matching the filter.
+
+        Args:
+            database_id: The database to load, NOTION_DATABASE_ID by default.
+            query_filter: Optional Notion filter object, e.g. a recipient's own items.
+
+        Yields:
+            Lists of TrackedItem.
+        """
+        database_id = database_id or self.notion_database_id
+        if self.snapshot is not None and not query_filter:
+            batches = self._sync_snapshot(database_id)
+        else:
+            batches = (items_data async for items_data, _, _ in self._query_database(database_id, query_filter))
+
+        loaded = 0
+        async for items_data in batches:
+            if not items_data:
+                continue
+            if database_id != self.notion_database_id:
+                for item_data in items_data:
+                    self._database_of_page[item_data.page_id] = database_id
+            loaded += len(items_data)
+            yield items_data
+        logger.info(f"Loaded data for {loaded} items from Notion")
+
+    async def update_lowest_price(self, page_id: str, lowest_price: float, price_date: date):
         """
         Update the 'Lowest Price' and 'Lowest Price Date' properties for a specific page in Notion.
 
+        If Notion answers that the page is archived or no longer exists, it is dropped from the
+        snapshot (see _sync_snapshot).
+
         Args:
             page_id: The ID of the Notion page to update.
             lowest_price: The new lowest price to set.
             price_date: The date the lowest price was observed.
         """
-        update_url = f"https://api.notion.com/v1/pages/{page_id}"
+        update_path = f"/v1/pages/{page_id}"
         properties_payload = {
             self.lowest_price_prop: {
                 "number": lowest_price
@@ -154,10 +368,17 @@ class NotionLoader:
         
         try:
             logger.info(f"Updating Notion page {page_id} with lowest price {lowest_price} on {price_date}")
-            response = requests.patch(update_url, headers=self.headers, json=payload)
-            response.raise_for_status()
+            await self._request("PATCH", update_path, payload)
             logger.info(f"Successfully updated Notion page {page_id}")
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error updating Notion page {page_id}: {e}. Response: {response.text}")
+            if self.snapshot is not None:
+                self.snapshot.update_lowest_price(self._database_of_page.get(page_id, self.notion_database_id), page_id, lowest_price, price_date)
+        except httpx.HTTPStatusError as e:
+            if self.snapshot is not None and _page_gone(e.response):
+                logger.info(f"Notion page {page_id} was archived or deleted, dropping it from the snapshot")
+                self.snapshot.delete(self._database_of_page.get(page_id, self.notion_database_id), [page_id])
+                return
+            logger.error(f"Error updating Notion page {page_id}: {e}. Response: {e.response.text}")
+        except httpx.HTTPError as e:
+            logger.error(f"Error updating Notion page {page_id}: {e}")
         except Exception as e:
             logger.error(f"An unexpected error occurred during Notion update for page {page_id}: {e}")
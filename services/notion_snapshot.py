@@ -0,0 +1,159 @@
+import logging
+import os
+import sqlite3
+from datetime import date, datetime
+from typing import List, Optional, Iterable, Iterator
+
+from models.TrackedItem import TrackedItem
+from config import NOTION_SNAPSHOT_PATH
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    database_id TEXT NOT NULL,
+    page_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    lowest_price REAL,
+    lowest_price_date TEXT,
+    last_edited_time TEXT,
+    PRIMARY KEY (database_id, page_id)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    database_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (database_id, key)
+);
+"""
+
+# Pages seen by the full sync in progress, to drop the others from the snapshot once it completes
+SYNCED_PAGES_SCHEMA = "CREATE TEMP TABLE IF NOT EXISTS synced_pages (page_id TEXT PRIMARY KEY)"
+
+
+class NotionSnapshot:
+    """
+    Local SQLite copy of the tracked Notion database(s).
+
+    Stores the item fields this project reads from Notion plus sync bookkeeping (last sync time,
+    last full sync time, property ids), so that later runs only need to fetch the pages edited
+    since the previous sync.
+    """
+
+    def __init__(self, path: str = NOTION_SNAPSHOT_PATH):
+        """
+        Initialize the snapshot, creating the SQLite file and tables if needed.
+
+        Args:
+            path: Location of the SQLite database file.
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def get_state(self, database_id: str, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM sync_state WHERE database_id = ? AND key = ?", (database_id, key)).fetchone()
+        return row[0] if row else None
+
+    def set_state(self, database_id: str, key: str, value: str):
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO sync_state (database_id, key, value) VALUES (?, ?, ?) "
+                "ON CONFLICT (database_id, key) DO UPDATE SET value = excluded.value",
+                (database_id, key, value)
+            )
+
+    def get_time(self, database_id: str, key: str) -> Optional[datetime]:
+        value = self.get_state(database_id, key)
+        return datetime.fromisoformat(value) if value else None
+
+    def upsert(self, database_id: str, items: Iterable[TrackedItem], mark_synced: bool = False):
+        """
+        Insert or update items as returned by NotionLoader (page_id, url, lowest price and date).
+
+        Args:
+            database_id: The database the items belong to.
+            items: The items to store.
+            mark_synced: Remember the items as seen by the full sync started with start_full_sync.
+        """
+        items = list(items)
+        rows = [
+            (
+                database_id,
+                item.page_id,
+                item.url,
+                item.lowest_price_so_far,
+                item.lowest_price_date.isoformat() if item.lowest_price_date else None,
+                item.last_edited_time,
+            )
+            for item in items
+        ]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO pages (database_id, page_id, url, lowest_price, lowest_price_date, last_edited_time) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (database_id, page_id) DO UPDATE SET url = excluded.url, lowest_price = excluded.lowest_price, "
+                "lowest_price_date = excluded.lowest_price_date, last_edited_time = excluded.last_edited_time",
+                rows
+            )
+            if mark_synced:
+                self.conn.executemany("INSERT OR IGNORE INTO synced_pages (page_id) VALUES (?)", [(item.page_id,) for item in items])
+
+    def delete(self, database_id: str, page_ids: Iterable[str]):
+        with self.conn:
+            self.conn.executemany("DELETE FROM pages WHERE database_id = ? AND page_id = ?", [(database_id, page_id) for page_id in page_ids])
+
+    def start_full_sync(self):
+        """Start tracking the pages a full sync stores (see upsert), so the ones it didn't see can be dropped after."""
+        with self.conn:
+            self.conn.execute(SYNCED_PAGES_SCHEMA)
+            self.conn.execute("DELETE FROM synced_pages")
+
+    def finish_full_sync(self, database_id: str):
+        """Drop the pages of a database the completed full sync didn't see, i.e. pages deleted in Notion."""
+        with self.conn:
+            deleted = self.conn.execute(
+                "DELETE FROM pages WHERE database_id = ? AND page_id NOT IN (SELECT page_id FROM synced_pages)", (database_id,)
+            ).rowcount
+            self.conn.execute("DELETE FROM synced_pages")
+        if deleted:
+            logger.info(f"Dropped {deleted} page(s) deleted in Notion from the snapshot")
+
+    def update_lowest_price(self, database_id: str, page_id: str, lowest_price: float, price_date: date):
+        """Mirror a lowest-price write to Notion so the snapshot stays current without a re-fetch."""
+        with self.conn:
+            self.conn.execute(
+                "UPDATE pages SET lowest_price = ?, lowest_price_date = ? WHERE database_id = ? AND page_id = ?",
+                (lowest_price, price_date.isoformat(), database_id, page_id)
+            )
+
+    def iter_items(self, database_id: str, batch_size: int = 100, unsynced_only: bool = False) -> Iterator[List[TrackedItem]]:
+        """
+        Yield the snapshot items of a database in batches, in the same shape as NotionLoader.load_items.
+
+        Each batch is a separate query (keyed on rowid), so no cursor stays open between batches
+        while the caller writes to the snapshot.
+
+        Args:
+            database_id: The database to read.
+            batch_size: Items per batch.
+            unsynced_only: Only the items the full sync in progress hasn't stored yet.
+        """
+        query = "SELECT rowid, page_id, url, lowest_price, lowest_price_date FROM pages WHERE database_id = ? AND rowid > ?"
+        if unsynced_only:
+            query += " AND page_id NOT IN (SELECT page_id FROM synced_pages)"
+        query += " ORDER BY rowid LIMIT ?"
+        last_rowid = 0
+        while True:
+            rows = self.conn.execute(query, (database_id, last_rowid, batch_size)).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            yield [
+                TrackedItem(page_id, url, lowest_price, date.fromisoformat(lowest_price_date) if lowest_price_date else None)
+                for _, page_id, url, lowest_price, lowest_price_date in rows
+            ]
@@ -0,0 +1,231 @@
+import logging
+import os
+import sqlite3
+from datetime import date
+from typing import List, Dict, Iterable, Tuple
+
+import numpy as np
+
+from models.PriceStats import PriceStats
+from config import PRICE_HISTORY_PATH, PRICE_HISTORY_LOOKBACK_DAYS
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    product_id INTEGER PRIMARY KEY,
+    page_id TEXT NOT NULL UNIQUE,
+    all_time_low REAL,
+    all_time_low_day INTEGER
+);
+CREATE TABLE IF NOT EXISTS observations (
+    product_id INTEGER NOT NULL,
+    day INTEGER NOT NULL,
+    price REAL NOT NULL,
+    PRIMARY KEY (product_id, day)
+) WITHOUT ROWID;
+"""
+
+
+def _group_median(codes: np.ndarray, prices: np.ndarray, mask: np.ndarray, group_count: int) -> np.ndarray:
+    """Median of the masked prices of every group, NaN for groups without masked prices."""
+    selected_codes, selected_prices = codes[mask], prices[mask]
+    order = np.lexsort((selected_prices, selected_codes))
+    sorted_prices = selected_prices[order]
+    counts = np.bincount(selected_codes, minlength=group_count)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    medians = np.full(group_count, np.nan)
+    has_values = counts > 0
+    low = starts[has_values] + (counts[has_values] - 1) // 2
+    high = starts[has_values] + counts[has_values] // 2
+    medians[has_values] = (sorted_prices[low] + sorted_prices[high]) / 2
+    return medians
+
+
+def compute_stats(codes: np.ndarray, days: np.ndarray, prices: np.ndarray, group_count: int, today: int) -> Dict[str, np.ndarray]:
+    """
+    Compute windowed price statistics for many products at once.
+
+    Args:
+        codes: Product index (0..group_count-1) of every observation, sorted ascending.
+        days: Date ordinal of every observation, ascending within each product.
+        prices: Observed price of every observation.
+        group_count: Number of products.
+        today: Date ordinal the windows end on (inclusive).
+
+    Returns:
+        Arrays of length group_count keyed by statistic name; NaN where a product has no data.
+    """
+    counts = np.bincount(codes, minlength=group_count)
+    present = counts > 0
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    last_index = starts + counts - 1
+
+    def windowed_min(window_days: int) -> np.ndarray:
+        values = np.where(days > today - window_days, prices, np.inf)
+        result = np.full(group_count, np.nan)
+        result[present] = np.minimum.reduceat(values, starts[present])
+        result[np.isinf(result)] = np.nan
+        return result
+
+    in_7d = days > today - 7
+    sum_7d = np.bincount(codes, weights=np.where(in_7d, prices, 0.0), minlength=group_count)
+    count_7d = np.bincount(codes, weights=in_7d.astype(float), minlength=group_count)
+
+    # Lowest in N days: the most recent earlier observation at or below the latest price
+    latest_price = np.full(group_count, np.nan)
+    latest_price[present] = prices[last_index[present]]
+    is_latest = np.zeros(len(prices), dtype=bool)
+    is_latest[last_index[present]] = True
+    at_or_below = (prices <= latest_price[codes]) & ~is_latest
+    last_match_day = np.full(group_count, np.nan)
+    last_match_day[present] = np.maximum.reduceat(np.where(at_or_below, days, -1), starts[present])
+    last_match_day[last_match_day < 0] = np.nan
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        moving_avg_7d = sum_7d / count_7d
+
+    return {
+        'min_30d': windowed_min(30),
+        'min_90d': windowed_min(90),
+        'median_30d': _group_median(codes, prices, days > today - 30, group_count),
+        'median_90d': _group_median(codes, prices, days > today - 90, group_count),
+        'moving_avg_7d': moving_avg_7d,
+        'lowest_in_days': today - last_match_day,
+        'observations': counts.astype(float),
+    }
+
+
+def _optional(value: float):
+    return None if np.isnan(value) else round(float(value), 2)
+
+
+class PriceHistory:
+    """
+    Price history per Notion page, stored in SQLite.
+
+    Keeps one observation per page and day (a later price on the same day replaces it) in a
+    compact, all-numeric WITHOUT ROWID table clustered by (product_id, day), plus the all-time
+    low per page, so statistics only ever need to read the lookback window.
+    """
+
+    def __init__(self, path: str = PRICE_HISTORY_PATH):
+        """
+        Initialize the store, creating the SQLite file and tables if needed.
+
+        Args:
+            path: Location of the SQLite database file.
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    async def __aenter__(self) -> "PriceHistory":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
+
+    def record_many(self, observations: Iterable[Tuple[str, float, date]]):
+        """
+        Store (page_id, price, observed_on) observations. Prices <= 0 (unavailable/errors) are ignored.
+
+        A second observation for the same page and day replaces the first; if the replaced price
+        was the all-time low, the low is recomputed from the remaining observations.
+        """
+        rows = [(page_id, observed_on.toordinal(), float(price)) for page_id, price, observed_on in observations if price > 0]
+        if not rows:
+            return
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO products (page_id) VALUES (?)", {(row[0],) for row in rows})
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO observations (product_id, day, price) "
+                "SELECT product_id, ?, ? FROM products WHERE page_id = ?",
+                [(day, price, page_id) for page_id, day, price in rows]
+            )
+            self.conn.executemany(
+                "UPDATE products SET all_time_low = ?, all_time_low_day = ? "
+                "WHERE page_id = ? AND (all_time_low IS NULL OR all_time_low > ?)",
+                [(price, day, page_id, price) for page_id, day, price in rows]
+            )
+            # The all-time low may have been the price just replaced
+            self.conn.executemany(
+                "UPDATE products SET (all_time_low, all_time_low_day) = "
+                "(SELECT price, day FROM observations o WHERE o.product_id = products.product_id ORDER BY price, day LIMIT 1) "
+                "WHERE page_id = ? AND all_time_low_day = ?",
+                {(page_id, day) for page_id, day, _ in rows}
+            )
+
+    def record(self, page_id: str, price: float, observed_on: date):
+        """Store a single observation, see record_many."""
+        self.record_many([(page_id, price, observed_on)])
+
+    def _select_products(self, page_ids: List[str]) -> Dict[int, Tuple[str, float, int]]:
+        """Mark the requested pages in a temp table and return product_id -> (page_id, all-time low, day)."""
+        with self.conn:
+            self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted_products (product_id INTEGER PRIMARY KEY)")
+            self.conn.execute("DELETE FROM wanted_products")
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO wanted_products (product_id) SELECT product_id FROM products WHERE page_id = ?",
+                [(page_id,) for page_id in page_ids]
+            )
+        rows = self.conn.execute(
+            "SELECT p.product_id, p.page_id, p.all_time_low, p.all_time_low_day FROM products p "
+            "JOIN wanted_products w ON w.product_id = p.product_id"
+        )
+        return {product_id: (page_id, low, low_day) for product_id, page_id, low, low_day in rows}
+
+    def _load_window(self, since_day: int) -> np.ndarray:
+        """Observations of the selected products since since_day as an (n, 3) array of product_id, day, price."""
+        rows = self.conn.execute(
+            "SELECT o.product_id, o.day, o.price FROM observations o JOIN wanted_products w ON w.product_id = o.product_id "
+            "WHERE o.day >= ? ORDER BY o.product_id, o.day",
+            (since_day,)
+        ).fetchall()
+        return np.array(rows, dtype=np.float64).reshape(-1, 3)
+
+    def stats(self, page_ids: List[str], today: date) -> Dict[str, PriceStats]:
+        """
+        Compute price statistics for the given pages over the lookback window ending today.
+
+        Args:
+            page_ids: Notion page IDs to compute statistics for.
+            today: Last day of the windows (inclusive).
+
+        Returns:
+            PriceStats per page ID that has at least one observation.
+        """
+        if not page_ids:
+            return {}
+        today_day = today.toordinal()
+        products = self._select_products(page_ids)
+        observations = self._load_window(today_day - PRICE_HISTORY_LOOKBACK_DAYS)
+        if not len(observations):
+            return {}
+
+        product_ids, codes = np.unique(observations[:, 0].astype(np.int64), return_inverse=True)
+        days = observations[:, 1].astype(np.int64)
+        prices = observations[:, 2]
+        computed = compute_stats(codes, days, prices, len(product_ids), today_day)
+
+        result = {}
+        for index, product_id in enumerate(product_ids.tolist()):
+            page_id, low_price, low_day = products[product_id]
+            lowest_in_days = computed['lowest_in_days'][index]
+            result[page_id] = PriceStats(
+                min_30d=_optional(computed['min_30d'][index]),
+                min_90d=_optional(computed['min_90d'][index]),
+                median_30d=_optional(computed['median_30d'][index]),
+                median_90d=_optional(computed['median_90d'][index]),
+                moving_avg_7d=_optional(computed['moving_avg_7d'][index]),
+                all_time_low=round(low_price, 2) if low_price is not None else None,
+                all_time_low_date=date.fromordinal(low_day) if low_day else None,
+                lowest_in_days=None if np.isnan(lowest_in_days) else int(lowest_in_days),
+                observations=int(computed['observations'][index]),
+            )
+        return result
@@ -1,140 +1,309 @@
 import logging
 import asyncio
-from typing import List, Dict, Any, Optional
+import time
+from collections import Counter
+from contextlib import asynccontextmanager, nullcontext
+from functools import partial
+from typing import List, Any, Optional, AsyncIterator, AsyncIterable, Callable
 import os
 
-from browser_use import Agent, Controller
+from browser_use import Agent, Controller, BrowserSession
 from browser_use.llm import ChatGoogle
 
 from models.WishListItem import WishlistItem
+from models.TrackedItem import TrackedItem
 from models.ScrapedProductData import ScrapedProductData
-from config import GEMINI_API_KEY, MAX_CONCURRENT_REQUESTS, PREFERRED_BOTTOM_SIZE, PREFERRED_SHOE_SIZE, PREFERRED_TOP_SIZE
+from services.structured_data_extractor import extract_from_html, fetch_html
+from services.change_detector import PageCheck, PageStateStore, page_fingerprint
+from services.llm_cache import ExtractionCache
+from services.extraction_recipes import RecipeStore, learn_recipe, replay_recipe
+from services.scheduler import ScrapeScheduler, domain_of, item_timed_out, single_batch
+from services.circuit_breaker import CircuitBreakers, ScrapeFailure, classify_failure, classify_agent_history, retry_async, CIRCUIT_OPEN, LLM, TIMEOUT
+from services.browser_pool import BrowserPool, BrowserLease
+from services.agent_prompt import task_prompt, initial_actions
+from services.run_metrics import run_metrics, record_span, set_resolution, set_failure, instrument_llm, record_agent_history
+from config import GEMINI_API_KEY, MAX_CONCURRENT_REQUESTS, BROWSER_POOL_SIZE, STRUCTURED_DATA_FAST_PATH, USE_EXTRACTION_RECIPES, PRECHECK_UNCHANGED_PAGES, LLM_CACHE_ENABLED, AGENT_USE_VISION, AGENT_FLASH_MODE, AGENT_MAX_ELEMENTS_LENGTH, CIRCUIT_BREAKER_ENABLED, BROWSER_SCRAPE_ATTEMPTS
 
 logger = logging.getLogger(__name__)
 
-async def process_product(item_data: Dict[str, Any]) -> Optional[WishlistItem]:
+recipe_store = RecipeStore()
+page_state_store = PageStateStore()
+extraction_cache = ExtractionCache()
+circuit_breakers = CircuitBreakers()
+
+# Name of the placeholder item reported when a product could not be processed
+ERROR_ITEM_NAME = "Processing Error"
+
+# How each item of the current run was resolved ('unchanged', 'structured_data', 'llm_cache', 'browser', 'error', 'circuit_open')
+scrape_stats: Counter = Counter()
+
+def _resolved(resolution: str):
+    scrape_stats[resolution] += 1
+    set_resolution(resolution)
+
+def create_llm():
+    """Initialize LLM with latest Gemini model from browser-use."""
+    os.environ['GOOGLE_API_KEY'] = str(GEMINI_API_KEY)
+    return ChatGoogle(model='gemini-2.0-flash-exp')
+
+# Creates the chat model driving the Agent; devtools/benchmark.py swaps in a stub
+llm_factory: Callable[[], Any] = create_llm
+
+@asynccontextmanager
+async def _browser_lease(browser_pool: Optional[BrowserPool]):
+    """Lease a context from the pool, or yield None to let Playwright/the Agent launch their own browser."""
+    if browser_pool is None:
+        yield None
+    else:
+        started = time.perf_counter()
+        async with browser_pool.lease() as lease:
+            record_span("browser_lease_wait", time.perf_counter() - started)
+            yield lease
+
+async def _scrape_in_browser(url: str, lease: Optional[BrowserLease]) -> ScrapedProductData:
+    """
+    Scrape a product by replaying its learned recipe, falling back to the browser_use Agent.
+
+    Raises:
+        ScrapeFailure: If the Agent finished without a result, with the kind of failure its history shows.
+    """
+    browser_context = lease.context if lease else None
+
+    if USE_EXTRACTION_RECIPES and (recipe := recipe_store.get(url)):
+        scraped_data = await replay_recipe(url, recipe, browser_context)
+        if scraped_data:
+            logger.info(f"Extracted {url} by replaying learned recipe, skipping Agent")
+            return scraped_data
+        logger.info(f"Recipe for {url} no longer valid, falling back to Agent")
+        await recipe_store.discard(url)
+
+    controller = Controller(output_model=ScrapedProductData)
+
+    llm = instrument_llm(llm_factory())
+    
+    # Run the Agent on the pooled browser when there is one, instead of launching its own, in the
+    # lease's isolated context; keep_alive leaves the browser running for the pool
+    browser_session = None
+    if lease:
+        await lease.open_agent_tab()
+        browser_session = BrowserSession(cdp_url=lease.cdp_url, keep_alive=True)
+
+    agent = Agent(
+        task=task_prompt(),
+        llm=llm,
+        controller=controller,
+        initial_actions=initial_actions(url),
+        browser_session=browser_session,
+        use_vision=AGENT_USE_VISION,
+        flash_mode=AGENT_FLASH_MODE,
+        use_judge=False,
+        max_clickable_elements_length=AGENT_MAX_ELEMENTS_LENGTH
+    )
+    
+    try:
+        history = await agent.run()
+    finally:
+        if browser_session:
+            await browser_session.stop()
+    record_agent_history(history)
+    result = history.final_result()
+    if not result:
+        raise ScrapeFailure(classify_agent_history(history), f"Agent finished without a result for {url}")
+
+    scraped_data = ScrapedProductData.model_validate_json(result)
+
+    if USE_EXTRACTION_RECIPES:
+        recipe = await learn_recipe(url, history, scraped_data, browser_context)
+        if recipe:
+            logger.info(f"Learned extraction recipe for {url}")
+            await recipe_store.save(url, recipe)
+
+    return scraped_data
+
+async def _scrape_with_cache(url: str, html: Optional[str], page_check: Optional[PageCheck], browser_pool: Optional[BrowserPool]) -> ScrapedProductData:
+    """
+    Scrape a product in the browser, reusing an earlier extraction of the same product content.
+
+    The cache key needs the page's content, so pages that couldn't be fetched over plain HTTP
+    always go to the browser. Browser scrapes that hit an LLM error are retried with backoff
+    (BROWSER_SCRAPE_ATTEMPTS), and every outcome is reported to the domain's circuit breaker;
+    while it is open, no browser is started for the domain.
+
+    Raises:
+        ScrapeFailure: If the circuit breaker is open or the Agent finished without a result.
+    """
+    cache_key = None
+    if LLM_CACHE_ENABLED and html:
+        fingerprint = page_check.fingerprint if page_check is not None and page_check.fingerprint else page_fingerprint(html)
+        cache_key = extraction_cache.key(url, fingerprint)
+
+    async with extraction_cache.locked(cache_key) if cache_key else nullcontext():
+        if cache_key and (cached := extraction_cache.get(cache_key)):
+            logger.info(f"Reusing cached extraction for {url}, skipping browser")
+            _resolved('llm_cache')
+            return cached
+
+        domain = domain_of(url)
+        if CIRCUIT_BREAKER_ENABLED and not circuit_breakers.allow(domain):
+            raise ScrapeFailure(CIRCUIT_OPEN, f"Circuit breaker for {domain} is open, not starting a browser for {url}")
+
+        timed_out_on_site = False
+
+        async def scrape_in_browser() -> ScrapedProductData:
+            nonlocal timed_out_on_site
+            # A new lease per attempt, so the browser isn't held during the backoff
+            async with _browser_lease(browser_pool) as lease:
+                try:
+                    return await _scrape_in_browser(url, lease)
+                except asyncio.CancelledError:
+                    timed_out_on_site = item_timed_out()
+                    raise
+
+        try:
+            scraped_data = await retry_async(scrape_in_browser, BROWSER_SCRAPE_ATTEMPTS, {LLM}, f"Browser scrape of {url}")
+        except asyncio.CancelledError:
+            # Only the per-item timeout running out while the site was being scraped counts against
+            # it; not waiting for a browser (other domains' load), a backoff, or shutdown
+            if timed_out_on_site:
+                circuit_breakers.record_failure(domain, TIMEOUT)
+            else:
+                circuit_breakers.abandon(domain)
+            raise
+        except Exception as e:
+            circuit_breakers.record_failure(domain, classify_failure(e))
+            raise
+        circuit_breakers.record_success(domain)
+
+        _resolved('browser')
+        if cache_key:
+            extraction_cache.put(cache_key, url, scraped_data)
+        return scraped_data
+
+async def process_product(item_data: TrackedItem, browser_pool: Optional[BrowserPool] = None) -> Optional[WishlistItem]:
     """Process a single product URL and return WishlistItem data, including original lowest price info."""
-    url = item_data.get('url')
-    page_id = item_data.get('page_id')
-    lowest_price_so_far = item_data.get('lowest_price_so_far')
-    lowest_price_date = item_data.get('lowest_price_date')
+    url = item_data.url
+    page_id = item_data.page_id
+    lowest_price_so_far = item_data.lowest_price_so_far
+    lowest_price_date = item_data.lowest_price_date
 
     if not url or not page_id:
         logger.warning(f"Skipping item due to missing URL or page_id: {item_data}")
         return None
 
     try:
-        controller = Controller(output_model=ScrapedProductData)
-
-        task_description = f"""Extract product information from this e-commerce page and determine availability for my preferred size.
-
-**Product Information to Extract:**
-1. Product name (full title as displayed)
-2. **Main product image URL - CRITICAL REQUIREMENTS:**
-   - Find the PRIMARY/HERO product image (usually the largest, most prominent image)
-   - Look for images in these common locations:
-     * Main product gallery (first/default image)
-     * Hero image section
-     * Primary product showcase area
-   - Extract the FULL, DIRECT image URL that:
-     * Ends with image extensions: .jpg, .jpeg, .png, .webp, .avif
-     * Is a complete URL starting with http:// or https://
-     * Points directly to the image file (not a thumbnail or placeholder)
-   - Common image selectors to check:
-     * img[data-main-image], img[data-hero], img.product-image
-     * Images inside .product-gallery, .hero-image, .main-image containers
-     * The largest img element in the product area
-   - **VALIDATION STEPS:**
-     * Verify the URL is complete and accessible
-     * Ensure it's not a data: URL or placeholder
-     * If multiple images exist, choose the main/hero image (usually first or largest)
-     * If no valid image found, set to empty string ""
-3. Product type classification (shoe, top, bottom, or other)
-
-**Size Selection Process:**
-For products requiring size selection (shoes, tops, bottoms):
-- Shoe: Select size {PREFERRED_SHOE_SIZE} or closest equivalent
-- Top: Select size {PREFERRED_TOP_SIZE} or closest equivalent
-- Bottom: Select size {PREFERRED_BOTTOM_SIZE} or closest equivalent
-
-**Availability & Pricing Logic:**
-If preferred size is unavailable, disabled, or missing: Set price to -1.0
-If size is available OR product doesn't require size selection:
-- Extract current price as numerical value (e.g., 49.99)
-- Look for availability indicators: "Add to Cart", "In Stock", "Available"
-- Avoid out-of-stock indicators: "Out of Stock", "Unavailable", "Notify Me"
-
-**Discount Calculation:**
-For available products (price > 0):
-- Find discount indicators: "% off", "Save $X", crossed-out original price
-- Calculate percentage: ((Original Price - Sale Price) / Original Price) × 100
-- If no discount found, set to 0.0
-
-**Output Requirements:**
-- price: Numerical value or -1.0 if unavailable
-- discount: Percentage as number (e.g., 25.0 for 25% off) or 0.0
-- name: Exact product title
-- image_url: Valid, complete image URL or empty string ""
-- url: Current page URL
-
-Focus on accuracy and handle edge cases gracefully. Pay special attention to finding the correct main product image URL."""
-
-        initial_actions = [
-            {'go_to_url': {'url': url}}
-        ]
-        
-        # Initialize LLM with latest Gemini model from browser-use
-        os.environ['GOOGLE_API_KEY'] = str(GEMINI_API_KEY)
-        llm = ChatGoogle(model='gemini-2.0-flash-exp')
-        
-        agent = Agent(
-            task=task_description,
-            llm=llm,
-            controller=controller,
-            initial_actions=initial_actions
-        )
-        
-        history = await agent.run()
-        result = history.final_result()
-        
-        if result:
-            scraped_data = ScrapedProductData.model_validate_json(result)
-            
-            final_item = WishlistItem(
-                page_id=page_id,
-                **scraped_data.model_dump(),
-                lowest_price_so_far=lowest_price_so_far,
-                lowest_price_date=lowest_price_date
-            )
-            return final_item
-        return None
-    except Exception as e:
-        logger.error(f"Error processing product URL {url} (Page ID: {page_id}): {str(e)}")
+        page_check = None
+        if PRECHECK_UNCHANGED_PAGES:
+            page_check = await page_state_store.check(url)
+            if page_check.unchanged:
+                logger.info(f"Page {url} unchanged since last scrape, reusing previous result")
+                _resolved('unchanged')
+                return WishlistItem(
+                    page_id=page_id,
+                    **page_check.previous.model_dump(),
+                    lowest_price_so_far=lowest_price_so_far,
+                    lowest_price_date=lowest_price_date
+                )
+
+        # Don't refetch a page the pre-check already failed to download over plain HTTP
+        html = page_check.html if page_check is not None else None
+        if page_check is None and (STRUCTURED_DATA_FAST_PATH or LLM_CACHE_ENABLED):
+            html = await fetch_html(url)
+
+        scraped_data = None
+        if STRUCTURED_DATA_FAST_PATH and html:
+            scraped_data = extract_from_html(html, url)
+            if scraped_data:
+                logger.info(f"Extracted {url} from structured data, skipping Agent")
+                _resolved('structured_data')
 
+        if not scraped_data:
+            scraped_data = await _scrape_with_cache(url, html, page_check, browser_pool)
+
+        if page_check is not None and page_check.fingerprint:
+            page_state_store.save(page_check, scraped_data)
         return WishlistItem(
             page_id=page_id,
-            name="Processing Error",
-            url=url,
-            price=-1.0, # Indicate error/unavailability
-            discount=0.0,
-            image_url="",
+            **scraped_data.model_dump(),
             lowest_price_so_far=lowest_price_so_far,
             lowest_price_date=lowest_price_date
         )
+    except Exception as e:
+        kind = classify_failure(e)
+        set_failure(kind)
+        if kind == CIRCUIT_OPEN:
+            logger.info(str(e))
+            _resolved('circuit_open')
+        else:
+            logger.error(f"Error processing product URL {url} (Page ID: {page_id}), {kind} failure: {str(e)}")
+            _resolved('error')
+        return _error_item(item_data)
 
-async def process_products(items_data: List[Dict[str, Any]], max_concurrent: int = MAX_CONCURRENT_REQUESTS) -> List[WishlistItem]:
-    """Process multiple product items (dict from Notion) in parallel with a concurrency limit."""
-    results = []
-    
-    for i in range(0, len(items_data), max_concurrent):
-        batch = items_data[i:i + max_concurrent]
-        batch_tasks = [process_product(item_data) for item_data in batch]
-        batch_results = await asyncio.gather(*batch_tasks, return_exceptions=True)
-        
-        for result in batch_results:
-            if isinstance(result, Exception):
-                logger.error(f"Caught exception during batch processing: {result}")
+def _error_item(item_data: TrackedItem) -> WishlistItem:
+    """Build the placeholder item reported for a product that could not be processed."""
+    return WishlistItem(
+        page_id=item_data.page_id,
+        name=ERROR_ITEM_NAME,
+        url=item_data.url,
+        price=-1.0, # Indicate error/unavailability
+        discount=0.0,
+        image_url="",
+        lowest_price_so_far=item_data.lowest_price_so_far,
+        lowest_price_date=item_data.lowest_price_date
+    )
+
+async def _process_tracked(item_data: TrackedItem, browser_pool: Optional[BrowserPool] = None) -> Optional[WishlistItem]:
+    with run_metrics.track_item(item_data.url, item_data.page_id):
+        return await process_product(item_data, browser_pool=browser_pool)
+
+async def stream_product_batches(item_batches: AsyncIterable[List[TrackedItem]], max_concurrent: int = MAX_CONCURRENT_REQUESTS) -> AsyncIterator[WishlistItem]:
+    """
+    Process product items through the scrape scheduler as their batches arrive, yielding each
+    processed item as soon as it is ready.
+
+    Scraping starts on the first batch while later ones are still loading. Workers pick up the
+    next item as soon as one finishes, subject to per-domain concurrency caps, per-domain rate
+    limits and a per-item timeout (see services/scheduler.py). Items that need a browser share a
+    small pool of warm browsers (see services/browser_pool.py).
+
+    Args:
+        item_batches: Lists of items, e.g. as yielded by NotionLoader.load_items.
+        max_concurrent: Number of items processed at the same time.
+    """
+    scrape_stats.clear()
+    cache_hits, cache_misses = extraction_cache.hits, extraction_cache.misses
+    processed = 0
+    async with BrowserPool(size=min(BROWSER_POOL_SIZE, max_concurrent)) as browser_pool:
+        scheduler = ScrapeScheduler(partial(_process_tracked, browser_pool=browser_pool), max_workers=max_concurrent)
+        async for item_data, result in scheduler.stream_batches(item_batches):
+            processed += 1
+            if isinstance(result, asyncio.TimeoutError):
+                run_metrics.counters['failures_timeout'] += 1
+                yield _error_item(item_data)
+            elif isinstance(result, Exception):
+                logger.error(f"Caught exception while processing {item_data.url}: {result}")
             elif result is not None:
-                results.append(result)
-    
-    return results
+                yield result
+        logger.info(f"Browser pool launched {browser_pool.launches} browser(s) for {processed} items")
+        run_metrics.counters['browser_launches'] += browser_pool.launches
+    run_metrics.counters['llm_cache_hits'] += extraction_cache.hits - cache_hits
+    run_metrics.counters['llm_cache_misses'] += extraction_cache.misses - cache_misses
+    open_domains = circuit_breakers.open_domains()
+    run_metrics.counters['circuit_open_domains'] = len(open_domains)
+    if open_domains:
+        logger.warning(f"Circuit breakers are open for {len(open_domains)} domain(s), their items were not scraped in a browser: {', '.join(open_domains)}")
+
+    logger.info(
+        f"Processed {processed} items: {scrape_stats['unchanged']} short-circuited (page unchanged), "
+        f"{scrape_stats['structured_data']} from structured data, {scrape_stats['llm_cache']} from the extraction cache, "
+        f"{scrape_stats['browser']} in the browser, {scrape_stats['error']} errors, "
+        f"{scrape_stats['circuit_open']} skipped (circuit breaker open)"
+    )
+
+async def stream_products(items_data: List[TrackedItem], max_concurrent: int = MAX_CONCURRENT_REQUESTS) -> AsyncIterator[WishlistItem]:
+    """Process a list of product items, yielding each processed item as soon as it is ready, see stream_product_batches."""
+    async for item in stream_product_batches(single_batch(items_data), max_concurrent):
+        yield item
+
+async def process_products(items_data: List[TrackedItem], max_concurrent: int = MAX_CONCURRENT_REQUESTS) -> List[WishlistItem]:
+    """Process multiple product items and return the processed items in completion order, see stream_products."""
+    return [item async for item in stream_products(items_data, max_concurrent)]
@@ -0,0 +1,44 @@
+import json
+import logging
+from typing import List
+
+from pydantic import ValidationError
+
+from models.Recipient import Recipient
+from config import RECIPIENTS_FILE, RECIPIENT_EMAIL
+
+logger = logging.getLogger(__name__)
+
+
+def load_recipients(path: str = RECIPIENTS_FILE) -> List[Recipient]:
+    """
+    Load the digest recipients.
+
+    Args:
+        path: JSON file with a list of recipients, each with an "email" and optionally a "name",
+            a "notion_database_id" and a "notion_filter". If not set, the single RECIPIENT_EMAIL
+            receives the items of NOTION_DATABASE_ID.
+
+    Returns:
+        The recipients, each email address at most once.
+
+    Raises:
+        ValueError: If the file cannot be read or a recipient is invalid.
+    """
+    if not path:
+        return [Recipient(email=RECIPIENT_EMAIL or "")]
+
+    try:
+        with open(path, encoding="utf-8") as f:
+            recipients = [Recipient.model_validate(entry) for entry in json.load(f)]
+    except (OSError, ValueError, TypeError, ValidationError) as e:
+        raise ValueError(f"Could not load recipients from {path}: {e}") from e
+
+    unique = {}
+    for recipient in recipients:
+        if recipient.email in unique:
+            logger.warning(f"Recipient {recipient.email} is listed more than once in {path}, using the first entry")
+            continue
+        unique[recipient.email] = recipient
+    logger.info(f"Loaded {len(unique)} recipient(s) from {path}")
+    return list(unique.values())
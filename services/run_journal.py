@@ -0,0 +1,102 @@
+import json
+import logging
+import os
+from datetime import date, timedelta
+from typing import Dict, Optional, Set
+
+from models.WishListItem import WishlistItem
+from config import RUN_JOURNAL_DIR, RUN_JOURNAL_RETENTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+
+class RunJournal:
+    """
+    Append-only journal of one day's run, stored as JSON lines in RUN_JOURNAL_DIR.
+
+    Every processed item is appended (and fsynced) as soon as it is ready, so a run that crashes
+    or times out can be restarted and only scrape the items that are not in the journal yet.
+    """
+
+    def __init__(self, run_date: date, directory: str = RUN_JOURNAL_DIR, name_suffix: str = ""):
+        """
+        Initialize the journal for a given day and load what earlier runs of that day recorded.
+
+        Args:
+            run_date: Day the run belongs to; each day gets its own journal file.
+            directory: Directory holding the journal files.
+            name_suffix: Appended to the file name, so sharded workers sharing a directory keep
+                separate journals.
+        """
+        self.run_date = run_date
+        self.directory = directory
+        self.path = os.path.join(directory, f"run-{run_date.isoformat()}{name_suffix}.jsonl")
+        self.items: Dict[str, WishlistItem] = {}
+        # Recipients whose digest for this day went out
+        self.emails_sent: Set[str] = set()
+        self._file = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                try:
+                    entry = json.loads(line)
+                    if entry["event"] == "item":
+                        item = WishlistItem.model_validate(entry["item"])
+                        self.items[item.page_id] = item
+                    elif entry["event"] == "email_sent":
+                        self.emails_sent.add(entry.get("recipient", ""))
+                except Exception as e:
+                    # A crash mid-write leaves at most one truncated last line
+                    logger.warning(f"Ignoring unreadable line {line_number} of run journal {self.path}: {e}")
+        logger.info(f"Run journal {self.path} has {len(self.items)} item(s) from an earlier run today")
+
+    def _append(self, entry: Dict):
+        if self._file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._file = open(self.path, "a+", encoding="utf-8")
+            # Start on a fresh line after a truncated entry left by a crash
+            if self._file.tell() > 0:
+                self._file.seek(self._file.tell() - 1)
+                if self._file.read(1) != "\n":
+                    self._file.write("\n")
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def get(self, page_id: str) -> Optional[WishlistItem]:
+        """Return the item recorded earlier today for a Notion page, if any."""
+        return self.items.get(page_id)
+
+    def record_item(self, item: WishlistItem):
+        """Append a processed item; it will not be scraped again by a restarted run today."""
+        self.items[item.page_id] = item
+        self._append({"event": "item", "item": item.model_dump(mode="json", exclude={"price_stats"})})
+
+    def record_email_sent(self, recipient: str):
+        """Note that a recipient's digest for this day's items went out."""
+        self.emails_sent.add(recipient)
+        self._append({"event": "email_sent", "recipient": recipient})
+
+    def prune(self, retention_days: int = RUN_JOURNAL_RETENTION_DAYS):
+        """Delete journal files older than retention_days."""
+        if not os.path.isdir(self.directory):
+            return
+        cutoff = (self.run_date - timedelta(days=retention_days)).isoformat()
+        for name in os.listdir(self.directory):
+            if name.startswith("run-") and name.endswith(".jsonl") and name[4:14] < cutoff:
+                os.remove(os.path.join(self.directory, name))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    async def __aenter__(self) -> "RunJournal":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
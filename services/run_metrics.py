@@ -0,0 +1,360 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, AsyncIterator, TypeVar
+
+from services.scheduler import domain_of
+from config import RUN_REPORT_PATH, RUN_METRICS_PROM_PATH, LLM_INPUT_COST_PER_MILLION_TOKENS, LLM_OUTPUT_COST_PER_MILLION_TOKENS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# How the summary describes each item resolution (see set_resolution), in the order it lists them
+RESOLUTION_LABELS = {
+    'unchanged': "short-circuited (page unchanged)",
+    'structured_data': "from structured data",
+    'llm_cache': "from the extraction cache",
+    'browser': "in the browser",
+    'error': "errors",
+    'circuit_open': "skipped (circuit breaker open)",
+}
+
+
+class ItemMetrics:
+    """Timings, Agent steps and LLM usage collected while processing one item."""
+
+    def __init__(self, url: str, page_id: Optional[str]):
+        self.url = url
+        self.page_id = page_id
+        self.domain = domain_of(url)
+        self.resolution: Optional[str] = None
+        # Kind of the last failure (see services/circuit_breaker.py), also of failures that were retried
+        self.failure: Optional[str] = None
+        self.retries = 0
+        self.seconds = 0.0
+        self.agent_steps = 0
+        self.llm_calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        # span name -> [count, total seconds]
+        self.spans: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0])
+
+    @property
+    def llm_cost(self) -> float:
+        return (self.input_tokens * LLM_INPUT_COST_PER_MILLION_TOKENS + self.output_tokens * LLM_OUTPUT_COST_PER_MILLION_TOKENS) / 1_000_000
+
+    def add_span(self, name: str, seconds: float):
+        self.spans[name][0] += 1
+        self.spans[name][1] += seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'url': self.url,
+            'page_id': self.page_id,
+            'domain': self.domain,
+            'resolution': self.resolution,
+            'failure': self.failure,
+            'retries': self.retries,
+            'seconds': round(self.seconds, 3),
+            'agent_steps': self.agent_steps,
+            'llm_calls': self.llm_calls,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'llm_cost': round(self.llm_cost, 6),
+            'spans': {name: {'count': int(count), 'seconds': round(seconds, 3)} for name, (count, seconds) in self.spans.items()},
+        }
+
+
+# The item the current task is working on, so spans recorded deep inside helpers land on it
+_current_item: ContextVar[Optional[ItemMetrics]] = ContextVar("current_item", default=None)
+
+
+class RunMetrics:
+    """
+    Collects per-phase and per-item metrics for one run and writes them as a JSON report and a
+    Prometheus textfile (for node_exporter's textfile collector).
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.items: List[ItemMetrics] = []
+        self._items_by_page: Dict[str, ItemMetrics] = {}
+        # Run-wide counts, e.g. 'browser_launches'
+        self.counters: Dict[str, int] = defaultdict(int)
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time a phase of the workflow (Notion load, scrape, ...). Repeated phases add up."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started
+
+    def record_phase(self, name: str, seconds: float):
+        """Add a phase timed outside of phase(), e.g. the process startup before the report was reset."""
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    async def timed_iter(self, name: str, iterator: AsyncIterator[T]) -> AsyncIterator[T]:
+        """Pass an async iterator through, adding the time spent waiting for its values to a phase (which may overlap others)."""
+        while True:
+            started = time.perf_counter()
+            try:
+                value = await iterator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                self.record_phase(name, time.perf_counter() - started)
+            yield value
+
+    @contextmanager
+    def track_item(self, url: str, page_id: Optional[str] = None):
+        """Attribute all spans and LLM usage recorded in the current task to a new item."""
+        item = ItemMetrics(url, page_id)
+        self.items.append(item)
+        if page_id:
+            self._items_by_page[page_id] = item
+        token = _current_item.set(item)
+        started = time.perf_counter()
+        try:
+            yield item
+        except asyncio.CancelledError:
+            # Abandoned by the scheduler's per-item timeout
+            item.resolution = item.resolution or "cancelled"
+            raise
+        except BaseException:
+            item.resolution = item.resolution or "error"
+            raise
+        finally:
+            item.seconds = time.perf_counter() - started
+            _current_item.reset(token)
+
+    def item_for(self, page_id: str) -> Optional[ItemMetrics]:
+        """The metrics of the item processed for a Notion page in this run, if any."""
+        return self._items_by_page.get(page_id)
+
+    def report(self) -> Dict[str, Any]:
+        """Build the machine-readable run report."""
+        items = [item.to_dict() for item in self.items]
+        return {
+            'started_at': self.started_at.isoformat(),
+            'duration_seconds': round(time.perf_counter() - self._started, 3),
+            'phases': {name: round(seconds, 3) for name, seconds in self.phases.items()},
+            'totals': {
+                'items': len(items),
+                'agent_steps': sum(item['agent_steps'] for item in items),
+                'llm_calls': sum(item['llm_calls'] for item in items),
+                'input_tokens': sum(item['input_tokens'] for item in items),
+                'output_tokens': sum(item['output_tokens'] for item in items),
+                'llm_cost': round(sum(item['llm_cost'] for item in items), 6),
+            },
+            'counters': dict(self.counters),
+            'domains': self._domain_totals(),
+            'items': items,
+        }
+
+    def _domain_totals(self) -> Dict[str, Dict[str, Any]]:
+        domains: Dict[str, Dict[str, Any]] = defaultdict(lambda: {'items': 0, 'seconds': 0.0, 'llm_cost': 0.0})
+        for item in self.items:
+            totals = domains[item.domain]
+            totals['items'] += 1
+            totals['seconds'] += item.seconds
+            totals['llm_cost'] += item.llm_cost
+        return {domain: {**totals, 'seconds': round(totals['seconds'], 3), 'llm_cost': round(totals['llm_cost'], 6)} for domain, totals in domains.items()}
+
+    def prometheus_text(self, report: Dict[str, Any]) -> str:
+        """Render a report in the Prometheus text exposition format."""
+        def escape(value: str) -> str:
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        lines = [
+            "# HELP price_tracker_last_run_timestamp_seconds Start time of the last run.",
+            "# TYPE price_tracker_last_run_timestamp_seconds gauge",
+            f"price_tracker_last_run_timestamp_seconds {self.started_at.timestamp():.0f}",
+            "# HELP price_tracker_run_duration_seconds Wall-clock duration of the last run.",
+            "# TYPE price_tracker_run_duration_seconds gauge",
+            f"price_tracker_run_duration_seconds {report['duration_seconds']}",
+            "# HELP price_tracker_phase_duration_seconds Wall-clock duration of each workflow phase.",
+            "# TYPE price_tracker_phase_duration_seconds gauge",
+        ]
+        lines += [f'price_tracker_phase_duration_seconds{{phase="{escape(name)}"}} {seconds}' for name, seconds in report['phases'].items()]
+
+        resolutions: Dict[str, int] = defaultdict(int)
+        spans: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0])
+        for item in self.items:
+            resolutions[item.resolution or "none"] += 1
+            for name, (count, seconds) in item.spans.items():
+                spans[name][0] += count
+                spans[name][1] += seconds
+        lines += ["# HELP price_tracker_items Items processed in the last run, by how they were resolved.", "# TYPE price_tracker_items gauge"]
+        lines += [f'price_tracker_items{{resolution="{escape(name)}"}} {count}' for name, count in sorted(resolutions.items())]
+        lines += ["# HELP price_tracker_span_seconds Time spent in each kind of span in the last run.", "# TYPE price_tracker_span_seconds gauge"]
+        lines += [f'price_tracker_span_seconds{{span="{escape(name)}"}} {seconds:.3f}' for name, (_, seconds) in sorted(spans.items())]
+        lines += ["# HELP price_tracker_span_count Number of spans of each kind in the last run.", "# TYPE price_tracker_span_count gauge"]
+        lines += [f'price_tracker_span_count{{span="{escape(name)}"}} {int(count)}' for name, (count, _) in sorted(spans.items())]
+        lines += ["# HELP price_tracker_domain_seconds Time spent on the items of each domain in the last run.", "# TYPE price_tracker_domain_seconds gauge"]
+        lines += [f'price_tracker_domain_seconds{{domain="{escape(domain)}"}} {totals["seconds"]}' for domain, totals in sorted(report['domains'].items())]
+
+        totals = report['totals']
+        lines += [
+            "# HELP price_tracker_agent_steps Agent steps taken in the last run.",
+            "# TYPE price_tracker_agent_steps gauge",
+            f"price_tracker_agent_steps {totals['agent_steps']}",
+            "# HELP price_tracker_llm_calls LLM calls made in the last run.",
+            "# TYPE price_tracker_llm_calls gauge",
+            f"price_tracker_llm_calls {totals['llm_calls']}",
+            "# HELP price_tracker_llm_tokens LLM tokens used in the last run.",
+            "# TYPE price_tracker_llm_tokens gauge",
+            f'price_tracker_llm_tokens{{direction="input"}} {totals["input_tokens"]}',
+            f'price_tracker_llm_tokens{{direction="output"}} {totals["output_tokens"]}',
+            "# HELP price_tracker_llm_cost Estimated LLM cost of the last run.",
+            "# TYPE price_tracker_llm_cost gauge",
+            f"price_tracker_llm_cost {totals['llm_cost']}",
+        ]
+        for name, value in sorted(report['counters'].items()):
+            lines += [f"# TYPE price_tracker_{name} gauge", f"price_tracker_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, json_path: str = RUN_REPORT_PATH, prom_path: str = RUN_METRICS_PROM_PATH) -> Dict[str, Any]:
+        """Write the JSON report and the Prometheus textfile, each atomically, and return the report."""
+        report = self.report()
+        for path, content in ((json_path, json.dumps(report, indent=2)), (prom_path, self.prometheus_text(report))):
+            if not path:
+                continue
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                with open(path + ".tmp", "w", encoding="utf-8") as f:
+                    f.write(content)
+                os.replace(path + ".tmp", path)
+            except OSError as e:
+                logger.error(f"Failed to write run report {path}: {e}")
+        return report
+
+    def summary(self, report: Dict[str, Any], top: int = 5) -> str:
+        """A human-readable summary of the phases, how the items were resolved, the slowest domains and the most expensive items."""
+        totals = report['totals']
+        lines = [
+            f"Run finished in {report['duration_seconds']:.1f}s: " + ", ".join(f"{name} {seconds:.1f}s" for name, seconds in report['phases'].items()),
+            f"{totals['items']} items, {totals['agent_steps']} Agent steps, {totals['llm_calls']} LLM calls, "
+            f"{totals['input_tokens']} input / {totals['output_tokens']} output tokens (~${totals['llm_cost']:.4f})",
+        ]
+        resolutions: Dict[str, int] = defaultdict(int)
+        for item in report['items']:
+            resolutions[item['resolution'] or "none"] += 1
+        if resolutions:
+            order = list(RESOLUTION_LABELS) + sorted(set(resolutions) - set(RESOLUTION_LABELS))
+            lines.append("Items: " + ", ".join(
+                f"{resolutions[name]} {RESOLUTION_LABELS.get(name, name)}" for name in order if resolutions.get(name)
+            ))
+        slowest = sorted(report['domains'].items(), key=lambda entry: entry[1]['seconds'], reverse=True)[:top]
+        if slowest:
+            lines.append("Slowest domains:")
+            lines += [f"  {totals['seconds']:8.1f}s  {totals['items']:3d} item(s)  {domain}" for domain, totals in slowest]
+        expensive = sorted(
+            (item for item in report['items'] if item['input_tokens'] or item['output_tokens']),
+            key=lambda item: (item['llm_cost'], item['input_tokens'] + item['output_tokens']), reverse=True
+        )[:top]
+        if expensive:
+            lines.append("Most expensive items:")
+            lines += [
+                f"  {item['input_tokens'] + item['output_tokens']:8d} tokens  {item['agent_steps']:3d} step(s)  {item['seconds']:6.1f}s  {item['url']}"
+                for item in expensive
+            ]
+        return "\n".join(lines)
+
+
+run_metrics = RunMetrics()
+
+
+def current_item() -> Optional[ItemMetrics]:
+    """The item being processed by the current task, if any."""
+    return _current_item.get()
+
+
+def record_span(name: str, seconds: float):
+    """Add a span to the current item (a no-op outside of an item)."""
+    item = _current_item.get()
+    if item is not None:
+        item.add_span(name, seconds)
+
+
+@contextmanager
+def span(name: str):
+    """Time a block and add it to the current item's spans, see record_span."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started)
+
+
+def set_resolution(resolution: str):
+    """Record how the current item was resolved ('unchanged', 'structured_data', 'llm_cache', 'browser', 'error', 'circuit_open')."""
+    item = _current_item.get()
+    if item is not None:
+        item.resolution = resolution
+
+
+def set_failure(kind: str):
+    """Record the kind of failure the current item ran into, see services/circuit_breaker.py."""
+    run_metrics.counters[f'failures_{kind}'] += 1
+    item = _current_item.get()
+    if item is not None:
+        item.failure = kind
+
+
+def record_retry():
+    """Count a retried attempt, on the current item and for the run."""
+    run_metrics.counters['retries'] += 1
+    item = _current_item.get()
+    if item is not None:
+        item.retries += 1
+
+
+def instrument_llm(llm):
+    """
+    Wrap a browser_use chat model's ainvoke to record call latency and token usage on the
+    current item. Returns the same model instance.
+    """
+    original_ainvoke = llm.ainvoke
+
+    async def timed_ainvoke(messages, output_format=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            return_value = await original_ainvoke(messages, output_format, **kwargs)
+        finally:
+            item = _current_item.get()
+            if item is not None:
+                item.add_span("llm_call", time.perf_counter() - started)
+                item.llm_calls += 1
+        usage = getattr(return_value, "usage", None)
+        if item is not None and usage is not None:
+            item.input_tokens += usage.prompt_tokens
+            item.output_tokens += usage.completion_tokens
+        return return_value
+
+    setattr(llm, 'ainvoke', timed_ainvoke)
+    return llm
+
+
+def record_agent_history(history):
+    """Add the step count and per-step durations of a finished Agent run to the current item."""
+    item = _current_item.get()
+    if item is None:
+        return
+    item.agent_steps += history.number_of_steps()
+    for step in history.history:
+        if step.metadata is not None:
+            item.add_span("agent_step", step.metadata.duration_seconds)
@@ -0,0 +1,220 @@
+import asyncio
+import heapq
+import logging
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import List, Dict, Any, Callable, Awaitable, Optional, Tuple, AsyncIterator, AsyncIterable
+from urllib.parse import urlparse
+
+from config import MAX_CONCURRENT_REQUESTS, PER_DOMAIN_CONCURRENCY, PER_DOMAIN_REQUESTS_PER_MINUTE, ITEM_TIMEOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+def domain_of(url: str) -> str:
+    """Return the host of a URL without a leading 'www.'."""
+    host = urlparse(url or "").netloc.lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+class _ItemDeadline:
+    """The per-item timeout of the item a task processes; `expired` is set before the task is cancelled for it."""
+
+    def __init__(self):
+        self.expired = False
+
+
+_item_deadline: ContextVar[Optional[_ItemDeadline]] = ContextVar("item_deadline", default=None)
+
+
+def item_timed_out() -> bool:
+    """
+    Whether the item processed by the current task ran out of time (ScrapeScheduler's item_timeout).
+
+    Meant for CancelledError handlers, to tell the per-item timeout from other cancellations,
+    e.g. at shutdown.
+    """
+    deadline = _item_deadline.get()
+    return deadline is not None and deadline.expired
+
+
+class TokenBucket:
+    """An async token bucket allowing `rate` acquisitions per second with bursts up to `capacity`; a rate of 0 or less means no limit."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ScrapeScheduler:
+    """
+    Runs items through an async worker pool with per-domain concurrency caps and rate limits.
+
+    Workers pull the next item from a priority queue as soon as they finish one. An item whose
+    domain is already at its concurrency cap is parked until a slot on that domain frees up, so
+    a busy retailer never stalls workers that could be scraping other sites. Items are objects
+    with a `url` attribute and optionally a `priority` (lowest first), e.g. models.TrackedItem,
+    whose priority is its rank in the check schedule.
+    """
+
+    def __init__(
+        self,
+        worker: Callable[[Any], Awaitable[Any]],
+        max_workers: int = MAX_CONCURRENT_REQUESTS,
+        per_domain_concurrency: int = PER_DOMAIN_CONCURRENCY,
+        per_domain_requests_per_minute: float = PER_DOMAIN_REQUESTS_PER_MINUTE,
+        item_timeout: Optional[float] = ITEM_TIMEOUT_SECONDS,
+    ):
+        """
+        Initialize the scheduler.
+
+        Args:
+            worker: Coroutine function processing one item.
+            max_workers: Number of items processed concurrently across all domains.
+            per_domain_concurrency: Maximum number of items processed concurrently per domain.
+            per_domain_requests_per_minute: Token-bucket rate at which items of one domain are started,
+                or 0 for no limit.
+            item_timeout: Seconds after which a single item is abandoned, or None for no limit.
+        """
+        self.worker = worker
+        self.max_workers = max(1, max_workers)
+        self.per_domain_concurrency = max(1, per_domain_concurrency)
+        self.item_timeout = item_timeout
+        rate_per_second = per_domain_requests_per_minute / 60.0
+        self._buckets: Dict[str, TokenBucket] = defaultdict(
+            lambda: TokenBucket(rate_per_second, max(1.0, float(self.per_domain_concurrency)))
+        )
+        self._active: Dict[str, int] = defaultdict(int)
+        self._parked: Dict[str, List[Tuple[float, int, Any]]] = defaultdict(list)
+
+    async def _worker_loop(self, queue: asyncio.PriorityQueue, results: asyncio.Queue):
+        while True:
+            priority, seq, item = await queue.get()
+            domain = domain_of(item.url)
+            if self._active[domain] >= self.per_domain_concurrency:
+                heapq.heappush(self._parked[domain], (priority, seq, item))
+                queue.task_done()
+                continue
+
+            self._active[domain] += 1
+            try:
+                await self._buckets[domain].acquire()
+                result = await self._run_item(item)
+            except asyncio.TimeoutError as e:
+                logger.error(f"Timed out after {self.item_timeout}s processing {item.url}")
+                result = e
+            except Exception as e:
+                result = e
+            finally:
+                self._active[domain] -= 1
+                if self._parked[domain]:
+                    queue.put_nowait(heapq.heappop(self._parked[domain]))
+                queue.task_done()
+            results.put_nowait((item, result))
+
+    async def _run_item(self, item: Any) -> Any:
+        """
+        Run the worker on an item in its own task, cancelling it after item_timeout.
+
+        Like asyncio.wait_for, but the worker can tell the timeout from other cancellations, see
+        item_timed_out.
+
+        Raises:
+            asyncio.TimeoutError: If the item took longer than item_timeout.
+        """
+        deadline = _ItemDeadline()
+        token = _item_deadline.set(deadline)
+        try:
+            # The task copies the current context, deadline included
+            task = asyncio.ensure_future(self.worker(item))
+        finally:
+            _item_deadline.reset(token)
+        try:
+            done, _ = await asyncio.wait({task}, timeout=self.item_timeout)
+        except asyncio.CancelledError:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            raise
+        if not done:
+            deadline.expired = True
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            raise asyncio.TimeoutError()
+        return task.result()
+
+    async def stream_batches(self, batches: AsyncIterable[List[Any]]) -> AsyncIterator[Tuple[Any, Any]]:
+        """
+        Process items as their batches arrive and yield (item, result) pairs in completion order.
+
+        Workers start on the first batch while the next ones are still being produced, e.g. loaded
+        from Notion. Within what has arrived, items are started in ascending order of their
+        optional `priority` attribute (default 0). Exceptions raised by the worker, including
+        timeouts, are yielded in place of a result; an exception raised by `batches` is re-raised.
+        """
+        queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        # (item, result) pairs, then None once every batch was queued
+        results: asyncio.Queue = asyncio.Queue()
+        queued = 0
+
+        async def feed():
+            nonlocal queued
+            try:
+                async for batch in batches:
+                    for item in batch:
+                        queue.put_nowait((getattr(item, 'priority', 0), queued, item))
+                        queued += 1
+            finally:
+                results.put_nowait(None)
+
+        feeder = asyncio.create_task(feed())
+        workers = [asyncio.create_task(self._worker_loop(queue, results)) for _ in range(self.max_workers)]
+        try:
+            finished, fed = 0, False
+            while not fed or finished < queued:
+                entry = await results.get()
+                if entry is None:
+                    fed = True
+                    # Raise the exception of the batch source, if any
+                    feeder.result()
+                    continue
+                finished += 1
+                yield entry
+        finally:
+            for task in workers + [feeder]:
+                task.cancel()
+            await asyncio.gather(*workers, feeder, return_exceptions=True)
+
+    async def stream(self, items: List[Any]) -> AsyncIterator[Tuple[Any, Any]]:
+        """Process all items and yield (item, result) pairs in completion order, see stream_batches()."""
+        async for item, result in self.stream_batches(single_batch(items)):
+            yield item, result
+
+    async def run(self, items: List[Any]) -> List[Any]:
+        """Process all items and return their results in input order, see stream()."""
+        results = {id(item): None for item in items}
+        async for item, result in self.stream(items):
+            results[id(item)] = result
+        return [results[id(item)] for item in items]
+
+
+async def single_batch(items: List[Any]) -> AsyncIterator[List[Any]]:
+    """Pass a list where a stream of batches is expected."""
+    yield items
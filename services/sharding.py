@@ -0,0 +1,107 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import date
+from typing import List, Dict, Tuple
+
+from models.WishListItem import WishlistItem
+from models.TrackedItem import TrackedItem
+from config import SHARD_RESULTS_DIR
+
+logger = logging.getLogger(__name__)
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """
+    Parse a shard given as "I/N" (zero-based index I of N shards).
+
+    Raises:
+        ValueError: If the spec is malformed or the index is out of range.
+    """
+    index, _, count = spec.partition("/")
+    shard_index, shard_count = int(index), int(count)
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError(f"Invalid shard {spec!r}, expected I/N with 0 <= I < N")
+    return shard_index, shard_count
+
+
+def parse_shard_count(spec: str) -> int:
+    """
+    Parse a number of shards, as given to --merge, --local-shards and --from-shards.
+
+    Raises:
+        ValueError: If the spec is not a whole number of at least 1.
+    """
+    shard_count = int(spec)
+    if shard_count < 1:
+        raise ValueError(f"Invalid shard count {spec!r}, expected at least 1")
+    return shard_count
+
+
+def shard_of(page_id: str, shard_count: int) -> int:
+    """
+    The shard a Notion page belongs to.
+
+    Uses a hash that is the same in every process (unlike hash()), so an item always lands on the
+    same worker and that worker's caches (page state, price history, recipes) stay warm for it.
+    """
+    digest = hashlib.sha1(page_id.replace("-", "").encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % shard_count
+
+
+def claim_shard(items_data: List[TrackedItem], shard_index: int, shard_count: int) -> List[TrackedItem]:
+    """The items (as yielded by NotionLoader.load_items) that belong to one shard."""
+    return [item_data for item_data in items_data if shard_of(item_data.page_id, shard_count) == shard_index]
+
+
+def shard_result_path(run_date: date, shard_index: int, shard_count: int, directory: str = SHARD_RESULTS_DIR) -> str:
+    return os.path.join(directory, f"shard-{run_date.isoformat()}-{shard_index}-of-{shard_count}.json")
+
+
+def write_shard_result(run_date: date, shard_index: int, shard_count: int, items: List[WishlistItem], recipients_by_page: Dict[str, List[str]],
+                       directory: str = SHARD_RESULTS_DIR) -> str:
+    """
+    Atomically write a worker's processed items, including their price stats and recipients, for the merge step.
+
+    Returns:
+        The path of the result file.
+    """
+    path = shard_result_path(run_date, shard_index, shard_count, directory)
+    result = {
+        'run_date': run_date.isoformat(),
+        'shard_index': shard_index,
+        'shard_count': shard_count,
+        'items': [item.model_dump(mode="json") for item in items],
+        'recipients_by_page': {item.page_id: recipients_by_page.get(item.page_id, []) for item in items},
+    }
+    os.makedirs(directory, exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(result, f)
+    os.replace(path + ".tmp", path)
+    logger.info(f"Wrote {len(items)} item(s) of shard {shard_index}/{shard_count} to {path}")
+    return path
+
+
+def load_shard_results(run_date: date, shard_count: int, directory: str = SHARD_RESULTS_DIR) -> Tuple[List[WishlistItem], Dict[str, List[str]], List[int]]:
+    """
+    Read the results all workers of a day's run wrote.
+
+    Returns:
+        The items of every shard that finished, in shard order, the recipients of every item by
+        page ID, and the indexes of the shards whose result is missing or unreadable.
+    """
+    items: List[WishlistItem] = []
+    recipients_by_page: Dict[str, List[str]] = {}
+    missing: List[int] = []
+    for shard_index in range(shard_count):
+        path = shard_result_path(run_date, shard_index, shard_count, directory)
+        try:
+            with open(path, encoding="utf-8") as f:
+                result = json.load(f)
+            items.extend(WishlistItem.model_validate(item) for item in result['items'])
+            recipients_by_page.update(result['recipients_by_page'])
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"No usable result for shard {shard_index}/{shard_count} at {path}: {e}")
+            missing.append(shard_index)
+    return items, recipients_by_page, missing
@@ -0,0 +1,386 @@
+import json
+import logging
+import re
+import asyncio
+from html.parser import HTMLParser
+from typing import List, Dict, Any, Optional
+from urllib.parse import urljoin
+
+import requests
+
+from models.ScrapedProductData import ScrapedProductData
+from services.run_metrics import span
+from services.circuit_breaker import retry_async, TIMEOUT, NETWORK
+from config import HTTP_FETCH_ATTEMPTS, HTTP_TIMEOUT_SECONDS, HTTP_USER_AGENT, PREFERRED_BOTTOM_SIZE, PREFERRED_SHOE_SIZE, PREFERRED_TOP_SIZE
+
+logger = logging.getLogger(__name__)
+
+# schema.org / OpenGraph availability values that mean the product can be bought online
+AVAILABLE_STATES = {"instock", "in stock", "limitedavailability", "onlineonly", "preorder", "presale", "available for order"}
+UNAVAILABLE_STATES = {"outofstock", "out of stock", "oos", "soldout", "discontinued", "instoreonly"}
+
+# Attributes of form controls that look like a size picker ("size", "size-select", "pdp-size") but not a size guide
+SIZE_SELECTOR_PATTERN = re.compile(r"(?<![a-z])size(?![-_ ]?(guide|chart|fit))", re.IGNORECASE)
+SIZE_SELECTOR_TAGS = {"select", "input", "button", "fieldset", "ul"}
+# Elements without an end tag, whose itemprop value can only come from an attribute
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+
+
+class _StructuredDataParser(HTMLParser):
+    """Collects JSON-LD blocks, meta tags, microdata properties and size-picker hints from a page."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.json_ld_blocks: List[str] = []
+        self.meta: Dict[str, str] = {}
+        self.microdata: Dict[str, str] = {}
+        self.has_size_selector = False
+        self._in_json_ld = False
+        self._json_ld_buffer: List[str] = []
+        # Text properties being read, innermost last; depth counts open elements of the same tag
+        self._text_captures: List[Dict[str, Any]] = []
+
+    def handle_starttag(self, tag, attrs):
+        attributes = {key.lower(): (value or "") for key, value in attrs}
+
+        if tag == "script" and attributes.get("type", "").lower() == "application/ld+json":
+            self._in_json_ld = True
+            self._json_ld_buffer = []
+            return
+
+        if tag == "meta":
+            key = (attributes.get("property") or attributes.get("name") or attributes.get("itemprop") or "").lower()
+            if key and "content" in attributes:
+                self.meta.setdefault(key, attributes["content"].strip())
+                if attributes.get("itemprop"):
+                    self.microdata.setdefault(attributes["itemprop"].lower(), attributes["content"].strip())
+            return
+
+        for capture in self._text_captures:
+            if capture["tag"] == tag:
+                capture["depth"] += 1
+
+        # An element with itemscope is a nested item, its properties are read from its children
+        itemprop = attributes.get("itemprop", "").lower()
+        if itemprop and itemprop not in self.microdata and "itemscope" not in attributes:
+            for value_attr in ("content", "src", "href"):
+                if attributes.get(value_attr):
+                    self.microdata[itemprop] = attributes[value_attr].strip()
+                    break
+            else:
+                if tag not in VOID_TAGS:
+                    self._text_captures.append({"tag": tag, "prop": itemprop, "text": [], "depth": 1})
+
+        if tag in SIZE_SELECTOR_TAGS and not self.has_size_selector:
+            for attr_name in ("name", "id", "class", "aria-label", "data-testid"):
+                if SIZE_SELECTOR_PATTERN.search(attributes.get(attr_name, "")):
+                    self.has_size_selector = True
+                    break
+
+    def handle_endtag(self, tag):
+        if tag == "script" and self._in_json_ld:
+            self.json_ld_blocks.append("".join(self._json_ld_buffer))
+            self._in_json_ld = False
+            return
+        for capture in list(self._text_captures):
+            if capture["tag"] != tag:
+                continue
+            capture["depth"] -= 1
+            if not capture["depth"]:
+                text = " ".join("".join(capture["text"]).split())
+                if text:
+                    self.microdata.setdefault(capture["prop"], text)
+                self._text_captures.remove(capture)
+
+    def handle_data(self, data):
+        if self._in_json_ld:
+            self._json_ld_buffer.append(data)
+        else:
+            for capture in self._text_captures:
+                capture["text"].append(data)
+
+
+def parse_price(value: Any) -> Optional[float]:
+    """Parse a price like 49.99, "1,299.00", "49,99" or "$ 1.299,00" into a float."""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+
+    # Separators at the ends come from the currency ("Rs. 499") or punctuation, not the number
+    cleaned = re.sub(r"[^\d.,]", "", str(value)).strip(".,")
+    if not cleaned or not any(ch.isdigit() for ch in cleaned):
+        return None
+
+    last_dot, last_comma = cleaned.rfind("."), cleaned.rfind(",")
+    if last_dot != -1 and last_comma != -1:
+        decimal_sep = "." if last_dot > last_comma else ","
+    elif last_comma != -1:
+        # "49,99" is a decimal comma, "1,299" is a thousands separator
+        decimal_sep = "," if len(cleaned) - last_comma - 1 == 2 else None
+    else:
+        decimal_sep = "." if cleaned.count(".") == 1 else None
+
+    thousands_sep = "," if decimal_sep != "," else "."
+    cleaned = cleaned.replace(thousands_sep, "")
+    if decimal_sep == ",":
+        cleaned = cleaned.replace(",", ".")
+    elif decimal_sep is None:
+        cleaned = cleaned.replace(".", "").replace(",", "")
+
+    try:
+        return float(cleaned)
+    except ValueError:
+        return None
+
+
+def _normalize_availability(value: Any) -> Optional[bool]:
+    """Map a schema.org or OpenGraph availability value to True/False, or None if unknown."""
+    if not value or not isinstance(value, str):
+        return None
+    state = value.rsplit("/", 1)[-1].strip().lower()
+    if state in AVAILABLE_STATES:
+        return True
+    if state in UNAVAILABLE_STATES:
+        return False
+    return None
+
+
+def _normalize_size(value: str) -> str:
+    return re.sub(r"\s+", " ", str(value)).strip().casefold()
+
+
+def matches_preferred_size(size: str) -> bool:
+    """Check a variant size against the configured shoe, top and bottom sizes."""
+    size = _normalize_size(size)
+    for preferred in (PREFERRED_SHOE_SIZE, PREFERRED_TOP_SIZE, PREFERRED_BOTTOM_SIZE):
+        if preferred and size == _normalize_size(preferred):
+            return True
+    return False
+
+
+def _types_of(node: Dict[str, Any]) -> List[str]:
+    node_type = node.get("@type", [])
+    if isinstance(node_type, str):
+        node_type = [node_type]
+    return [t.rsplit("/", 1)[-1].lower() for t in node_type if isinstance(t, str)]
+
+
+def _iter_json_ld_nodes(blocks: List[str]):
+    """Yield every JSON object found in the page's JSON-LD blocks, flattening lists and @graph."""
+    for block in blocks:
+        try:
+            data = json.loads(block.strip())
+        except ValueError:
+            logger.debug("Skipping malformed JSON-LD block")
+            continue
+        stack = [data]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(reversed(node))
+            elif isinstance(node, dict):
+                yield node
+                for nested_key in ("@graph", "mainEntity"):
+                    if nested_key in node:
+                        stack.append(node[nested_key])
+
+
+def _first_image(value: Any) -> str:
+    if isinstance(value, list):
+        value = value[0] if value else ""
+    if isinstance(value, dict):
+        value = value.get("url") or value.get("contentUrl") or ""
+    return value if isinstance(value, str) else ""
+
+
+def _offers_from_json_ld(node: Dict[str, Any], size: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Flatten Offer / AggregateOffer entries of a Product node into simple offer dicts."""
+    raw_offers = node.get("offers", [])
+    if isinstance(raw_offers, dict):
+        raw_offers = [raw_offers]
+
+    offers = []
+    for offer in raw_offers:
+        if not isinstance(offer, dict):
+            continue
+        if "aggregateoffer" in _types_of(offer) and offer.get("offers"):
+            offers.extend(_offers_from_json_ld(offer, size))
+            continue
+
+        original_price = None
+        specs = offer.get("priceSpecification", [])
+        if isinstance(specs, dict):
+            specs = [specs]
+        for spec in specs:
+            if isinstance(spec, dict) and str(spec.get("priceType", "")).rsplit("/", 1)[-1] in ("ListPrice", "StrikethroughPrice", "SRP"):
+                original_price = parse_price(spec.get("price"))
+
+        price = offer.get("price", offer.get("lowPrice"))
+        if price is None:
+            for spec in specs:
+                if isinstance(spec, dict) and spec.get("price") is not None:
+                    price = spec.get("price")
+                    break
+
+        item_offered = offer.get("itemOffered") if isinstance(offer.get("itemOffered"), dict) else {}
+        offers.append({
+            'price': parse_price(price),
+            'original_price': original_price,
+            'available': _normalize_availability(offer.get("availability")),
+            'size': offer.get("size") or item_offered.get("size") or size,
+        })
+    return offers
+
+
+def _collect_product(parser: _StructuredDataParser, page_url: str) -> Dict[str, Any]:
+    """Merge JSON-LD, OpenGraph/product meta tags and microdata into one product description."""
+    product: Dict[str, Any] = {'name': "", 'image_url': "", 'offers': []}
+
+    for node in _iter_json_ld_nodes(parser.json_ld_blocks):
+        types = _types_of(node)
+        if "product" not in types and "productgroup" not in types:
+            continue
+        product['name'] = product['name'] or str(node.get("name") or "").strip()
+        product['image_url'] = product['image_url'] or _first_image(node.get("image"))
+        product['offers'].extend(_offers_from_json_ld(node, node.get("size")))
+
+        variants = node.get("hasVariant", [])
+        if isinstance(variants, dict):
+            variants = [variants]
+        for variant in variants:
+            if isinstance(variant, dict):
+                product['image_url'] = product['image_url'] or _first_image(variant.get("image"))
+                product['offers'].extend(_offers_from_json_ld(variant, variant.get("size")))
+
+    meta = parser.meta
+    product['name'] = product['name'] or meta.get("og:title", "")
+    product['image_url'] = product['image_url'] or meta.get("og:image:secure_url") or meta.get("og:image", "")
+    meta_price = parse_price(meta.get("product:price:amount") or meta.get("og:price:amount"))
+    if meta_price is not None and not any(offer['price'] is not None for offer in product['offers']):
+        product['offers'].append({
+            'price': meta_price,
+            'original_price': parse_price(meta.get("product:original_price:amount")),
+            'available': _normalize_availability(meta.get("product:availability") or meta.get("og:availability")),
+            'size': None,
+        })
+
+    micro = parser.microdata
+    product['name'] = product['name'] or micro.get("name", "")
+    product['image_url'] = product['image_url'] or micro.get("image", "")
+    micro_price = parse_price(micro.get("price") or micro.get("lowprice"))
+    if micro_price is not None and not any(offer['price'] is not None for offer in product['offers']):
+        product['offers'].append({
+            'price': micro_price,
+            'original_price': None,
+            'available': _normalize_availability(micro.get("availability")),
+            'size': None,
+        })
+
+    if product['image_url'] and not product['image_url'].startswith("data:"):
+        product['image_url'] = urljoin(page_url, product['image_url'])
+    else:
+        product['image_url'] = ""
+    return product
+
+
+def extract_from_html(html: str, url: str) -> Optional[ScrapedProductData]:
+    """
+    Build ScrapedProductData from structured data embedded in a product page.
+
+    Args:
+        html: The raw HTML of the product page.
+        url: The page URL, used for the result and to resolve relative image URLs.
+
+    Returns:
+        The extracted product, or None when the page does not expose enough data or
+        the preferred size can only be checked by interacting with the page.
+    """
+    parser = _StructuredDataParser()
+    try:
+        parser.feed(html)
+        parser.close()
+    except Exception as e:
+        logger.debug(f"HTML parsing failed for {url}: {e}")
+        return None
+
+    product = _collect_product(parser, url)
+    offers = [offer for offer in product['offers'] if offer['price'] is not None or offer['available'] is not None]
+    if not product['name'] or not offers:
+        return None
+
+    sized_offers = [offer for offer in offers if offer['size']]
+    if sized_offers:
+        matching = [offer for offer in sized_offers if matches_preferred_size(offer['size'])]
+        if not matching:
+            # Size labels we can't map to the preferred sizes; let the Agent look at the picker
+            return None
+        candidates = matching
+    elif parser.has_size_selector:
+        return None
+    else:
+        candidates = offers
+
+    chosen = next((offer for offer in candidates if offer['available'] is not False and offer['price'] is not None), None)
+    if chosen is None:
+        if all(offer['available'] is False for offer in candidates):
+            price, discount = -1.0, 0.0
+        else:
+            return None
+    else:
+        price = chosen['price']
+        original_price = chosen['original_price']
+        discount = 0.0
+        if original_price and original_price > price > 0:
+            discount = round((original_price - price) / original_price * 100, 1)
+
+    return ScrapedProductData(
+        name=product['name'],
+        url=url,
+        price=price,
+        discount=discount,
+        image_url=product['image_url'],
+    )
+
+
+def _fetch_html(url: str) -> Optional[str]:
+    response = requests.get(url, headers={"User-Agent": HTTP_USER_AGENT, "Accept": "text/html"}, timeout=HTTP_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    if "html" not in response.headers.get("Content-Type", "text/html"):
+        return None
+    return response.text
+
+
+async def fetch_html(url: str) -> Optional[str]:
+    """
+    Fetch a page over plain HTTP, returning its HTML or None if it isn't an HTML page or the request failed.
+
+    Timeouts, connection errors and server errors are retried with backoff (HTTP_FETCH_ATTEMPTS).
+    """
+    async def fetch() -> Optional[str]:
+        with span("http_fetch"):
+            return await asyncio.to_thread(_fetch_html, url)
+
+    try:
+        return await retry_async(fetch, HTTP_FETCH_ATTEMPTS, {TIMEOUT, NETWORK}, f"Plain HTTP fetch of {url}")
+    except requests.exceptions.RequestException as e:
+        logger.info(f"Plain HTTP fetch failed for {url}: {e}")
+        return None
+
+
+async def extract_structured_product(url: str, html: Optional[str] = None) -> Optional[ScrapedProductData]:
+    """
+    Fetch a product page over plain HTTP and extract it from JSON-LD, meta tags or microdata.
+
+    Args:
+        url: The product page URL.
+        html: The page HTML if it was already fetched, to avoid a second request.
+
+    Returns:
+        The extracted product, or None if the Agent is needed for this page.
+    """
+    if html is None:
+        html = await fetch_html(url)
+    if not html:
+        return None
+    return extract_from_html(html, url)
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+import re
+from typing import Dict, Any, Iterable
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+
+from services.scheduler import domain_of
+from config import HTTP_TIMEOUT_SECONDS, HTTP_USER_AGENT
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that only track the visitor and never select a different product
+TRACKING_PARAMS = {"gclid", "fbclid", "msclkid", "mc_cid", "mc_eid", "ref", "ref_", "_ga", "igshid", "affid", "affextparam1", "srsltid"}
+# Host prefixes of mobile sites that serve the same products as the desktop site
+MOBILE_HOST_PREFIXES = ("m.", "mobile.")
+# Link shorteners whose target is only known after following the redirect
+SHORT_LINK_HOSTS = {"amzn.to", "amzn.eu", "fkrt.it", "fkrt.cc", "myntr.it", "bit.ly", "tinyurl.com", "t.co"}
+
+# Per-retailer rules, keyed by host without "www." or mobile prefix:
+#   hosts: other hosts of the same shop, folded onto this one
+#   product_path: regex whose groups identify the product anywhere in the path, so slugs and
+#       language segments around them don't matter (capture the country where it changes the price)
+#   product_params: the query parameters that select the product; all others are dropped
+RETAILER_RULES: Dict[str, Dict[str, Any]] = {
+    "amazon.in": {"product_path": r"/(?:dp|gp/product|gp/aw/d)/(?P<id>[A-Z0-9]{10})(?:[/?]|$)"},
+    "flipkart.com": {"hosts": ["dl.flipkart.com"], "product_params": ["pid"]},
+    "myntra.com": {"product_path": r"/(?P<id>\d{5,})(?:/buy)?$"},
+    "ajio.com": {"product_path": r"/p/(?P<id>[0-9]+(?:_[a-z0-9]+)?)$"},
+    "hm.com": {"hosts": ["www2.hm.com"], "product_path": r"/[a-z]{2}_(?P<country>[a-z]{2})/productpage\.(?P<id>\d+)\.html"},
+    "nike.com": {"product_path": r"/t/[^/]+/(?P<id>[A-Za-z0-9]+-\d{3})$"},
+}
+_HOST_ALIASES = {alias: host for host, rule in RETAILER_RULES.items() for alias in rule.get("hosts", [])}
+
+
+def normalize_url(url: str) -> str:
+    """Lower-case scheme and host, drop the fragment and tracking parameters, and sort the query."""
+    parts = urlsplit(url.strip())
+    query = sorted(
+        (name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not name.lower().startswith("utm_") and name.lower() not in TRACKING_PARAMS
+    )
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", urlencode(query), ""))
+
+
+def _shop_host(url: str) -> str:
+    host = _HOST_ALIASES.get(urlsplit(url).netloc.lower(), domain_of(url))
+    for prefix in MOBILE_HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    return _HOST_ALIASES.get(host, host)
+
+
+def product_key(url: str) -> str:
+    """
+    Identify the product a URL points at, so different URLs of the same product compare equal.
+
+    Tracking parameters, fragments, "www." and mobile hosts are ignored everywhere. For retailers
+    in RETAILER_RULES, the key is the retailer's product ID. The key looks like a URL but isn't
+    meant to be opened; scrape one of the original URLs instead.
+    """
+    parts = urlsplit(normalize_url(url))
+    host = _shop_host(url)
+    path = parts.path.rstrip("/") or "/"
+    rule = RETAILER_RULES.get(host, {})
+
+    if "product_path" in rule:
+        match = re.search(rule["product_path"], path)
+        if match:
+            return f"https://{host}/{'/'.join(match.groups())}"
+    if "product_params" in rule:
+        selected = [(name, value) for name, value in parse_qsl(parts.query) if name in rule["product_params"]]
+        if selected:
+            return f"https://{host}/?{urlencode(selected)}"
+    return urlunsplit(("https", host, path, parts.query, ""))
+
+
+def _follow_redirects(url: str) -> str:
+    headers = {"User-Agent": HTTP_USER_AGENT}
+    # Not all shorteners answer HEAD, so GET without reading the body
+    with requests.get(url, headers=headers, timeout=HTTP_TIMEOUT_SECONDS, allow_redirects=True, stream=True) as response:
+        return response.url
+
+
+async def resolve_short_links(urls: Iterable[str]) -> Dict[str, str]:
+    """
+    Follow the redirects of short links (SHORT_LINK_HOSTS) concurrently.
+
+    Returns:
+        The target URL of every short link that could be resolved, by short link.
+    """
+    short_links = sorted({url for url in urls if urlsplit(url).netloc.lower() in SHORT_LINK_HOSTS})
+    if not short_links:
+        return {}
+    results = await asyncio.gather(*(asyncio.to_thread(_follow_redirects, url) for url in short_links), return_exceptions=True)
+    resolved = {}
+    for url, result in zip(short_links, results):
+        if isinstance(result, Exception):
+            logger.info(f"Could not resolve short link {url}: {result}")
+        else:
+            resolved[url] = result
+    return resolved
+
+
+async def product_keys(urls: Iterable[str]) -> Dict[str, str]:
+    """The product key (see product_key) of every URL, following short links first."""
+    urls = set(urls)
+    resolved = await resolve_short_links(urls)
+    return {url: product_key(resolved.get(url, url)) for url in urls}
+
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Run against a throwaway cache, since config and some services open their stores on import
+os.environ["CACHE_DIR"] = tempfile.mkdtemp(prefix="price-tracker-tests-")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+import requests
+
+import services.change_detector as change_detector
+from models.ScrapedProductData import ScrapedProductData
+from services.change_detector import PageStateStore, _fingerprint, page_fingerprint
+
+
+def _price_change_detected(html: str) -> bool:
+    return page_fingerprint(html) != page_fingerprint(html.replace("1999", "999"))
+
+
+@pytest.mark.parametrize("html", [
+    # Void elements whose attributes look like noise never get an end tag
+    '<div><img class="related-thumb" src="a.jpg"><span class="price">1999</span></div>',
+    '<form><input aria-label="newsletter" name="email"></form><p>Price: 1999</p>',
+    '<div><img class="recommended" src="a.jpg"/><span>1999</span></div>',
+    # Noise blocks left unclosed end with their parent
+    '<ul><li class="recommended">Other product 499<li>This product 1999</ul>',
+    '<div><div class="similar-items">Other product<p>499</div><span>1999</span></div>',
+    '<section><ul class="related"><li>a<li>b</section><b>1999</b>',
+])
+def test_price_after_noise_markup_changes_fingerprint(html):
+    assert _price_change_detected(html)
+
+
+def test_noise_and_boilerplate_are_ignored():
+    html = (
+        '<header>Menu 3</header><div><span>1999</span>'
+        '<div class="recommendations"><p>Other product 55</p></div></div><footer>Footer</footer>'
+    )
+    assert page_fingerprint(html) == page_fingerprint(html.replace("55", "66"))
+    assert page_fingerprint(html) == page_fingerprint(html.replace("Menu 3", "Menu 4"))
+    assert _price_change_detected(html)
+
+
+def test_json_ld_is_kept():
+    html = '<script type="application/ld+json">{"offers": {"price": "1999"}}</script><script>var nonce = 1;</script>'
+    assert _price_change_detected(html)
+    assert page_fingerprint(html) == page_fingerprint(html.replace("nonce = 1", "nonce = 2"))
+
+
+@pytest.mark.parametrize("html", [
+    # Buy box in an <aside>
+    '<main><h1>Shoe</h1><img src="a.jpg"></main><aside class="buy-box"><span>$59.00</span><button>Add to cart</button></aside>',
+    '<main><h1>Shoe</h1></main><aside><div itemprop="offers"><span itemprop="price">59.00</span></div></aside>',
+    # Price inside a wrapper whose class also matches the review noise
+    '<div><h1>Shoe</h1><div class="price-and-reviews-summary"><span>$59.00</span> 4.5 stars</div></div>',
+    '<div><h1>Shoe</h1><div class="reviews-summary"><span class="product-price">$59.00</span></div></div>',
+    '<aside><meta itemprop="price" content="59.00"></aside>',
+])
+def test_price_in_skipped_or_noise_blocks_changes_fingerprint(html):
+    assert page_fingerprint(html) != page_fingerprint(html.replace("59", "49"))
+
+
+def test_prices_of_other_products_are_ignored():
+    html = '<span class="price">$59.00</span><div class="you-may-also-like"><span class="price">$12.00</span></div>'
+    assert page_fingerprint(html) == page_fingerprint(html.replace("12.00", "13.00"))
+
+
+@pytest.mark.parametrize("html, has_price", [
+    ('<div id="root"></div><script src="app.js"></script>', False),
+    ('<h1>Shoe</h1><p>Loading...</p>', False),
+    ('<h1>Shoe</h1><span>&#8377;1,999</span>', True),
+    ('<h1>Shoe</h1><span class="price">1999</span>', True),
+    ('<script type="application/ld+json">{"offers": {"price": "1999"}}</script>', True),
+])
+def test_notes_whether_the_page_shows_a_price(html, has_price):
+    assert _fingerprint(html)[1] is has_price
+
+
+@pytest.mark.parametrize("html, unchanged", [
+    ('<div id="root"></div><script src="/app.js"></script>', False),
+    ('<h1>Shoe</h1><span class="price">&#8377;1,999</span>', True),
+])
+def test_only_pages_showing_a_price_count_as_unchanged(tmp_path, monkeypatch, html, unchanged):
+    def get(url, headers, timeout):
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["Content-Type"] = "text/html"
+        response._content = html.encode("utf-8")
+        response.encoding = "utf-8"
+        return response
+
+    monkeypatch.setattr(change_detector.requests, "get", get)
+    store = PageStateStore(path=str(tmp_path / "page_state.sqlite3"))
+    url = "https://shop.example/products/1"
+    first = asyncio.run(store.check(url))
+    store.save(first, ScrapedProductData(name="Shoe", url=url, price=1999.0, discount=0.0, image_url=""))
+    assert asyncio.run(store.check(url)).unchanged is unchanged
+    store.close()
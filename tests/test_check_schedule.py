@@ -0,0 +1,38 @@
+import asyncio
+
+from models.TrackedItem import TrackedItem
+from models.WishListItem import WishlistItem
+from services.check_schedule import CheckSchedule
+from services.scheduler import ScrapeScheduler
+
+NOW = 1_000_000.0
+
+
+def tracked(index, lowest=None):
+    return TrackedItem(f"page-{index}", f"https://shop{index}.example/products/{index}", lowest)
+
+
+def test_plan_ranks_items_and_the_scheduler_starts_them_in_that_order(tmp_path):
+    schedule = CheckSchedule(path=str(tmp_path / "schedule.sqlite3"), min_interval_hours=1, max_interval_hours=1)
+    # Checked before: page-0 is far from its low, page-1 close to it
+    for index, price in ((0, 200.0), (1, 101.0)):
+        schedule.record(WishlistItem(page_id=f"page-{index}", name="Item", url=tracked(index).url, price=price, discount=0.0, image_url=""),
+                        now=NOW - 7200)
+    items = [tracked(0, lowest=100.0), tracked(1, lowest=100.0), tracked(2)]
+
+    to_scrape, _ = schedule.plan(items, budget_items=0, budget_tokens=0, now=NOW)
+    schedule.close()
+    # Never checked first, then closest to its lowest price
+    assert [(item.page_id, item.priority) for item in sorted(to_scrape, key=lambda item: item.priority)] == [
+        ("page-2", 0), ("page-1", 1), ("page-0", 2)
+    ]
+
+    started = []
+
+    async def worker(item):
+        started.append(item.page_id)
+
+    async def run():
+        await ScrapeScheduler(worker, max_workers=1, per_domain_requests_per_minute=0, item_timeout=None).run(items)
+    asyncio.run(run())
+    assert started == ["page-2", "page-1", "page-0"]
@@ -0,0 +1,24 @@
+from services.circuit_breaker import BOT_WALL, LLM, NETWORK, PARSE, TIMEOUT, CircuitBreakers
+
+
+def make_breakers(tmp_path, threshold=3):
+    return CircuitBreakers(path=str(tmp_path / "breakers.sqlite3"), failure_threshold=threshold)
+
+
+def test_site_failures_open_the_breaker(tmp_path):
+    breakers = make_breakers(tmp_path)
+    for kind in (TIMEOUT, BOT_WALL, NETWORK):
+        assert breakers.allow("shop.example", now=0)
+        breakers.record_failure("shop.example", kind, now=0)
+    assert not breakers.allow("shop.example", now=1)
+    breakers.close()
+
+
+def test_parse_and_llm_failures_do_not_count(tmp_path):
+    breakers = make_breakers(tmp_path, threshold=2)
+    for kind in (PARSE, PARSE, LLM, PARSE):
+        breakers.record_failure("shop.example", kind, now=0)
+    assert breakers.allow("shop.example", now=1)
+    breakers.record_failure("shop.example", TIMEOUT, now=1)
+    assert breakers.allow("shop.example", now=2)
+    breakers.close()
@@ -0,0 +1,60 @@
+import smtplib
+
+import pytest
+
+import services.email_sender as email_sender_module
+from models.WishListItem import WishlistItem
+from services.email_sender import EmailSender
+
+
+class FakeSMTP:
+    """Accepts every message except to the addresses in `refused`, and the ones in `rejected` at the DATA stage."""
+
+    refused = set()
+    rejected = set()
+    delivered = []
+
+    def __init__(self, host, port):
+        pass
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def sendmail(self, sender, recipient, message):
+        if recipient in self.refused:
+            raise smtplib.SMTPRecipientsRefused({recipient: (550, b"No such user")})
+        if recipient in self.rejected:
+            raise smtplib.SMTPDataError(554, b"Message rejected")
+        self.delivered.append(recipient)
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def sender(monkeypatch):
+    monkeypatch.setattr(email_sender_module, "SENDER_EMAIL", "tracker@example.com")
+    monkeypatch.setattr(email_sender_module, "SENDER_PASSWORD", "secret")
+    monkeypatch.setattr(email_sender_module.smtplib, "SMTP", FakeSMTP)
+    FakeSMTP.delivered = []
+    return EmailSender(messages_per_minute=0)
+
+
+def item():
+    return WishlistItem(page_id="page", name="Sneaker", url="https://shop.example/p/1", price=120.0, discount=0.0, image_url="")
+
+
+def test_a_refused_recipient_does_not_stop_the_others(sender, monkeypatch):
+    monkeypatch.setattr(FakeSMTP, "refused", {"bob@example.com"})
+    monkeypatch.setattr(FakeSMTP, "rejected", {"cy@example.com"})
+    digests = {email: [item()] for email in ("ann@example.com", "bob@example.com", "cy@example.com", "dee@example.com")}
+    with sender:
+        sent = sender.send_digests("Prices", digests)
+    assert sent == ["ann@example.com", "dee@example.com"]
+    assert FakeSMTP.delivered == sent
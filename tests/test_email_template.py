@@ -0,0 +1,33 @@
+from datetime import date
+
+from models.PriceStats import PriceStats
+from models.WishListItem import WishlistItem
+from services.email_sender import render_email
+
+
+def _item(**fields) -> WishlistItem:
+    return WishlistItem(page_id="page", name="Sneaker", url="https://shop.example/p/1", price=120.0, discount=0.0, image_url="", **fields)
+
+
+def test_lowest_chip_prefers_older_notion_low_over_short_local_history():
+    item = _item(
+        lowest_price_so_far=80.0, lowest_price_date=date(2025, 11, 28),
+        price_stats=PriceStats(all_time_low=120.0, all_time_low_date=date(2026, 10, 17), lowest_in_days=None, observations=2),
+    )
+    html = render_email([item])
+    assert "Lowest: 80.00 (Nov 28)" in html
+    assert "Lowest: 120.00" not in html
+    assert "Lowest tracked price" not in html
+
+
+def test_lowest_chip_uses_local_history_when_lower():
+    item = _item(
+        lowest_price_so_far=110.0, lowest_price_date=date(2026, 9, 1),
+        price_stats=PriceStats(all_time_low=95.0, all_time_low_date=date(2026, 10, 1), observations=5),
+    )
+    assert "Lowest: 95.00 (Oct 01)" in render_email([item])
+
+
+def test_lowest_chip_without_local_history():
+    item = _item(lowest_price_so_far=110.0, lowest_price_date=date(2026, 9, 1))
+    assert "Lowest: 110.00 (Sep 01)" in render_email([item])
@@ -0,0 +1,56 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+import services.extraction_recipes as extraction_recipes
+from services.extraction_recipes import READ_VALUES_JS, SIZE_PICKER_JS, replay_recipe
+
+URL = "https://shop.example/products/2"
+
+
+class FakePage:
+    def __init__(self, has_size_picker):
+        self.has_size_picker = has_size_picker
+
+    async def evaluate(self, script, arg=None):
+        if script == SIZE_PICKER_JS:
+            return self.has_size_picker
+        assert script == READ_VALUES_JS
+        return {"name": "Runner", "price": "₹2,499", "original_price": None, "image_url": "https://img.example/2.jpg"}
+
+    async def wait_for_timeout(self, milliseconds):
+        pass
+
+
+def recipe(steps=(), has_size_selector=False):
+    return {"url_pattern": "^/products/", "steps": list(steps), "has_size_selector": has_size_selector,
+            "name_selector": "h1", "price_selector": ".price", "original_price_selector": None, "image_selector": "img"}
+
+
+def replay(monkeypatch, page, learned):
+    @asynccontextmanager
+    async def open_page(url, browser_context=None):
+        yield page
+
+    monkeypatch.setattr(extraction_recipes, "_open_page", open_page)
+    return asyncio.run(replay_recipe(URL, learned))
+
+
+def test_recipe_without_size_step_falls_back_on_a_page_with_sizes(monkeypatch):
+    assert replay(monkeypatch, FakePage(has_size_picker=True), recipe()) is None
+
+
+def test_recipe_without_size_step_replays_on_a_page_without_sizes(monkeypatch):
+    product = replay(monkeypatch, FakePage(has_size_picker=False), recipe())
+    assert product is not None and product.price == 2499.0
+
+
+def test_recipe_with_size_step_uses_it(monkeypatch):
+    async def select_size(page, step):
+        return False
+
+    monkeypatch.setattr(extraction_recipes, "_select_size", select_size)
+    size_step = {"action": "select_size", "kind": "click", "xpath": "/html/body/button", "text": "9"}
+    product = replay(monkeypatch, FakePage(has_size_picker=True), recipe([size_step], has_size_selector=True))
+    assert product is not None and product.price == -1.0
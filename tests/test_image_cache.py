@@ -0,0 +1,85 @@
+import asyncio
+import io
+
+import httpx
+import pytest
+from PIL import Image
+
+from services.image_cache import ThumbnailCache
+
+
+def png_bytes() -> bytes:
+    output = io.BytesIO()
+    Image.new("RGB", (400, 300), (200, 30, 30)).save(output, "PNG")
+    return output.getvalue()
+
+
+def check(tmp_path, handler, url="https://img.example/a.png"):
+    async def run():
+        cache = ThumbnailCache(directory=str(tmp_path))
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            try:
+                return await cache._check(client, url)
+            finally:
+                cache.close()
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("status", [404, 410])
+def test_missing_image_is_broken(tmp_path, status):
+    assert check(tmp_path, lambda request: httpx.Response(status)) == ""
+
+
+def test_html_page_is_broken(tmp_path):
+    assert check(tmp_path, lambda request: httpx.Response(200, headers={"Content-Type": "text/html"}, text="<html></html>")) == ""
+
+
+@pytest.mark.parametrize("status", [401, 403, 429, 500, 503])
+def test_other_statuses_are_linked(tmp_path, status):
+    assert check(tmp_path, lambda request: httpx.Response(status)) is None
+
+
+def test_get_errors_after_head_405_are_linked(tmp_path):
+    def handler(request):
+        return httpx.Response(405 if request.method == "HEAD" else 403)
+    assert check(tmp_path, handler) is None
+
+
+def test_timeout_is_linked(tmp_path):
+    def handler(request):
+        raise httpx.ReadTimeout("timed out", request=request)
+    assert check(tmp_path, handler) is None
+
+
+def test_image_gets_a_thumbnail(tmp_path):
+    data = png_bytes()
+    def handler(request):
+        return httpx.Response(200, headers={"Content-Type": "image/png"}, content=b"" if request.method == "HEAD" else data)
+    path = check(tmp_path, handler)
+    assert path and path.startswith(str(tmp_path))
+
+
+def test_unexpected_errors_only_skip_that_image(tmp_path, monkeypatch):
+    cache = ThumbnailCache(directory=str(tmp_path))
+    original_check = cache._check
+
+    async def flaky_check(client, url):
+        if "bad" in url:
+            raise httpx.InvalidURL("Invalid non-printable ASCII character in URL")
+        return await original_check(client, url)
+
+    monkeypatch.setattr(cache, "_check", flaky_check)
+    monkeypatch.setattr(httpx, "AsyncClient", _mock_client(lambda request: httpx.Response(404)))
+    try:
+        thumbnails = asyncio.run(cache.prepare(["https://img.example/bad.png", "https://img.example/gone.png"]))
+    finally:
+        cache.close()
+    assert thumbnails == {"https://img.example/gone.png": ""}
+
+
+def _mock_client(handler):
+    real_client = httpx.AsyncClient
+
+    def make(**kwargs):
+        return real_client(transport=httpx.MockTransport(handler), **kwargs)
+    return make
@@ -0,0 +1,26 @@
+import asyncio
+import gc
+
+from services.llm_cache import ExtractionCache
+
+
+def test_locks_serialize_a_key_and_are_dropped_once_released(tmp_path):
+    cache = ExtractionCache(path=str(tmp_path / "llm_cache.sqlite3"))
+    active, overlapped = set(), []
+
+    async def extract(key):
+        async with cache.locked(key):
+            overlapped.append(key in active)
+            active.add(key)
+            await asyncio.sleep(0.01)
+            active.discard(key)
+
+    async def run():
+        await asyncio.gather(*(extract(f"key-{index % 3}") for index in range(9)))
+        assert len(cache._locks) == 0
+        await asyncio.gather(*(extract(f"other-{index}") for index in range(100)))
+    asyncio.run(run())
+    gc.collect()
+
+    assert overlapped == [False] * 109
+    assert len(cache._locks) == 0
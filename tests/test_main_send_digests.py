@@ -0,0 +1,31 @@
+import asyncio
+from datetime import date
+
+import main
+import services.email_sender as email_sender_module
+import services.image_cache as image_cache_module
+from models.Recipient import Recipient
+from models.WishListItem import WishlistItem
+
+
+class FakeEmailSender:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+    def send_digests(self, subject, digests, names, thumbnails):
+        return [email for email, items in digests.items() if items]
+
+
+def test_thumbnail_failures_do_not_block_the_email(monkeypatch):
+    async def broken_prepare(self, urls):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(main, "EMAIL_INLINE_THUMBNAILS", True)
+    monkeypatch.setattr(image_cache_module.ThumbnailCache, "prepare", broken_prepare)
+    monkeypatch.setattr(email_sender_module, "EmailSender", FakeEmailSender)
+    item = WishlistItem(page_id="page", name="Sneaker", url="https://shop.example/p/1", price=120.0, discount=0.0, image_url="https://img.example/a.png")
+    sent = asyncio.run(main.send_digests([item], [Recipient(email="ann@example.com")], {"page": ["ann@example.com"]}, date(2026, 1, 1)))
+    assert sent == ["ann@example.com"]
@@ -0,0 +1,33 @@
+import asyncio
+import functools
+
+import pytest
+
+import main
+from models.Recipient import Recipient
+from services.run_journal import RunJournal
+
+
+@pytest.mark.parametrize("argv", [["--merge", "0"], ["--local-shards", "0"], ["--local-shards", "-2"], ["render-email", "--from-shards", "0"]])
+def test_shard_counts_below_one_are_rejected(argv):
+    with pytest.raises(SystemExit):
+        main.parse_args(argv)
+
+
+def test_merge_does_not_email_recipients_twice(tmp_path, monkeypatch):
+    sent = []
+
+    async def send_digests(items, recipients, recipients_by_page, today):
+        emails = [recipient.email for recipient in recipients]
+        sent.append(emails)
+        # The second recipient's email fails the first time
+        return emails if len(sent) > 1 else emails[:1]
+
+    monkeypatch.setattr(main, "RunJournal", functools.partial(RunJournal, directory=str(tmp_path)))
+    monkeypatch.setattr(main, "load_recipients", lambda: [Recipient(email="ann@example.com"), Recipient(email="bob@example.com")])
+    monkeypatch.setattr(main, "load_shard_results", lambda today, shard_count: (["item"], {}, []))
+    monkeypatch.setattr(main, "send_digests", send_digests)
+
+    for _ in range(3):
+        asyncio.run(main.merge_shards(2))
+    assert sent == [["ann@example.com", "bob@example.com"], ["bob@example.com"]]
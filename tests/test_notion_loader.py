@@ -0,0 +1,102 @@
+import asyncio
+import functools
+from datetime import date
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import services.notion_loader as notion_loader_module
+from config import NOTION_URL_PROPERTY_NAME
+from devtools.fake_notion_server import FakeNotionServer, _now, make_page
+from services.notion_loader import NotionLoader
+from services.notion_snapshot import NotionSnapshot
+
+
+@pytest.fixture(autouse=True)
+def notion_config(tmp_path, monkeypatch):
+    monkeypatch.setattr(notion_loader_module, "NOTION_API_KEY", "secret_test")
+    monkeypatch.setattr(notion_loader_module, "NOTION_DATABASE_ID", "db")
+    monkeypatch.setattr(notion_loader_module, "NOTION_REQUESTS_PER_SECOND", 1000)
+    monkeypatch.setattr(notion_loader_module, "NotionSnapshot", functools.partial(NotionSnapshot, str(tmp_path / "snapshot.sqlite3")))
+
+
+def make_pages(count):
+    return [make_page(f"https://shop.example/products/{index}", lowest_price=100.0 + index, page_id=f"page-{index}") for index in range(count)]
+
+
+def load(server, use_snapshot=False):
+    async def run():
+        async with NotionLoader(base_url=server.base_url, use_snapshot=use_snapshot) as loader:
+            return [batch async for batch in loader.load_items()]
+    return asyncio.run(run())
+
+
+def queries(server):
+    return [path for method, path in server.request_log if method == "POST"]
+
+
+def test_pages_through_the_database_in_batches():
+    with FakeNotionServer(make_pages(250)) as server:
+        batches = load(server)
+    assert [len(batch) for batch in batches] == [100, 100, 50]
+    items = [item for batch in batches for item in batch]
+    assert [item.url for item in items] == [f"https://shop.example/products/{index}" for index in range(250)]
+    assert items[3].page_id == "page-3" and items[3].lowest_price_so_far == 103.0
+    assert len(queries(server)) == 3
+
+
+def test_requests_only_the_properties_it_uses():
+    with FakeNotionServer(make_pages(5)) as server:
+        load(server)
+    assert server.request_log[0] == ("GET", "/v1/databases/db")
+    query = parse_qs(urlparse(queries(server)[0]).query)
+    assert query["filter_properties"] == ["title", "lp=n", "lp=d"]
+
+
+def test_retries_rate_limited_requests():
+    with FakeNotionServer(make_pages(250), rate_limit_every=2) as server:
+        batches = load(server)
+    assert sum(len(batch) for batch in batches) == 250
+    # Every other request was answered with a 429: each of the 3 queries was sent twice
+    assert len(queries(server)) == 6
+
+
+def test_incremental_sync_only_fetches_edited_pages():
+    pages = make_pages(3)
+    with FakeNotionServer(pages) as server:
+        assert sum(len(batch) for batch in load(server, use_snapshot=True)) == 3
+
+        # Changed without a new last_edited_time: an incremental sync must not see it
+        pages[0]["properties"][NOTION_URL_PROPERTY_NAME]["title"][0]["text"]["content"] = "https://shop.example/unseen"
+        new_page = make_page("https://shop.example/products/new", page_id="page-new")
+        new_page["last_edited_time"] = _now()
+        pages.append(new_page)
+        server.request_log.clear()
+
+        items = [item for batch in load(server, use_snapshot=True) for item in batch]
+
+    assert sorted(item.page_id for item in items) == ["page-0", "page-1", "page-2", "page-new"]
+    assert "https://shop.example/unseen" not in {item.url for item in items}
+    # One query, answered with just the edited page
+    assert len(queries(server)) == 1
+
+
+def test_updating_an_archived_page_drops_it_from_the_snapshot():
+    pages = make_pages(3)
+    with FakeNotionServer(pages) as server:
+        load(server, use_snapshot=True)
+        # Archiving doesn't show up in an incremental sync: queries don't return archived pages
+        pages[1]["archived"] = True
+        pages[1]["last_edited_time"] = _now()
+
+        async def run():
+            async with NotionLoader(base_url=server.base_url, use_snapshot=True) as loader:
+                await loader.update_lowest_price("page-1", 90.0, date(2026, 1, 2))
+                await loader.update_lowest_price("page-deleted", 90.0, date(2026, 1, 2))
+                await loader.update_lowest_price("page-2", 90.0, date(2026, 1, 2))
+        asyncio.run(run())
+
+        items = [item for batch in load(server, use_snapshot=True) for item in batch]
+
+    assert sorted(item.page_id for item in items) == ["page-0", "page-2"]
+    assert pages[2]["properties"]["Lowest Price"]["number"] == 90.0
@@ -0,0 +1,27 @@
+from datetime import date
+
+from services.price_history import PriceHistory
+
+
+def test_replacing_the_all_time_low_on_the_same_day_recomputes_it(tmp_path):
+    history = PriceHistory(path=str(tmp_path / "history.sqlite3"))
+    history.record("page-1", 80.0, date(2026, 1, 1))
+    history.record("page-1", 50.0, date(2026, 1, 2))
+    # A later check the same day corrects the 50.0 misread
+    history.record("page-1", 90.0, date(2026, 1, 2))
+
+    stats = history.stats(["page-1"], today=date(2026, 1, 2))["page-1"]
+    history.close()
+    assert (stats.all_time_low, stats.all_time_low_date) == (80.0, date(2026, 1, 1))
+    assert stats.min_30d == 80.0
+    assert stats.observations == 2
+
+
+def test_a_lower_price_later_the_same_day_still_lowers_the_all_time_low(tmp_path):
+    history = PriceHistory(path=str(tmp_path / "history.sqlite3"))
+    history.record_many([("page-1", 80.0, date(2026, 1, 1)), ("page-1", 70.0, date(2026, 1, 2))])
+    history.record("page-1", 60.0, date(2026, 1, 2))
+
+    stats = history.stats(["page-1"], today=date(2026, 1, 2))["page-1"]
+    history.close()
+    assert (stats.all_time_low, stats.all_time_low_date) == (60.0, date(2026, 1, 2))
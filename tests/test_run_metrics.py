@@ -0,0 +1,13 @@
+from services.run_metrics import RunMetrics
+
+
+def test_summary_counts_how_items_were_resolved():
+    metrics = RunMetrics()
+    for index, resolution in enumerate(["unchanged", "unchanged", "structured_data", "browser", "circuit_open"]):
+        with metrics.track_item(f"https://shop.example/products/{index}") as item:
+            item.resolution = resolution
+    summary = metrics.summary(metrics.report())
+    assert (
+        "Items: 2 short-circuited (page unchanged), 1 from structured data, 1 in the browser, 1 skipped (circuit breaker open)"
+        in summary.splitlines()
+    )
@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+from services.scheduler import ScrapeScheduler, TokenBucket
+
+
+def test_zero_rate_means_no_limit():
+    async def run():
+        bucket = TokenBucket(0, 0)
+        for _ in range(100):
+            await bucket.acquire()
+    started = time.monotonic()
+    asyncio.run(asyncio.wait_for(run(), timeout=1))
+    assert time.monotonic() - started < 1
+
+
+def test_bucket_allows_a_burst_then_waits():
+    async def run():
+        bucket = TokenBucket(20, 2)
+        started = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        return time.monotonic() - started
+    assert 0.03 < asyncio.run(run()) < 0.5
+
+
+def test_scheduler_without_a_per_domain_rate_limit():
+    class Item:
+        def __init__(self, index):
+            self.url = f"https://shop.example/products/{index}"
+
+    async def worker(item):
+        return item.url
+
+    async def run():
+        scheduler = ScrapeScheduler(worker, max_workers=4, per_domain_concurrency=4, per_domain_requests_per_minute=0)
+        return [result async for _, result in scheduler.stream_batches(single([Item(index) for index in range(20)]))]
+
+    async def single(items):
+        yield items
+
+    assert len(asyncio.run(asyncio.wait_for(run(), timeout=5))) == 20
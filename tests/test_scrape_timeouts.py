@@ -0,0 +1,70 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+
+import services.product_tracker as product_tracker
+from services.circuit_breaker import CircuitBreakers
+from services.scheduler import ScrapeScheduler
+
+URL = "https://shop.example/products/1"
+
+
+class Item:
+    url = URL
+
+
+@pytest.fixture
+def breakers(tmp_path, monkeypatch):
+    breakers = CircuitBreakers(path=str(tmp_path / "breakers.sqlite3"), failure_threshold=1)
+    monkeypatch.setattr(product_tracker, "circuit_breakers", breakers)
+    monkeypatch.setattr(product_tracker, "CIRCUIT_BREAKER_ENABLED", True)
+    yield breakers
+    breakers.close()
+
+
+async def slow_scrape(url, lease):
+    await asyncio.sleep(10)
+
+
+def run_with_timeout(timeout):
+    async def worker(item):
+        return await product_tracker._scrape_with_cache(item.url, None, None, None)
+
+    async def run():
+        scheduler = ScrapeScheduler(worker, max_workers=1, per_domain_requests_per_minute=0, item_timeout=timeout)
+        return await scheduler.run([Item()])
+    return asyncio.run(run())
+
+
+def test_timeout_while_scraping_counts_against_the_site(breakers, monkeypatch):
+    monkeypatch.setattr(product_tracker, "_scrape_in_browser", slow_scrape)
+    [result] = run_with_timeout(0.05)
+    assert isinstance(result, asyncio.TimeoutError)
+    assert not breakers.allow("shop.example")
+
+
+def test_timeout_while_waiting_for_a_browser_does_not(breakers, monkeypatch):
+    @asynccontextmanager
+    async def busy_pool(browser_pool):
+        await asyncio.sleep(10)
+        yield None
+
+    monkeypatch.setattr(product_tracker, "_browser_lease", busy_pool)
+    monkeypatch.setattr(product_tracker, "_scrape_in_browser", slow_scrape)
+    [result] = run_with_timeout(0.05)
+    assert isinstance(result, asyncio.TimeoutError)
+    assert breakers.allow("shop.example")
+
+
+def test_shutdown_does_not_count_against_the_site(breakers, monkeypatch):
+    monkeypatch.setattr(product_tracker, "_scrape_in_browser", slow_scrape)
+
+    async def run():
+        task = asyncio.create_task(product_tracker._scrape_with_cache(URL, None, None, None))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(run())
+    assert breakers.allow("shop.example")
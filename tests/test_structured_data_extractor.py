@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+from services.structured_data_extractor import extract_from_html, parse_price
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "structured_data")
+PAGE_URL = "https://shop.example.com/p/123"
+
+
+def _extract(name: str):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return extract_from_html(f.read(), PAGE_URL)
+
+
+def test_json_ld_product_in_graph():
+    product = _extract("json_ld_product.html")
+    assert product.name == "Trail Runner 2"
+    assert product.price == 4499.0
+    assert product.discount == 25.0
+    assert product.image_url == "https://shop.example.com/images/trail-runner-2.jpg"
+    assert product.url == PAGE_URL
+
+
+def test_json_ld_variant_in_preferred_size():
+    # UK 9 (PREFERRED_SHOE_SIZE) is out of stock, even though other sizes aren't
+    product = _extract("json_ld_variants.html")
+    assert product.name == "Court Classic Sneaker"
+    assert product.price == -1.0
+    assert product.image_url == "https://cdn.example.com/court-classic.jpg"
+
+
+def test_opengraph_product():
+    product = _extract("opengraph_product.html")
+    assert product.name == "Linen Overshirt"
+    assert product.price == 1299.0
+    assert product.discount == 18.8
+    assert product.image_url == "https://cdn.example.com/linen-overshirt.jpg"
+
+
+def test_microdata_product_with_nested_properties():
+    product = _extract("microdata_product.html")
+    assert product.name == "Acme Canvas Tote"
+    assert product.price == 749.5
+    assert product.image_url == "https://shop.example.com/media/tote.jpg"
+
+
+def test_unavailable_product():
+    product = _extract("unavailable_product.html")
+    assert product.name == "Wool Beanie"
+    assert product.price == -1.0
+
+
+def test_size_picker_without_variants_needs_the_agent():
+    assert _extract("size_picker_only.html") is None
+
+
+def test_page_without_structured_data():
+    assert extract_from_html("<html><body><h1>Hello</h1><p>Rs. 499</p></body></html>", PAGE_URL) is None
+
+
+@pytest.mark.parametrize("value, expected", [
+    (49.99, 49.99), ("1,299.00", 1299.0), ("49,99", 49.99), ("$ 1.299,00", 1299.0), ("1,299", 1299.0), ("Rs. 4,499", 4499.0),
+    ("free", None), (None, None), (True, None),
+])
+def test_parse_price(value, expected):
+    assert parse_price(value) == expected
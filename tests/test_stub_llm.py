@@ -0,0 +1,19 @@
+from devtools.stub_llm import StubChatModel
+
+
+def _stub(count: int) -> StubChatModel:
+    return StubChatModel({f"http://127.0.0.1:8000/products/{n}": {'name': f"Product {n}"} for n in range(1, count + 1)}, latency=0)
+
+
+def test_url_prefix_of_another_does_not_match():
+    stub = _stub(12)
+    assert stub._product_for("Current url: http://127.0.0.1:8000/products/11")['name'] == "Product 11"
+    assert stub._product_for("Current url: http://127.0.0.1:8000/products/1/reviews") is None
+    assert stub._product_for("Current url: http://127.0.0.1:8000/products/1.")['name'] == "Product 1"
+
+
+def test_last_mentioned_url_wins():
+    stub = _stub(12)
+    text = "Opened http://127.0.0.1:8000/products/1 then navigated to http://127.0.0.1:8000/products/12 now"
+    assert stub._product_for(text)['name'] == "Product 12"
+    assert stub._product_for("no product here") is None